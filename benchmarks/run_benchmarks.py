@@ -0,0 +1,315 @@
+"""Benchmarks for the priority queue, order validation and the Orders API
+
+Run the benchmarks and save the results:
+    python benchmarks/run_benchmarks.py --output results.json
+Compare the results of two commits:
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+
+Every size uses the orders of a seeded DatabaseSimulator, so runs are reproducible."""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'client'))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+
+from database_simulator import DatabaseSimulator
+from full_api import create_app
+from order import Order
+from order_batch import OrderBatch
+from order_manager import compare_orders
+from order_store import open_store
+from priority_queue import PriorityQueue
+from rate_limit import RateLimiter
+from typing import Final
+
+
+# DatabaseSimulator, Order, OrderBatch, PriorityQueue, RateLimiter: classes
+# create_app, compare_orders, open_store: functions
+
+SIZES: Final = (1000, 10000, 100000, 1000000)
+SEED: Final = 3500
+API_REQUESTS: Final = 200  # requests per endpoint
+API_KEY: Final = '12345'
+THRESHOLD: Final = 0.1  # relative change reported as a regression/improvement by --compare
+
+def timed(func, repeat) -> float:
+    """Time a function, keeping the best of several runs
+    Parameters:
+        func (function): the function, called without arguments
+        repeat (int): the number of runs
+    Returns:
+        float: the fastest run in seconds"""
+
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def throughput(name, size, seconds) -> dict:
+    """Build the result of a throughput benchmark
+    Parameters:
+        name (str): the benchmark name
+        size (int): the number of orders
+        seconds (float): the time taken
+    Returns:
+        dict: the result"""
+
+    return {'benchmark': name, 'size': size, 'seconds': seconds, 'ops_per_s': size / seconds if seconds > 0 else None}
+
+def bench_validation(data, repeat) -> list:
+    """Benchmark order validation, per Order object and per OrderBatch
+    Parameters:
+        data (list): the orders
+        repeat (int): the number of runs
+    Returns:
+        list: the results"""
+
+    def validate_orders():
+        for ord in data:
+            Order(ord['id'], ord['priority'], ord['date'], ord['quantity']).validate()
+
+    def validate_batch():
+        OrderBatch.from_records(data).validate()
+
+    return [
+        throughput('order_validate', len(data), timed(validate_orders, repeat)),
+        throughput('batch_validate', len(data), timed(validate_batch, repeat))
+    ]
+
+def bench_queue(data, repeat) -> list:
+    """Benchmark the priority queue and the comparator
+    Parameters:
+        data (list): the orders
+        repeat (int): the number of runs
+    Returns:
+        list: the results"""
+
+    batch = OrderBatch.from_records(data)
+    orders = list(batch.orders())
+    random.Random(SEED).shuffle(orders)
+
+    def enqueue():
+        pq = PriorityQueue()
+
+        for ord in orders:
+            pq.enqueue(ord)
+
+    def enqueue_many():
+        PriorityQueue().enqueue_many(orders)
+
+    def dequeue():
+        pq = PriorityQueue()
+        pq.enqueue_many(orders)
+        start = time.perf_counter()
+
+        while pq.dequeue()[0] == 1:
+            pass
+
+        return time.perf_counter() - start
+
+    def compare():
+        sorted(orders, key = functools.cmp_to_key(lambda ord_1, ord_2: -1 if compare_orders(ord_1, ord_2) == 1 else 1))
+
+    return [
+        throughput('queue_enqueue', len(orders), timed(enqueue, repeat)),
+        throughput('queue_enqueue_many', len(orders), timed(enqueue_many, repeat)),
+        throughput('queue_dequeue', len(orders), min(dequeue() for _ in range(repeat))),
+        throughput('compare_orders_sort', len(orders), timed(compare, repeat))
+    ]
+
+def latency(name, size, latencies) -> dict:
+    """Build the result of a latency benchmark
+    Parameters:
+        name (str): the benchmark name
+        size (int): the number of orders
+        latencies (list): the latency of every request in seconds
+    Returns:
+        dict: the result"""
+
+    latencies = sorted(latencies)
+
+    return {
+        'benchmark': name,
+        'size': size,
+        'requests': len(latencies),
+        'mean': sum(latencies) / len(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        'ops_per_s': len(latencies) / sum(latencies)
+    }
+
+def bench_api(size) -> list:
+    """Benchmark the API endpoints through the Flask test client
+    Parameters:
+        size (int): the number of orders
+    Returns:
+        list: the results"""
+
+    store = open_store('memory')
+    DatabaseSimulator(size, SEED).seed_store(store)
+
+    app = create_app(rate_limiter = RateLimiter(rate = 0))  # no rate limit
+    app.extensions['ds3500_store'] = store  # serve the benchmark orders instead of the 20 seeded ones
+    client = app.test_client()
+    rng = random.Random(SEED)
+
+    def measure(name, requests):
+        latencies = []
+
+        for path, headers in requests:
+            start = time.perf_counter()
+            res = client.get(path, headers = headers)
+            res.get_data()
+            latencies.append(time.perf_counter() - start)
+
+            if res.status_code not in (200, 204):
+                raise RuntimeError('{} responded with {}'.format(path, res.status_code))
+
+        return latency(name, size, latencies)
+
+    def pages(path):  # follow the cursor, so every page is a cache miss
+        requests, cursor = [], None
+
+        for _ in range(API_REQUESTS):
+            page_path = path + ('&cursor=' + cursor if cursor else '')
+            requests.append((page_path, {}))
+            cursor = client.get(page_path).get_json()['next_cursor']
+
+            if cursor is None:
+                break
+
+        app.extensions['ds3500_response_cache'].clear()
+
+        return requests
+
+    ids = [rng.randint(1, size) for _ in range(API_REQUESTS)]
+
+    return [
+        measure('api_orders_pages', pages('/ds3500/api/v1/orders?limit=500')),
+        measure('api_orders_cached', [('/ds3500/api/v1/orders?limit=500', {})] * API_REQUESTS),
+        measure('api_orders_gzip', [('/ds3500/api/v1/orders?limit=500', {'Accept-Encoding': 'gzip'})] * API_REQUESTS),
+        measure('api_orders_columnar', [('/ds3500/api/v1/orders?limit=500', {'Accept': OrderBatch.COLUMNAR_MIMETYPE})] * API_REQUESTS),
+        measure('api_order_by_id', [('/ds3500/api/v1/order?id={}'.format(o_id), {}) for o_id in ids]),
+        measure('api_orders_by_ids', [('/ds3500/api/v1/order?id=' + ','.join(str(o_id) for o_id in ids[i: i + 50]), {}) for i in range(0, len(ids), 10)]),
+        measure('api_orders_by_priority', pages('/ds3500/api/v1/orders/priority?priority=H&limit=500')),
+        measure('api_next_orders', [('/ds3500/api/v1/orders/next?n={}'.format(rng.randint(1, 500)), {}) for _ in range(API_REQUESTS)]),
+        measure('api_order_changes', [('/ds3500/api/v1/orders/changes?since={}&limit=500'.format(rng.randint(0, size)), {}) for _ in range(API_REQUESTS)]),
+        measure('api_v2_orders', [('/ds3500/api/v2/orders?limit=500', {'x-api-key': API_KEY})] * API_REQUESTS)
+    ]
+
+def git_commit() -> str:
+    """Get the current commit of the repository
+    Returns:
+        str: the commit hash (or None)"""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = ROOT, capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, repeat, skip_api = False) -> dict:
+    """Run every benchmark at every size
+    Parameters:
+        sizes (list): the numbers of orders
+        repeat (int): the number of runs of the throughput benchmarks
+        skip_api (bool): skip the API benchmarks (default: False)
+    Returns:
+        dict: the run info and the results"""
+
+    results = []
+
+    for size in sizes:
+        data = DatabaseSimulator(size, SEED).generate_orders()
+
+        for bench in (bench_validation, bench_queue):
+            for result in bench(data, repeat):
+                print('{benchmark:<26} {size:>9} {ops_per_s:>14,.0f} ops/s'.format(**result))
+                results.append(result)
+
+        if not skip_api:
+            for result in bench_api(size):
+                print('{benchmark:<26} {size:>9} {ops_per_s:>14,.0f} req/s  p50 {p50:.6f}s  p95 {p95:.6f}s'.format(**result))
+                results.append(result)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': SEED,
+        'repeat': repeat,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+
+def compare(before, after, threshold = THRESHOLD) -> int:
+    """Print the change in throughput of every benchmark between two runs
+    Parameters:
+        before (dict): the results of the first run
+        after (dict): the results of the second run
+        threshold (float): the relative change reported as a regression/improvement (default: 0.1)
+    Returns:
+        int: the number of regressions"""
+
+    baseline = {(result['benchmark'], result['size']): result for result in before['results']}
+    regressions = 0
+
+    print('{} -> {}'.format(before.get('commit'), after.get('commit')))
+
+    for result in after['results']:
+        old = baseline.get((result['benchmark'], result['size']))
+
+        if old is None or not old['ops_per_s'] or not result['ops_per_s']:
+            continue
+
+        change = result['ops_per_s'] / old['ops_per_s'] - 1
+
+        if change < -threshold:
+            verdict = 'SLOWER'
+            regressions += 1
+        elif change > threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+
+        print('{:<26} {:>9} {:>14,.0f} -> {:>14,.0f} ops/s {:>+8.1%} {}'.format(result['benchmark'], result['size'], old['ops_per_s'], result['ops_per_s'], change, verdict))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmarks for the DS3500 priority queue, order validation and Orders API')
+    parser.add_argument('--sizes', default = ','.join(str(size) for size in SIZES), help = 'comma separated numbers of orders')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs of every throughput benchmark, the fastest is kept')
+    parser.add_argument('--skip-api', action = 'store_true', help = 'skip the API benchmarks')
+    parser.add_argument('--output', help = 'JSON file to save the results to')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BEFORE', 'AFTER'), help = 'compare two JSON result files')
+    parser.add_argument('--threshold', type = float, default = THRESHOLD, help = 'relative change reported by --compare')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            regressions = compare(json.load(before), json.load(after), args.threshold)
+
+        sys.exit(1 if regressions > 0 else 0)
+
+    report = run([int(size) for size in args.sizes.split(',')], args.repeat, args.skip_api)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2)
+
+
+if __name__ == '__main__':
+    main()
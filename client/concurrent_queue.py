@@ -0,0 +1,311 @@
+"""Thread-safe priority queue with claim/ack semantics, for several workers draining one queue"""
+
+import heapq
+import threading
+import time
+
+from itertools import count
+from multiprocessing.managers import BaseManager
+from priority_queue import PriorityQueue
+
+
+class Claim():
+
+    __slots__ = ('claim_id', 'item', 'entry', 'deadline')
+
+    def __init__(self, claim_id, entry, deadline) -> None:
+        """Constructor to initialise the claim of a worker on a dequeued object
+        Parameters:
+            claim_id (int): the claim ID, used to ack the object
+            entry (tuple): the heap entry of the object, put back if the claim expires
+            deadline (float): the monotonic time the claim expires at
+        Returns:
+            None"""
+
+        self.claim_id = claim_id
+        self.item = entry[2]
+        self.entry = entry
+        self.deadline = deadline
+
+    def __reduce__(self) -> tuple:
+        """Pickle a claim as its ID and object only, for workers in other processes
+        Returns:
+            tuple: the reduced claim"""
+
+        return Claim, (self.claim_id, (None, None, self.item), self.deadline)
+
+class ConcurrentPriorityQueue(PriorityQueue):
+    def __init__(self, key = None, visibility_timeout = 30.0) -> None:
+        """Constructor to initialise a priority queue that several worker threads can drain at once
+        (Note: dequeue removes an object as in PriorityQueue. An object taken with claim is only
+        removed once the worker acks it. If the claim is not acked within the visibility timeout,
+        e.g. the worker died, the object is put back and claimed again, so every claimed object
+        is processed at least once)
+        Parameters:
+            key (function): a function that returns a precomputed sort key for an object, the
+            object with the smallest key is dequeued first (default: None i.e. the object itself)
+            visibility_timeout (float): seconds a worker has to ack a claim (default: 30.0)
+        Returns:
+            None"""
+
+        super().__init__(key)
+        self.visibility_timeout = visibility_timeout
+        self.not_empty = threading.Condition(threading.RLock())  # reentrant, the base class methods call size()
+        self.claims = {}  # claim ID -> Claim
+        self.deadlines = []  # heap of (deadline, claim ID)
+        self._claim_ids = count(1)
+
+    def _requeue_expired(self, now) -> None:
+        """Put back the objects of expired claims (the lock must be held)
+        Parameters:
+            now (float): the monotonic time
+        Returns:
+            None"""
+
+        while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+            _, claim_id = heapq.heappop(self.deadlines)
+            claim = self.claims.pop(claim_id, None)
+
+            if claim is not None:  # not acked in time
+                heapq.heappush(self.pq, claim.entry)
+
+    def _claim(self, now) -> Claim:
+        """Claim the first object (the lock must be held and the queue must not be empty)
+        Parameters:
+            now (float): the monotonic time
+        Returns:
+            Claim: the claim"""
+
+        claim = Claim(next(self._claim_ids), heapq.heappop(self.pq), now + self.visibility_timeout)
+        self.claims[claim.claim_id] = claim
+        heapq.heappush(self.deadlines, (claim.deadline, claim.claim_id))
+
+        return claim
+
+    def _wait(self, end) -> bool:
+        """Wait until the queue is not empty, putting back expired claims while waiting (the lock must be held)
+        Parameters:
+            end (float): the monotonic time to stop waiting at (None to wait forever)
+        Returns:
+            bool: whether the queue is not empty"""
+
+        while True:
+            now = time.monotonic()
+            self._requeue_expired(now)
+
+            if len(self.pq) > 0:
+                return True
+
+            wait = None if end is None else end - now
+
+            if len(self.deadlines) > 0:  # wake up when the next claim expires
+                wait = self.deadlines[0][0] - now if wait is None else min(wait, self.deadlines[0][0] - now)
+
+            if wait is not None and wait <= 0:
+                return False
+
+            self.not_empty.wait(wait)
+
+    def is_empty(self) -> bool:
+        """Checks if the queue is empty (claimed objects are not counted, expired claims are put back first)
+        Returns:
+            bool: whether the queue is empty or not"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            return len(self.pq) == 0
+
+    def size(self) -> int:
+        """Get the size of the queue (claimed objects are not counted, expired claims are put back first)
+        Returns:
+            int: the size of the queue"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            return len(self.pq)
+
+    def in_flight(self) -> int:
+        """Get the number of claimed objects that are not acked yet (expired claims are not counted)
+        Returns:
+            int: the number of claims"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            return len(self.claims)
+
+    def enqueue(self, item, compare = None) -> None:
+        """Adds an object to the queue in O(log n), waking up a waiting worker
+        Parameters:
+            item (object): the object to enqueue
+            compare (function): the comparator function to use for enqueuing (default: None i.e. use the sort key)
+        Returns:
+            None"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            super().enqueue(item, compare)
+            self.not_empty.notify()
+
+    def enqueue_many(self, items, compare = None) -> None:
+        """Adds several objects to the queue while holding the lock once, waking up the waiting workers
+        Parameters:
+            items (iterable): the objects to enqueue
+            compare (function): the comparator function to use for enqueuing (default: None i.e. use the sort key)
+        Returns:
+            None"""
+
+        items = list(items)  # consumed outside the lock
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            super().enqueue_many(items, compare)
+            self.not_empty.notify(len(items))
+
+    def dequeue(self, timeout = 0) -> tuple:
+        """Removes the first object from the queue in O(log n), as PriorityQueue.dequeue, optionally
+        waiting for one if the queue is empty (use claim to get an object that is put back if
+        the worker dies before it is processed)
+        Parameters:
+            timeout (float): the maximum number of seconds to wait (default: 0 i.e. do not wait, None to wait forever)
+        Returns:
+            tuple: a tuple with a status code (1 for success, 0 for error) and
+            an object (success) or error message (0)"""
+
+        with self.not_empty:
+            if not self._wait(None if timeout is None else time.monotonic() + timeout):
+                return 0, 'Underflow - PriorityQueue is empty'
+
+            return 1, heapq.heappop(self.pq)[2]
+
+    def claim(self, timeout = None) -> tuple:
+        """Claims the first object of the queue in O(log n), waiting for one if the queue is empty
+        Parameters:
+            timeout (float): the maximum number of seconds to wait (default: None i.e. wait forever)
+        Returns:
+            tuple: a tuple with a status code (1 for success, 0 for error) and
+            a Claim (success) or error message (0)"""
+
+        with self.not_empty:
+            if not self._wait(None if timeout is None else time.monotonic() + timeout):
+                return 0, 'Timeout - PriorityQueue is empty'
+
+            return 1, self._claim(time.monotonic())
+
+    def claim_many(self, k, timeout = None) -> list:
+        """Claims up to k objects of the queue while holding the lock once, waiting for at least one
+        if the queue is empty (batches keep the lock from being the bottleneck with many workers)
+        Parameters:
+            k (int): the maximum number of objects
+            timeout (float): the maximum number of seconds to wait (default: None i.e. wait forever)
+        Returns:
+            list: the claims, in priority order (empty on a timeout)"""
+
+        with self.not_empty:
+            if not self._wait(None if timeout is None else time.monotonic() + timeout):
+                return []
+
+            now = time.monotonic()
+
+            return [self._claim(now) for _ in range(min(k, len(self.pq)))]
+
+    def ack(self, claim_id) -> bool:
+        """Acknowledges that a claimed object was processed, removing it from the queue for good
+        Parameters:
+            claim_id (int): the claim ID
+        Returns:
+            bool: whether the claim was still held (False if it expired and the object was put back)"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            return self.claims.pop(claim_id, None) is not None  # its deadline is skipped when it is popped
+
+    def nack(self, claim_id) -> bool:
+        """Gives up a claim, putting the object back in the queue at once, e.g. after a failure
+        Parameters:
+            claim_id (int): the claim ID
+        Returns:
+            bool: whether the claim was still held"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            claim = self.claims.pop(claim_id, None)
+
+            if claim is None:
+                return False
+
+            heapq.heappush(self.pq, claim.entry)
+            self.not_empty.notify()
+
+            return True
+
+    def peek(self) -> tuple:
+        """Get the first object from the queue without claiming it
+        Returns:
+            tuple: a tuple with a status code (1 for success, 0 for error) and
+            an object (success) or error message (0)"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            return super().peek()
+
+    def items(self) -> list:
+        """Get the objects in the queue in priority order (claimed objects are not included)
+        Returns:
+            list: a list of objects"""
+
+        with self.not_empty:
+            self._requeue_expired(time.monotonic())
+            return super().items()
+
+    def clear(self) -> None:
+        """Clears the queue and the claims
+        Returns:
+            None"""
+
+        with self.not_empty:
+            self.pq = []
+            self.claims = {}
+            self.deadlines = []
+
+class QueueManager(BaseManager):
+    """Manager that shares a ConcurrentPriorityQueue with worker processes"""
+
+    pass
+
+QueueManager.register('get_queue')  # how workers get the proxy, serve_queue registers the queue on a subclass
+
+def serve_queue(pq, authkey, address = ('127.0.0.1', 50000)) -> threading.Thread:
+    """Share a queue with worker processes, which connect to it with connect_queue. The queue
+    stays in this process, so this process can keep using it directly, e.g. to enqueue orders
+    (Note: objects are pickled to and from the workers, and the queue's key function runs in this process.
+    Anyone who knows the authkey can run code in this process, so keep it secret, e.g. os.urandom(32))
+    Parameters:
+        pq (ConcurrentPriorityQueue): the queue
+        authkey (bytes): the secret key workers must know to connect
+        address (tuple): the (host, port) to listen on (default: ('127.0.0.1', 50000))
+    Returns:
+        threading.Thread: the daemon thread serving the workers, it stops with the process"""
+
+    class QueueServer(QueueManager):  # register() copies the registry to the subclass, so every served queue has its own
+        pass
+
+    QueueServer.register('get_queue', callable = lambda: pq)
+    server = QueueServer(address = address, authkey = authkey).get_server()
+
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    return thread
+
+def connect_queue(authkey, address = ('127.0.0.1', 50000)):
+    """Connect to a queue shared by serve_queue in another process
+    Parameters:
+        authkey (bytes): the secret key passed to serve_queue
+        address (tuple): the (host, port) of the manager (default: ('127.0.0.1', 50000))
+    Returns:
+        multiprocessing.managers.BaseProxy: a proxy with the methods of the queue"""
+
+    manager = QueueManager(address = address, authkey = authkey)
+    manager.connect()
+
+    return manager.get_queue()
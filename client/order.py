@@ -10,10 +10,53 @@ class Error(Exception):
 class PriorityError(Error):
     pass
 
+MICROSECONDS_PER_DAY: Final = 86400 * 10 ** 6
+DATE_KEY_BITS: Final = 59  # date keys up to the year 9999 fit in 59 bits
+MAX_QUANTITY: Final = 2 ** 16 - 1  # quantities fit in a uint16, as in OrderBatch
+MIN_ID: Final = -2 ** 63  # IDs fit in an int64, as in OrderBatch
+MAX_ID: Final = 2 ** 63 - 1
+
+def date_key(o_date) -> int:
+    """Get the sort key of an order date, keeping the time of day
+    Parameters:
+        o_date (datetime): the order date
+    Returns:
+        int: microseconds since the start of day 1 of the proleptic Gregorian calendar"""
+
+    time_of_day = ((o_date.hour * 60 + o_date.minute) * 60 + o_date.second) * 10 ** 6 + o_date.microsecond
+
+    return o_date.toordinal() * MICROSECONDS_PER_DAY + time_of_day
+
+def pack_rank(code, key, quantity, o_id) -> int:
+    """Pack the sort key of an order into one int, so comparing two orders compares two ints
+    (priority H > M > L, then old > new, then more > less, then smaller ID > bigger ID)
+    Parameters:
+        code (int): the priority code, see Order.PRIORITY_MAP
+        key (int): the date key, see date_key
+        quantity (int): the quantity, from 0 to MAX_QUANTITY
+        o_id (int): the ID, from MIN_ID to MAX_ID
+    Returns:
+        int: the sort key, the smallest key has the highest priority"""
+
+    return ((((3 - code) << DATE_KEY_BITS | key) << 16 | (MAX_QUANTITY - quantity)) << 64) | (o_id - MIN_ID)
+
+def is_int(value, low, high) -> bool:
+    """Checks if a value is an int (not a bool) within bounds
+    Parameters:
+        value (object): the value
+        low (int): the smallest valid value
+        high (int): the biggest valid value
+    Returns:
+        bool: whether the value is valid"""
+
+    return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+
 class Order():
 
     PRIORITY_MAP: Final = {'H': 3, 'M': 2, 'L': 1}
 
+    __slots__ = ('o_id', 'priority', 'o_date', 'quantity', 'rank')  # no per-order __dict__
+
     def __init__(self, o_id, priority, o_date, quantity) -> None:
         """Constructor to initialise an order object
         Parameters:
@@ -28,6 +71,7 @@ class Order():
         self.priority = priority
         self.o_date = o_date
         self.quantity = quantity
+        self.rank = None  # cached sort key, computed on first use (the fields are not changed once it is, except by set_date)
 
     def get_props(self) -> dict:
         """Get properties of an order
@@ -49,6 +93,80 @@ class Order():
             iso_date (datetime): order date as an ISO 8601 date type"""
 
         self.o_date = iso_date
+        self.rank = None  # computed again on the next comparison
+
+    def set_rank(self) -> int:
+        """Computes and caches the sort key of the order
+        Returns:
+            int: the sort key, see pack_rank
+        Raises:
+            PriorityError: the priority is not valid
+            ValueError: the date, the quantity or the ID is not valid"""
+
+        if self.priority not in self.PRIORITY_MAP:
+            raise PriorityError
+
+        if not is_int(self.quantity, 0, MAX_QUANTITY) or not is_int(self.o_id, MIN_ID, MAX_ID):
+            raise ValueError('Invalid quantity or ID in order {}'.format(self.o_id))
+
+        o_date = datetime.fromisoformat(self.o_date) if isinstance(self.o_date, str) else self.o_date
+
+        return self.cache_rank(pack_rank(self.PRIORITY_MAP[self.priority], date_key(o_date), self.quantity, self.o_id))
+
+    def cache_rank(self, rank) -> int:
+        """Caches a sort key computed from the fields of the order, e.g. by OrderBatch
+        Parameters:
+            rank (int): the sort key, see pack_rank
+        Returns:
+            int: the sort key"""
+
+        self.rank = rank
+        return rank
+
+    def get_rank(self) -> int:
+        """Get the sort key of the order, computing it if it is not cached
+        Returns:
+            int: the sort key, see pack_rank"""
+
+        rank = self.rank
+
+        return rank if rank is not None else self.set_rank()
+
+    def __lt__(self, other) -> bool:
+        """Checks if the order has a higher priority than another order
+        Parameters:
+            other (Order): the other order
+        Returns:
+            bool: whether this order goes first"""
+
+        return (self.rank or self.get_rank()) < (other.rank or other.get_rank())  # a rank is never 0, so only an order that is not ranked yet makes a call
+
+    def __le__(self, other) -> bool:
+        """Checks if the order has the same or a higher priority as another order
+        Parameters:
+            other (Order): the other order
+        Returns:
+            bool: the result of the comparison"""
+
+        return (self.rank or self.get_rank()) <= (other.rank or other.get_rank())
+
+    def __gt__(self, other) -> bool:
+        """Checks if the order has a lower priority than another order
+        Parameters:
+            other (Order): the other order
+        Returns:
+            bool: the result of the comparison"""
+
+        return (self.rank or self.get_rank()) > (other.rank or other.get_rank())
+
+    def __ge__(self, other) -> bool:
+        """Checks if the order has the same or a lower priority as another order
+        Parameters:
+            other (Order): the other order
+        Returns:
+            bool: the result of the comparison"""
+
+        return (self.rank or self.get_rank()) >= (other.rank or other.get_rank())
 
     def validate(self) -> bool:
         """Checks if the order properties are valid
@@ -69,4 +187,14 @@ class Order():
             print('ValueError (date) in order {}, did not add to PriorityQueue'.format(self.o_id))
             return False
 
+        if not is_int(self.quantity, 0, MAX_QUANTITY):  # e.g. '5' or None
+            print('ValueError (quantity) in order {}, did not add to PriorityQueue'.format(self.o_id))
+            return False
+
+        if not is_int(self.o_id, MIN_ID, MAX_ID):
+            print('ValueError (id) in order {}, did not add to PriorityQueue'.format(self.o_id))
+            return False
+
+        self.set_rank()
+
         return True
\ No newline at end of file
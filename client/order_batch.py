@@ -0,0 +1,258 @@
+"""Columnar batch of orders"""
+
+import json
+import numpy as np
+import struct
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+from order import date_key, is_int, MAX_ID, MICROSECONDS_PER_DAY, MIN_ID, Order, pack_rank
+from typing import Final
+
+
+@lru_cache(maxsize = 4096)  # shared by all pages, orders repeat the same few dates
+def parse_date(iso_date) -> int:
+    """Parse an ISO 8601 date str
+    Parameters:
+        iso_date (str): the date
+    Returns:
+        int: the date key of the date (see order.date_key, it keeps the time of day), 0 if the date is invalid"""
+
+    try:
+        return date_key(datetime.fromisoformat(iso_date))
+    except ValueError:
+        return 0
+
+@lru_cache(maxsize = 4096)
+def key_date(key) -> datetime:
+    """Get the date of a date key, the reverse of parse_date (datetimes are immutable, so orders can share them)
+    Parameters:
+        key (int): the date key
+    Returns:
+        datetime: the date"""
+
+    ordinal, time_of_day = divmod(key, MICROSECONDS_PER_DAY)
+
+    return datetime.fromordinal(ordinal) + timedelta(microseconds = time_of_day)
+
+class OrderBatch():
+
+    PRIORITY_CODES: Final = ('', 'L', 'M', 'H')  # code -> priority, codes match Order.PRIORITY_MAP and 0 is invalid
+    MAX_QUANTITY: Final = int(np.iinfo(np.uint16).max)
+    MAX_ORDINAL: Final = datetime.max.toordinal()
+
+    # columnar API response format, see server/columnar.py
+    COLUMNAR_MIMETYPE: Final = 'application/vnd.ds3500.columns'
+    COLUMNAR_MAGIC: Final = b'DSC1'
+    COLUMNAR_DTYPES: Final = {'id': ('<i8',), 'priority': ('|u1',), 'date': ('<i4',), 'quantity': ('<u2', '<i8')}  # the dtypes the server sends
+
+    # rejection flags
+    REJECT_PRIORITY: Final = 1
+    REJECT_DATE: Final = 2
+    REJECT_QUANTITY: Final = 4
+    REJECT_ID: Final = 8
+    REJECT_ERRORS: Final = {REJECT_PRIORITY: 'PriorityError', REJECT_DATE: 'ValueError (date)', REJECT_QUANTITY: 'ValueError (quantity)', REJECT_ID: 'ValueError (id)'}
+
+    def __init__(self, ids, priorities, dates, quantities, rejected = None, raw_ids = None) -> None:
+        """Constructor to initialise a batch of orders stored as columns
+        Parameters:
+            ids (numpy.ndarray): order IDs (int64)
+            priorities (numpy.ndarray): priority codes (uint8, 0 for an invalid priority)
+            dates (numpy.ndarray): order dates as date keys, see order.date_key (int64, 0 for an invalid date)
+            quantities (numpy.ndarray): order quantities (uint16)
+            rejected (numpy.ndarray): REJECT_* flags per order (uint8, default: None i.e. all orders are valid)
+            raw_ids (dict): the IDs that are not integers, position -> ID as received (default: None)
+        Returns:
+            None"""
+
+        self.ids = ids
+        self.priorities = priorities
+        self.dates = dates
+        self.quantities = quantities
+        self.rejected = np.zeros(len(ids), dtype = np.uint8) if rejected is None else rejected
+        self.raw_ids = raw_ids if raw_ids is not None else {}
+
+    @staticmethod
+    def _encode(values, lookup) -> np.ndarray:
+        """Encode a column of strings by looking up each distinct value only once
+        Parameters:
+            values (list): the column values
+            lookup (function): maps a distinct value to its code
+        Returns:
+            numpy.ndarray: the codes, in the same order as the values"""
+
+        try:
+            distinct = set(values)
+        except TypeError:  # an unhashable value, e.g. a JSON list
+            values = [v if isinstance(v, str) else None for v in values]
+            distinct = set(values)
+
+        codes = {v: lookup(v) if isinstance(v, str) else 0 for v in distinct}  # e.g. None is invalid, not 'None'
+
+        return np.fromiter(map(codes.__getitem__, values), dtype = np.int64, count = len(values))
+
+    @staticmethod
+    def _int_column(values) -> tuple:
+        """Convert a column to int64, values that are not integers (e.g. 1.9, True or '5') or
+        do not fit are set to 0, they are not converted like int() would
+        Parameters:
+            values (list): the column values
+        Returns:
+            tuple: a tuple with the int64 array at index 0 and a boolean array, True where
+            a value is not an integer, at index 1"""
+
+        n = len(values)
+
+        if all(type(v) is int for v in values):  # all values are integers, the common case (a bool is not an int here)
+            try:
+                return np.fromiter(values, dtype = np.int64, count = n), np.zeros(n, dtype = bool)
+            except OverflowError:
+                pass
+
+        bad = np.fromiter((not is_int(v, MIN_ID, MAX_ID) for v in values), dtype = bool, count = n)  # one row at a time, so a bad row only rejects itself
+
+        return np.fromiter((0 if is_bad else v for v, is_bad in zip(values, bad)), dtype = np.int64, count = n), bad
+
+    @classmethod
+    def from_records(cls, data) -> 'OrderBatch':
+        """Build a batch from a page of API orders, invalid orders are flagged rather than raised
+        (a row that is not a dictionary is flagged as invalid in every field)
+        Parameters:
+            data (list): a list of dictionaries of orders [{id, priority, date, quantity}]
+        Returns:
+            OrderBatch: the batch of orders"""
+
+        n = len(data)
+        data = [o if isinstance(o, dict) else {} for o in data]  # e.g. None or ['x']
+
+        ids, bad_ids = cls._int_column([o.get('id') for o in data])
+        priorities = cls._encode([o.get('priority') for o in data], lambda p: Order.PRIORITY_MAP.get(p, 0))
+        dates = cls._encode([o.get('date') for o in data], parse_date)
+        quantities, bad_quantities = cls._int_column([o.get('quantity') for o in data])
+
+        bad_quantities |= (quantities < 0) | (quantities > cls.MAX_QUANTITY)  # does not fit in a uint16
+
+        rejected = np.zeros(n, dtype = np.uint8)
+        rejected[priorities == 0] |= cls.REJECT_PRIORITY
+        rejected[dates == 0] |= cls.REJECT_DATE
+        rejected[bad_quantities] |= cls.REJECT_QUANTITY
+        rejected[bad_ids] |= cls.REJECT_ID
+
+        quantities[bad_quantities] = 0
+        raw_ids = {int(i): data[i].get('id') for i in np.flatnonzero(bad_ids)}
+
+        return cls(ids, priorities.astype(np.uint8), dates, quantities.astype(np.uint16), rejected, raw_ids)
+
+    @classmethod
+    def from_columns(cls, body) -> tuple:
+        """Build a batch straight from the columns of an API response in the columnar format,
+        without materialising an order dictionary, invalid orders are flagged rather than raised
+        Parameters:
+            body (bytes): the response body
+        Returns:
+            tuple: a tuple with the batch of orders at index 0 and the rest of the payload
+            (e.g. size, has_more, next_cursor) at index 1
+        Raises:
+            ValueError: the body is not in the columnar format"""
+
+        if len(body) < len(cls.COLUMNAR_MAGIC) + 4 or body[: len(cls.COLUMNAR_MAGIC)] != cls.COLUMNAR_MAGIC:
+            raise ValueError('Not a columnar response')
+
+        header_length, = struct.unpack_from('<I', body, len(cls.COLUMNAR_MAGIC))
+        offset = len(cls.COLUMNAR_MAGIC) + 4
+        meta = json.loads(body[offset: offset + header_length])
+        offset += header_length
+
+        if not isinstance(meta, dict) or not isinstance(meta.get('size'), int) or meta['size'] < 0 or not isinstance(meta.get('columns'), list):
+            raise ValueError('Invalid columnar header')
+
+        n = meta['size']
+        columns = {}
+
+        for name, dtype in meta.pop('columns'):
+            if not isinstance(name, str) or dtype not in cls.COLUMNAR_DTYPES.get(name, ()):  # only the expected dtypes, never an arbitrary one from the network
+                raise ValueError('Invalid columnar column: {} {}'.format(name, dtype))
+
+            dtype = np.dtype(dtype)
+            columns[name] = np.frombuffer(body, dtype = dtype, count = n, offset = offset)  # no copy, raises if the body is too short
+            offset += n * dtype.itemsize
+
+        if set(columns) != set(cls.COLUMNAR_DTYPES):
+            raise ValueError('Missing columnar columns')
+
+        priorities = columns['priority'].astype(np.uint8)
+        priorities[priorities >= len(cls.PRIORITY_CODES)] = 0
+        dates = columns['date'].astype(np.int64)  # day ordinals, the API's dates have no time of day
+        quantities = columns['quantity'].astype(np.int64)
+
+        bad_quantities = (quantities < 0) | (quantities > cls.MAX_QUANTITY)  # sent as int64 when they do not fit in a uint16
+
+        rejected = np.zeros(n, dtype = np.uint8)
+        rejected[priorities == 0] |= cls.REJECT_PRIORITY
+        bad_dates = (dates <= 0) | (dates > cls.MAX_ORDINAL)
+
+        rejected[bad_dates] |= cls.REJECT_DATE
+        rejected[bad_quantities] |= cls.REJECT_QUANTITY
+
+        dates[bad_dates] = 0
+        dates *= MICROSECONDS_PER_DAY  # the date key of midnight
+        quantities[bad_quantities] = 0
+
+        return cls(columns['id'].astype(np.int64), priorities, dates, quantities.astype(np.uint16), rejected), meta
+
+    def __len__(self) -> int:
+        """Get the number of orders in the batch
+        Returns:
+            int: the number of orders"""
+
+        return len(self.ids)
+
+    def valid_mask(self) -> np.ndarray:
+        """Get a mask of the valid orders in the batch
+        Returns:
+            numpy.ndarray: a boolean array, True where the order is valid"""
+
+        return self.rejected == 0
+
+    def validate(self) -> tuple:
+        """Checks which orders of the batch are valid
+        Returns:
+            tuple: a tuple with a boolean array (True where the order is valid) at index 0 and
+            a list of rejections [{id: int, errors: [str]}] at index 1"""
+
+        valid = self.valid_mask()
+        rejections = []
+
+        for i in np.flatnonzero(~valid):
+            flags = int(self.rejected[i])
+            errors = [error for flag, error in self.REJECT_ERRORS.items() if flags & flag]
+
+            rejections.append({'id': self.raw_ids.get(int(i), int(self.ids[i])), 'errors': errors})
+
+        return valid, rejections
+
+    def __getitem__(self, i) -> Order:
+        """Materialise one order of the batch as a validated Order object
+        Parameters:
+            i (int): the position of the order in the batch
+        Returns:
+            Order: the order"""
+
+        code, key, quantity, o_id = int(self.priorities[i]), int(self.dates[i]), int(self.quantities[i]), int(self.ids[i])
+
+        order_obj = Order(o_id, self.PRIORITY_CODES[code], key_date(key), quantity)
+        order_obj.cache_rank(pack_rank(code, key, quantity, o_id))  # the same sort key as Order.set_rank
+
+        return order_obj
+
+    def orders(self, mask = None):
+        """Lazily materialise the orders of the batch
+        Parameters:
+            mask (numpy.ndarray): a boolean array of orders to materialise (default: None i.e. all orders)
+        Returns:
+            generator: a generator of Order objects"""
+
+        positions = range(len(self)) if mask is None else np.flatnonzero(mask)
+
+        for i in positions:
+            yield self[i]
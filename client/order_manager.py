@@ -1,51 +1,53 @@
 """Order manager that runs the priority queue"""
 
 import json
+import logging
 import os
 import requests
+import time
 
 from dotenv import load_dotenv
 from order import Order
+from order_batch import OrderBatch
+from orders_client import OrdersClient, error_message
 from priority_queue import PriorityQueue
+from profiling import open_profiler
 # from pprint import pprint
 from typing import Final
 
 
 load_dotenv()
 
+profiler = open_profiler(os.getenv('DS3500_PROFILE'))  # off unless DS3500_PROFILE is set, see profiling.open_profiler
+client = None  # default client, created on first use by get_client
+
+def get_client() -> OrdersClient:
+    """Get the default client, which shares a pool of connections across calls
+    (Note: created on first use, so importing this module does not open a session)
+    Returns:
+        OrdersClient: the default client"""
+
+    global client
+
+    if client is None:
+        client = OrdersClient(profiler = profiler)
+
+    return client
+
 def compare_orders(ord_1: Order, ord_2: Order) -> int:
     """Compare two Order objects and return the one with higher priority
+    (Note: kept for compatibility, orders are ranked by their cached sort key
+    i.e. priority H > M > L, then old > new, then more > less, then smaller ID > bigger ID)
     Parameters:
         ord_1 (Order): order object 1
         ord_2 (Order): order object 2
     Returns:
         int: 1 if ord_1 has higher priority, else 2"""
 
-    ord_1_props, ord_2_props = ord_1.get_props(), ord_2.get_props()
-
-    # check priority: H > M > L
-    if Order.PRIORITY_MAP[ord_1_props['priority']] > Order.PRIORITY_MAP[ord_2_props['priority']]:
-        return 1
-    elif Order.PRIORITY_MAP[ord_1_props['priority']] < Order.PRIORITY_MAP[ord_2_props['priority']]:
-        return 2
-    else:  # check date: old > new
-        if ord_1_props['o_date'] < ord_2_props['o_date']:
-            return 1
-        elif ord_1_props['o_date'] > ord_2_props['o_date']:
-            return 2
-        else:  # check quantity: more > less
-            if ord_1_props['quantity'] > ord_2_props['quantity']:
-                return 1
-            elif ord_1_props['quantity'] < ord_2_props['quantity']:
-                return 2
-            else:  # check id: smaller > bigger
-                if ord_1_props['o_id'] < ord_2_props['o_id']:
-                    return 1
-                else:
-                    return 2
+    return 1 if ord_1.get_rank() < ord_2.get_rank() else 2
 
 def get_data(url, headers = {}, params = {}, payload = {}) -> tuple:
-    """Call an API and GET data
+    """Call an API and GET data, reusing the pooled connections of the default client
     Parameters:
         url (str): the API URL
         headers (dict): the headers for the API (default: {})
@@ -55,53 +57,174 @@ def get_data(url, headers = {}, params = {}, payload = {}) -> tuple:
         tuple: a tuple with True/False at index 0 (success/failure) and
         the data or None at index 1"""
 
-    try:
-        res = requests.get(url, headers = headers, data = payload, params = params)
+    return get_client().get(url, headers = headers, params = params, payload = payload)
 
-        print('Status: {}\nTime taken: {}s\nURL: {}'.format(res.status_code, res.elapsed, res.url))
+def iter_pages(url, headers = {}, params = {}):
+    """Call a paginated API and GET every page by following the next_cursor of each page
+    Parameters:
+        url (str): the API URL
+        headers (dict): the headers for the API (default: {})
+        params (dict): the parameters for the API, e.g. limit (default: {})
+    Returns:
+        generator: a generator of lists of orders, one list per page"""
 
-        res.raise_for_status()
+    return get_client().iter_pages(url, headers = headers, params = params)
 
-        # pprint(res.json())
+def stream_orders(url, headers = {}, params = {}):
+    """Call an NDJSON export API and GET the orders as they arrive
+    Parameters:
+        url (str): the API URL
+        headers (dict): the headers for the API (default: {})
+        params (dict): the parameters for the API, e.g. priority (default: {})
+    Returns:
+        generator: a generator of orders"""
 
-        return True, res.json()
+    try:
+        res = get_client().session.get(url, headers = headers, params = params, stream = True)
 
     except requests.exceptions.ConnectionError:
         print('Connection Error')
-        return False, None
+        return
+
+    with res:  # release the connection once the stream is consumed
+        if not res.ok:  # some 4xx or 5xx error
+            print(error_message(res))
+            return
+
+        for line in res.iter_lines():
+            if line:
+                with profiler.stage('decode'):
+                    ord = json.loads(line)
+
+                yield ord
+
+def stream_to_queue(url, pq: PriorityQueue, headers = {}, params = {}, chunk_size = 10000, rejections = None) -> PriorityQueue:
+    """Stream orders from an NDJSON export API into the priority queue, one chunk at a time
+    Parameters:
+        url (str): the API URL
+        pq (PriorityQueue): the priority queue instance
+        headers (dict): the headers for the API (default: {})
+        params (dict): the parameters for the API, e.g. priority (default: {})
+        chunk_size (int): the number of orders validated and enqueued together (default: 10000)
+        rejections (list): a list to extend with the rejected orders [{id: int, errors: [str]}] (default: None)
+    Returns:
+        PriorityQueue: the priority queue instance"""
+
+    chunk = []
 
-    except requests.exceptions.HTTPError:  # some 4xx or 5xx error:
-        print(res.json()['message'])
-        return False, None
+    for ord in stream_orders(url, headers = headers, params = params):
+        chunk.append(ord)
 
-    except json.decoder.JSONDecodeError:  # 204 status code:
-        print('Blank response - 204')
-        return False, None
+        if len(chunk) == chunk_size:
+            pq = add_to_queue(chunk, pq, rejections)
+            chunk = []
 
-def add_to_queue(data, pq: PriorityQueue) -> PriorityQueue:
+    return add_to_queue(chunk, pq, rejections)
+
+def add_to_queue(data, pq: PriorityQueue, rejections = None) -> PriorityQueue:
     """Add orders to the priority queue
     Parameters:
-        data (dict): a dictionary of orders to add
+        data (list): a list of dictionaries of orders to add
+        pq (PriorityQueue): the priority queue instance
+        rejections (list): a list to extend with the rejected orders [{id: int, errors: [str]}] (default: None)
+    Returns:
+        PriorityQueue: the priority queue instance"""
+
+    with profiler.stage('validate'):
+        batch = OrderBatch.from_records(data)  # columnar page, validated in one pass
+
+    return add_batch_to_queue(batch, pq, rejections)
+
+def add_batch_to_queue(batch: OrderBatch, pq: PriorityQueue, rejections = None) -> PriorityQueue:
+    """Add a batch of orders to the priority queue
+    Parameters:
+        batch (OrderBatch): the orders to add
         pq (PriorityQueue): the priority queue instance
+        rejections (list): a list to extend with the rejected orders [{id: int, errors: [str]}] (default: None)
     Returns:
         PriorityQueue: the priority queue instance"""
 
-    for ord in data:
-        order_obj = Order(ord['id'], ord['priority'], ord['date'], ord['quantity'])
+    with profiler.stage('validate'):
+        valid, rejected = batch.validate()
+
+    profiler.count('orders', len(batch))
+    profiler.count('rejected', len(rejected))
 
-        if order_obj.validate():
-            pq.enqueue(order_obj, compare_orders)
+    if rejections is not None:
+        rejections.extend(rejected)
+
+    with profiler.stage('enqueue'):
+        pq.enqueue_many(batch.orders(valid))  # bulk heap construction, O(n)
 
     return pq
 
-def main(api_key) -> None:
+class OrderSync():
+    def __init__(self, url, pq: PriorityQueue, headers = {}, limit = 500, columnar = True) -> None:
+        """Constructor to initialise an incremental sync of the server's orders into a priority queue
+        Parameters:
+            url (str): the changes API URL
+            pq (PriorityQueue): the priority queue instance
+            headers (dict): the headers for the API (default: {})
+            limit (int): the number of orders per request (default: 500)
+            columnar (bool): ask for the columnar format, which is smaller and faster to decode than JSON (default: True)
+        Returns:
+            None"""
+
+        self.url = url
+        self.pq = pq
+        self.headers = headers
+        self.limit = limit
+        self.columnar = columnar
+        self.seq = 0  # last change sequence seen
+        self.rejections = []
+
+    def sync(self) -> int:
+        """Get the orders added since the last sync and merge them into the queue
+        Returns:
+            int: the number of orders received"""
+
+        received = 0
+
+        while True:
+            params = {'since': self.seq, 'limit': self.limit}
+
+            if self.columnar:
+                reply = get_client().get_batch(self.url, headers = self.headers, params = params)
+            else:
+                reply = get_data(self.url, headers = self.headers, params = params)
+
+            if not reply[0]:
+                return received
+
+            if self.columnar:
+                batch, meta = reply[1]
+                add_batch_to_queue(batch, self.pq, self.rejections)
+            else:
+                meta = reply[1]
+                add_to_queue(meta['data'], self.pq, self.rejections)
+
+            received += meta['size']
+            self.seq = meta['seq']
+
+            if not meta['has_more']:
+                return received
+
+def main(api_key, sync_interval = None) -> None:
     """Main function
     Parameters:
         api_key (str): the API key to use
+        sync_interval (float): poll the server for new orders every sync_interval seconds (default: None i.e. run once)
     Returns:
         None"""
 
-    reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/orders')  # 200
+    profiler.start()
+
+    pq = PriorityQueue(key = profiler.comparison_key(Order.get_rank))  # counts the rank comparisons when profiling
+    order_sync = OrderSync('http://127.0.0.1:5000/ds3500/api/v1/orders/changes', pq)  # 200 per page
+
+    order_sync.sync()  # the first sync gets every order
+
+    # pages = iter_pages('http://127.0.0.1:5000/ds3500/api/v1/orders')  # 200 per page
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/order', params = {'id': 2})  # 200
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/order', params = {'id': 22})  # 204
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/order', params = {'id': 'abc'})  # 400
@@ -109,18 +232,29 @@ def main(api_key) -> None:
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/orders/priority', params = {'priority': 'M'})  # 200
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/orders/priority', params = {'priority': 'X'})  # 400
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/orders/quantity', params = {'quantity': 42})  # 404
+    # reply = get_data('http://127.0.0.1:5000/ds3500/api/v1/orders/next', params = {'n': 10})  # 200, ranked by the server like the queue
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v2/orders', headers = {'x-api-key': api_key})  # 200
     # reply = get_data('http://127.0.0.1:5000/ds3500/api/v2/orders')  # 401
+    # pq = stream_to_queue('http://127.0.0.1:5000/ds3500/api/v1/orders/export', PriorityQueue(key = Order.get_rank))  # 200
 
-    pq = PriorityQueue()
-
-    if reply[0]:
-        pq = add_to_queue(reply[1]['data'], pq) 
+    for rejection in order_sync.rejections:
+        print('{} in order {}, did not add to PriorityQueue'.format(', '.join(rejection['errors']), rejection['id']))
 
     print('\nPriority queue:', pq.__str__())  # string representation of the queue after all original orders are processed
-    print('Length:', pq.size())        
+    print('Length:', pq.size())
+    print('Requests:', get_client().stats())
+
+    profiler.stop()
+    profiler.print_report()
+
+    while sync_interval is not None:  # later syncs only get the orders added since the previous sync
+        time.sleep(sync_interval)
+        print('New orders: {}, length: {}'.format(order_sync.sync(), pq.size()))
 
 if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO, format = '%(message)s')  # show the client's messages
+
     DS3500_KEY: Final = os.getenv('DS3500_KEY')
+    DS3500_SYNC_INTERVAL: Final = os.getenv('DS3500_SYNC_INTERVAL')  # seconds, unset to run once
 
-    main(DS3500_KEY)
\ No newline at end of file
+    main(DS3500_KEY, float(DS3500_SYNC_INTERVAL) if DS3500_SYNC_INTERVAL else None)
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""Pooled, concurrent client for the DS3500 Orders API"""
+
+import json
+import logging
+import threading
+import requests
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from order_batch import OrderBatch
+from profiling import NullProfiler
+from requests.adapters import HTTPAdapter
+from typing import Final
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger(__name__)
+
+def error_message(res) -> str:
+    """Get the message of an error response, which may not be JSON, e.g. from a proxy
+    Parameters:
+        res (requests.Response): the response
+    Returns:
+        str: the API's message, or the status code and reason"""
+
+    try:
+        return str(res.json()['message'])
+    except (ValueError, KeyError, TypeError):  # not JSON, or JSON without a message
+        return '{} {}'.format(res.status_code, res.reason)
+
+class OrdersClient():
+
+    MAX_LATENCIES: Final = 10000  # latency samples kept for the stats
+
+    def __init__(self, base_url = 'http://127.0.0.1:5000', headers = {}, max_workers = 8, retries = 3, backoff = 0.2, timeout = 10, profiler = None) -> None:
+        """Constructor to initialise a client with a pool of reusable connections
+        Parameters:
+            base_url (str): the URL that paths are relative to (default: 'http://127.0.0.1:5000')
+            headers (dict): headers sent with every request, e.g. the API key (default: {})
+            max_workers (int): the maximum number of concurrent requests and pooled connections (default: 8)
+            retries (int): the number of retries on connection errors (default: 3)
+            backoff (float): the backoff factor between retries in seconds, doubled on every retry (default: 0.2)
+            timeout (float): the timeout of a request in seconds (default: 10)
+            profiler (NullProfiler): times the fetch and decode stages of every request (default: None i.e. off)
+        Returns:
+            None"""
+
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.profiler = profiler if profiler is not None else NullProfiler()
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+
+        retry = Retry(total = retries, connect = retries, read = 0, status = 0, backoff_factor = backoff)
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = max_workers, max_retries = retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen = self.MAX_LATENCIES)  # seconds
+        self.status_counts = {}  # status code (or 'error') -> count
+
+    def url(self, path) -> str:
+        """Get the full URL of a path
+        Parameters:
+            path (str): a path relative to the base URL, or a full URL
+        Returns:
+            str: the full URL"""
+
+        return self.base_url + path if path.startswith('/') else path
+
+    def _record(self, status, elapsed = None) -> None:
+        """Record the result of a request for the stats
+        Parameters:
+            status (int or str): the status code, or 'error'
+            elapsed (float): the latency in seconds (default: None)
+        Returns:
+            None"""
+
+        with self.lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+            if elapsed is not None:
+                self.latencies.append(elapsed)
+
+    def get(self, path, headers = {}, params = {}, payload = {}) -> tuple:
+        """Call an API and GET data
+        Parameters:
+            path (str): the API path (or full URL)
+            headers (dict): the headers for the API (default: {})
+            params (dict): the parameters for the API (default: {})
+            payload (dict): the payload for the API (default: {})
+        Returns:
+            tuple: a tuple with True/False at index 0 (success/failure) and
+            the data or None at index 1"""
+
+        try:
+            with self.profiler.stage('fetch'):
+                res = self.session.get(self.url(path), headers = headers, data = payload, params = params, timeout = self.timeout)
+
+            self._record(res.status_code, res.elapsed.total_seconds())
+
+            res.raise_for_status()
+
+            with self.profiler.stage('decode'):
+                return True, res.json()
+
+        except requests.exceptions.ConnectionError:
+            self._record('error')
+            logger.warning('Connection Error')
+            return False, None
+
+        except requests.exceptions.HTTPError:  # some 4xx or 5xx error:
+            logger.warning(error_message(res))
+            return False, None
+
+        except json.decoder.JSONDecodeError:  # 204 status code:
+            logger.info('Blank response - 204')
+            return False, None
+
+    def get_batch(self, path, headers = {}, params = {}) -> tuple:
+        """Call an orders API and GET the orders as an OrderBatch, asking for the columnar
+        format (decoded without building order dictionaries) and falling back to JSON
+        Parameters:
+            path (str): the API path (or full URL)
+            headers (dict): the headers for the API (default: {})
+            params (dict): the parameters for the API (default: {})
+        Returns:
+            tuple: a tuple with True/False at index 0 (success/failure) and a tuple with
+            the OrderBatch and the rest of the payload (e.g. has_more) or None at index 1"""
+
+        headers = dict(headers, Accept = '{}, application/json;q=0.5'.format(OrderBatch.COLUMNAR_MIMETYPE))
+
+        try:
+            with self.profiler.stage('fetch'):
+                res = self.session.get(self.url(path), headers = headers, params = params, timeout = self.timeout)
+
+            self._record(res.status_code, res.elapsed.total_seconds())
+
+            res.raise_for_status()
+
+            with self.profiler.stage('decode'):
+                if res.headers.get('Content-Type', '').startswith(OrderBatch.COLUMNAR_MIMETYPE):
+                    return True, OrderBatch.from_columns(res.content)
+
+                payload = res.json()
+
+                return True, (OrderBatch.from_records(payload.pop('data')), payload)
+
+        except requests.exceptions.ConnectionError:
+            self._record('error')
+            logger.warning('Connection Error')
+            return False, None
+
+        except requests.exceptions.HTTPError:  # some 4xx or 5xx error:
+            logger.warning(error_message(res))
+            return False, None
+
+        except json.decoder.JSONDecodeError:  # 204 status code:
+            logger.info('Blank response - 204')
+            return False, None
+
+        except ValueError as e:  # a corrupt columnar body
+            logger.warning(e)
+            return False, None
+
+    def get_many(self, calls) -> list:
+        """Make several GET calls concurrently, at most max_workers at a time
+        Parameters:
+            calls (list): a list of (path, params) tuples
+        Returns:
+            list: the (success, data) tuple of every call, in the same order as the calls"""
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            return list(executor.map(lambda call: self.get(call[0], params = call[1]), calls))
+
+    def get_orders_by_ids(self, ids, batch_size = 500) -> list:
+        """Get orders using their IDs, with concurrent batch lookups
+        Parameters:
+            ids (list): the order IDs
+            batch_size (int): the number of IDs per request (default: 500)
+        Returns:
+            list: the orders found"""
+
+        batches = [ids[i: i + batch_size] for i in range(0, len(ids), batch_size)]
+        calls = [('/ds3500/api/v1/order', {'id': ','.join(str(o_id) for o_id in batch)}) for batch in batches]
+
+        orders = []
+
+        for success, reply in self.get_many(calls):
+            if success:
+                orders.extend(reply['data'])
+
+        return orders
+
+    def iter_pages(self, path, headers = {}, params = {}):
+        """Call a paginated API and GET every page by following the next_cursor of each page
+        Parameters:
+            path (str): the API path (or full URL)
+            headers (dict): the headers for the API (default: {})
+            params (dict): the parameters for the API, e.g. limit (default: {})
+        Returns:
+            generator: a generator of lists of orders, one list per page"""
+
+        params = dict(params)
+
+        while True:
+            reply = self.get(path, headers = headers, params = params)
+
+            if not reply[0]:
+                return
+
+            yield reply[1]['data']
+
+            if not reply[1].get('has_more', False):
+                return
+
+            params['cursor'] = reply[1]['next_cursor']
+
+    def get_all_pages(self, path, partitions) -> list:
+        """Get every page of several partitions of a paginated API concurrently, e.g. one
+        partition per priority (pages of one partition are fetched in order, following the cursor)
+        Parameters:
+            path (str): the API path (or full URL)
+            partitions (list): the parameters of every partition, e.g. [{'priority': 'H'}, {'priority': 'M'}]
+        Returns:
+            list: the orders of all partitions"""
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            partition_pages = executor.map(lambda params: list(self.iter_pages(path, params = params)), partitions)
+
+            return [ord for pages in partition_pages for page in pages for ord in page]
+
+    def stats(self) -> dict:
+        """Get the latency stats of the requests made so far
+        Returns:
+            dict: the number of requests, the count per status code and the mean, p50, p95 and max latencies in seconds"""
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            status_counts = dict(self.status_counts)
+
+        if len(latencies) == 0:
+            return {'requests': sum(status_counts.values()), 'status': status_counts}
+
+        return {
+            'requests': sum(status_counts.values()),
+            'status': status_counts,
+            'mean': sum(latencies) / len(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max': latencies[-1]
+        }
+
+    def close(self) -> None:
+        """Closes the pooled connections
+        Returns:
+            None"""
+
+        self.session.close()
+
+    def __enter__(self) -> 'OrdersClient':
+        """Use the client as a context manager
+        Returns:
+            OrdersClient: the client"""
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Closes the client at the end of a with block
+        Returns:
+            None"""
+
+        self.close()
@@ -1,84 +1,181 @@
 """Generic priority queue class"""
 
+import heapq
+
+from itertools import count
+
+
+class _ComparatorKey():
+    """Heap key that orders items with a two-argument comparator"""
+
+    __slots__ = ('item', 'seq', 'compare')
+
+    def __init__(self, item, seq, compare) -> None:
+        """Constructor to initialise a comparator key
+        Parameters:
+            item (object): the object being ranked
+            seq (int): the insertion sequence number (used for FIFO tie-breaking)
+            compare (function): the comparator function, returns 1 if the first argument goes first
+        Returns:
+            None"""
+
+        self.item = item
+        self.seq = seq
+        self.compare = compare
+
+    def __lt__(self, other) -> bool:
+        """Checks if this key goes before another key
+        Parameters:
+            other (_ComparatorKey): the other key
+        Returns:
+            bool: whether this key goes first"""
+
+        if self.compare(self.item, other.item) == 1:
+            return True
+        elif self.compare(other.item, self.item) == 1:
+            return False
+        else:  # tie: first in, first out
+            return self.seq < other.seq
+
+class _ItemKey():
+    """Heap key that orders objects with their own < operator"""
+
+    __slots__ = ('item', 'seq')
+
+    def __init__(self, item, seq) -> None:
+        """Constructor to initialise an object key
+        Parameters:
+            item (object): the object being ranked
+            seq (int): the insertion sequence number (used for FIFO tie-breaking)
+        Returns:
+            None"""
+
+        self.item = item
+        self.seq = seq
+
+    def __lt__(self, other) -> bool:
+        """Checks if this key goes before another key (Note: a tuple of the objects would
+        only reach the sequence number for objects that are ==, not for every tie)
+        Parameters:
+            other (_ItemKey): the other key
+        Returns:
+            bool: whether this key goes first"""
+
+        if self.item < other.item:
+            return True
+        elif other.item < self.item:
+            return False
+        else:  # tie: first in, first out
+            return self.seq < other.seq
+
 class PriorityQueue():
-    def __init__(self) -> None:
-        """Constructor to initialise a blank list that serves as the base of the priority queue
+    def __init__(self, key = None) -> None:
+        """Constructor to initialise a blank binary heap that serves as the base of the priority queue
+        Parameters:
+            key (function): a function that returns a precomputed sort key for an object, the
+            object with the smallest key is dequeued first (default: None i.e. the object itself,
+            compared with its < operator, which is slower than a key)
         Returns:
             None"""
 
-        self.pq = []
+        self.pq = []  # heap of (key, sequence number, object) tuples
+        self.key = key
+        self._counter = count()
+
+    def _make_entry(self, item, compare) -> tuple:
+        """Build a heap entry for an object
+        Parameters:
+            item (object): the object to wrap
+            compare (function): the comparator function, or None to use the sort key
+        Returns:
+            tuple: a (key, sequence number, object) tuple"""
+
+        seq = next(self._counter)
+
+        if compare is not None:
+            return _ComparatorKey(item, seq, compare), seq, item
+        elif self.key is not None:
+            return self.key(item), seq, item
+        else:
+            return _ItemKey(item, seq), seq, item
 
     def is_empty(self) -> bool:
-        """Checks if the list is empty
+        """Checks if the queue is empty
         Returns:
-            bool: whether the list is empty or not"""
+            bool: whether the queue is empty or not"""
 
         return len(self.pq) == 0
 
     def size(self) -> int:
-        """Get the size of the list
+        """Get the size of the queue
         Returns:
-            int: the size of the list"""
+            int: the size of the queue"""
 
         return len(self.pq)
 
-    def enqueue(self, item, compare) -> None:
-        """Adds an object to the list using the comparator for position
+    def enqueue(self, item, compare = None) -> None:
+        """Adds an object to the queue in O(log n)
+        (Note: use either a comparator or the sort key for all objects in a queue, not a mix)
         Parameters:
             item (object): the object to enqueue
-            comapre (function): the comparator function to use for enqueuing
+            compare (function): the comparator function to use for enqueuing (default: None i.e. use the sort key)
         Returns:
             None"""
 
-        inserted = False
+        heapq.heappush(self.pq, self._make_entry(item, compare))
 
-        if self.is_empty():
-            self.pq.append(item)
-        else:
-            for i in range(self.size()):
-                if compare(item, self.pq[i]) == 1:
-                    self.pq.insert(i, item)
-                    inserted = True
-                    break
+    def enqueue_many(self, items, compare = None) -> None:
+        """Adds several objects to the queue, using bulk heap construction (O(n + k)) unless
+        pushing the objects one by one (O(k log n)) is cheaper
+        Parameters:
+            items (iterable): the objects to enqueue
+            compare (function): the comparator function to use for enqueuing (default: None i.e. use the sort key)
+        Returns:
+            None"""
+
+        entries = [self._make_entry(item, compare) for item in items]
 
-            if not inserted:
-                self.pq.append(item)
+        if len(entries) * max(1, self.size().bit_length()) >= self.size():
+            self.pq.extend(entries)
+            heapq.heapify(self.pq)
+        else:  # a small batch on a large queue
+            for entry in entries:
+                heapq.heappush(self.pq, entry)
 
     def dequeue(self) -> tuple:
-        """Removes the first object from the queue
+        """Removes the first object from the queue in O(log n)
         Returns:
-            tuple: a tuple with a status code (1 for success, 0 for error) and 
+            tuple: a tuple with a status code (1 for success, 0 for error) and
             an object (success) or error message (0)"""
 
         if not self.is_empty():
-            item = self.pq.pop(0)
+            item = heapq.heappop(self.pq)[2]
             return 1, item
         else:
             return 0, 'Underflow - PriorityQueue is empty'
 
+    def items(self) -> list:
+        """Get the objects in the queue in priority order
+        Returns:
+            list: a list of objects"""
+
+        return [entry[2] for entry in sorted(self.pq)]
+
     def get_id_list(self) -> list:
         """Get the list of object IDs in the queue
         Returns:
             list: a list of object IDs"""
 
-        if not self.is_empty():
-            id_list = []
-
-            for o in self.pq:
-                id_list.append(o.props()['o_id'])
-
-            return id_list
-        else:
-            return []
+        return [o.get_props()['o_id'] for o in self.items()]
 
     def peek(self) -> tuple:
-        """Get the first object from the list without dequeuing it
+        """Get the first object from the queue without dequeuing it
         Returns:
-            tuple: a tuple with a status code (1 for success, 0 for error) and 
+            tuple: a tuple with a status code (1 for success, 0 for error) and
             an object (success) or error message (0)"""
 
         try:
-            return 1, self.pq[0].props()
+            return 1, self.pq[0][2].get_props()
         except IndexError:
             return 0, 'Underflow - PriorityQueue is empty'
 
@@ -95,13 +192,6 @@ class PriorityQueue():
             str: the string representation of the queue"""
 
         if not self.is_empty():
-            s = 'PriorityQueue['
-
-            for item in self.pq:
-                s += item.__str__() + ', '
-
-            s = s[: -2] + ']'
-
-            return s
+            return 'PriorityQueue[' + ', '.join(item.__str__() for item in self.items()) + ']'
         else:
             return 'PriorityQueue[]'
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""Opt-in profiling of the client ingest pipeline (fetch, decode, validate, enqueue)"""
+
+import contextlib
+import cProfile
+import threading
+import time
+
+from typing import Final
+
+
+class CountingKey():
+
+    __slots__ = ('key', 'counter')
+
+    def __init__(self, key, counter) -> None:
+        """Constructor to initialise a sort key that counts its comparisons
+        Parameters:
+            key (any): the sort key
+            counter (list): a one item list with the comparison count
+        Returns:
+            None"""
+
+        self.key = key
+        self.counter = counter
+
+    def __lt__(self, other) -> bool:
+        """Compare two sort keys, counting the comparison
+        Parameters:
+            other (CountingKey): the other sort key
+        Returns:
+            bool: whether this key sorts first"""
+
+        self.counter[0] += 1  # not locked, the queue itself is not thread-safe
+
+        return self.key < other.key
+
+    def __eq__(self, other) -> bool:
+        """Check if two sort keys are equal (ties are broken by the queue's sequence number)
+        Parameters:
+            other (CountingKey): the other sort key
+        Returns:
+            bool: whether the keys are equal"""
+
+        return self.key == other.key
+
+class NullProfiler():
+    """Profiler that records nothing, used when profiling is off so the pipeline has no overhead"""
+
+    def stage(self, name):
+        """Time a stage of the pipeline
+        Parameters:
+            name (str): the stage name
+        Returns:
+            contextlib.nullcontext: a context manager that does nothing"""
+
+        return contextlib.nullcontext()
+
+    def count(self, name, n = 1) -> None:
+        """Add to a counter
+        Parameters:
+            name (str): the counter name
+            n (int): the amount to add (default: 1)
+        Returns:
+            None"""
+
+        pass
+
+    def comparison_key(self, key):
+        """Wrap a sort key function so the comparisons of its keys are counted
+        Parameters:
+            key (function): the sort key function
+        Returns:
+            function: the same function"""
+
+        return key
+
+    def start(self) -> None:
+        """Start profiling
+        Returns:
+            None"""
+
+        pass
+
+    def stop(self) -> None:
+        """Stop profiling
+        Returns:
+            None"""
+
+        pass
+
+    def print_report(self) -> None:
+        """Print the profile
+        Returns:
+            None"""
+
+        pass
+
+class Profiler(NullProfiler):
+
+    STAGES: Final = ('fetch', 'decode', 'validate', 'enqueue')  # reported first, in pipeline order
+
+    def __init__(self, cprofile_path = None) -> None:
+        """Constructor to initialise a profiler with stage timers and counters
+        Parameters:
+            cprofile_path (str): the file to dump a cProfile report to, readable by pstats,
+            snakeviz or flameprof (default: None i.e. no cProfile report)
+        Returns:
+            None"""
+
+        self.lock = threading.Lock()
+        self.seconds = {}  # stage -> total seconds
+        self.calls = {}  # stage -> number of calls
+        self.counters = {}  # counter -> count
+        self.comparisons = [0]
+        self.cprofile_path = cprofile_path
+        self.cprofile = cProfile.Profile() if cprofile_path else None
+        self.start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a stage of the pipeline
+        Parameters:
+            name (str): the stage name, e.g. 'fetch'
+        Returns:
+            generator: a context manager that adds its time to the stage"""
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n = 1) -> None:
+        """Add to a counter
+        Parameters:
+            name (str): the counter name, e.g. 'rejected'
+            n (int): the amount to add (default: 1)
+        Returns:
+            None"""
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def comparison_key(self, key):
+        """Wrap a sort key function so the comparisons of its keys are counted
+        Parameters:
+            key (function): the sort key function, e.g. Order.get_rank
+        Returns:
+            function: the wrapped sort key function"""
+
+        counter = self.comparisons
+
+        def counting_key(item):
+            return CountingKey(key(item), counter)
+
+        return counting_key
+
+    def start(self) -> None:
+        """Start the cProfile profiler, if there is one
+        Returns:
+            None"""
+
+        self.start_time = time.perf_counter()
+
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self) -> None:
+        """Stop the cProfile profiler and dump its report, if there is one
+        Returns:
+            None"""
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+
+    def report(self) -> dict:
+        """Get the stage times and counters
+        Returns:
+            dict: the total seconds, the seconds and calls of every stage, and the counters"""
+
+        with self.lock:
+            stages = {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds}
+            counters = dict(self.counters)
+
+        counters['comparisons'] = self.comparisons[0]
+
+        return {'seconds': time.perf_counter() - self.start_time, 'stages': stages, 'counters': counters}
+
+    def print_report(self) -> None:
+        """Print the stage times and counters
+        Returns:
+            None"""
+
+        report = self.report()
+        names = [name for name in self.STAGES if name in report['stages']] + sorted(set(report['stages']) - set(self.STAGES))
+
+        print('\nProfile ({:.3f}s):'.format(report['seconds']))
+
+        for name in names:
+            stage = report['stages'][name]
+            print('  {:<10} {:>10.3f}s {:>6.1%} {:>8} calls'.format(name, stage['seconds'], stage['seconds'] / report['seconds'], stage['calls']))
+
+        for name, count in sorted(report['counters'].items()):
+            print('  {:<10} {:>10}'.format(name, count))
+
+        if self.cprofile is not None:
+            print('  cProfile report: {}'.format(self.cprofile_path))
+
+def open_profiler(setting = None) -> NullProfiler:
+    """Open the profiler for a setting, e.g. an environment variable
+    Parameters:
+        setting (str): unset or '0' for no profiling, '1' for stage timers and counters, or
+        a file name to also dump a cProfile report to (default: None)
+    Returns:
+        NullProfiler: the profiler"""
+
+    if setting is None or setting in ('', '0'):
+        return NullProfiler()
+
+    return Profiler(None if setting == '1' else setting)
@@ -3,7 +3,40 @@
 class APIError(Exception):
     pass
 
+class RequestError(APIError):
+    """Exception to reject a request with an HTTP error status and message"""
+
+    def __init__(self, status_code, message) -> None:
+        """Constructor to initialise a request error
+        Parameters:
+            status_code (int): the HTTP status code, e.g. 400
+            message (str): the error message for the client
+        Returns:
+            None"""
+
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+class RateLimitError(RequestError):
+    """Exception to reject a request of an API key that is over its rate limit"""
+
+    def __init__(self, retry_after) -> None:
+        """Constructor to initialise a rate limit error
+        Parameters:
+            retry_after (int): the seconds until the key can make a request
+        Returns:
+            None"""
+
+        super().__init__(429, 'Too many requests')
+        self.retry_after = retry_after
+
 class PriorityValueError(APIError):
     """Exception to handle an incorrect priority value"""
     
+    pass
+
+class DuplicateOrderError(APIError):
+    """Exception to handle an order ID that already exists"""
+
     pass
\ No newline at end of file
@@ -0,0 +1,365 @@
+"""The DS3500 Orders API as an ASGI application, for serving many concurrent slow clients
+(e.g. streaming exports) from a single process
+
+Run it with any ASGI server, e.g. uvicorn async_api:app (set DS3500_STORE to share the
+orders with the WSGI app). The routes and responses are the same as full_api, both apps
+use the request handlers of orders_service."""
+
+import asyncio
+import columnar
+import json
+import os
+import orders_service
+import time
+
+from api_errors import RateLimitError, RequestError
+from auth import KeyVerifier, open_key_store
+from metrics import Metrics
+from rate_limit import open_rate_limiter
+from response_cache import cache_key, conditional_response, ResponseCache
+from response_compression import compress, compress_stream, open_compression
+from typing import Final
+from urllib.parse import parse_qsl
+
+
+# columnar: module with the columnar response format
+# orders_service: module with the request handling logic, shared with full_api
+# RateLimitError, RequestError: custom exception classes
+# KeyVerifier, Metrics: classes
+# compress, compress_stream, open_compression, open_key_store, open_rate_limiter: functions
+# cache_key, conditional_response: functions
+# ResponseCache: class
+# parse_qsl: function
+
+DS3500_STORE: Final = os.getenv('DS3500_STORE')  # unset to keep the orders in memory
+DS3500_API_KEYS: Final = os.getenv('DS3500_API_KEYS')  # comma separated, unset to accept keys by the DS3500 key rule
+DS3500_RATE_LIMIT: Final = os.getenv('DS3500_RATE_LIMIT')  # requests/s and burst of every key, e.g. 10/20
+DS3500_KEY_RATE_LIMITS: Final = os.getenv('DS3500_KEY_RATE_LIMITS')  # limits of specific keys, e.g. 12345=100/200
+DS3500_RATE_STORE: Final = os.getenv('DS3500_RATE_STORE')  # unset to keep the token buckets in memory
+DS3500_COMPRESS_MIN_SIZE: Final = os.getenv('DS3500_COMPRESS_MIN_SIZE')  # smallest body to compress in bytes, or off
+
+store = orders_service.open_seeded_store(DS3500_STORE)
+response_cache = ResponseCache()  # pre-serialised GET responses, invalidated by the store version
+key_verifier = KeyVerifier(open_key_store(DS3500_API_KEYS))
+rate_limiter = open_rate_limiter(DS3500_RATE_STORE, DS3500_RATE_LIMIT, DS3500_KEY_RATE_LIMITS)
+metrics = Metrics()
+compression = open_compression(DS3500_COMPRESS_MIN_SIZE)
+
+V2_ROUTES: Final = {('GET', '/ds3500/api/v2/orders'), ('POST', '/ds3500/api/v2/add'), ('POST', '/ds3500/api/v2/add/bulk')}  # need an API key
+ROUTES: Final = V2_ROUTES | {
+    ('GET', '/'), ('GET', '/metrics'), ('GET', '/ds3500/api/v1/orders'), ('GET', '/ds3500/api/v1/order'),
+    ('POST', '/ds3500/api/v1/order'), ('GET', '/ds3500/api/v1/orders/priority'), ('GET', '/ds3500/api/v1/orders/changes'),
+    ('GET', '/ds3500/api/v1/orders/next'), ('GET', '/ds3500/api/v1/orders/export')
+}  # every (method, path), to tell a wrong method (405) from an unknown path (404)
+
+class Request():
+
+    __slots__ = ('method', 'path', 'query', 'args', 'headers', 'body')
+
+    def __init__(self, scope, body) -> None:
+        """Constructor to initialise a request from an ASGI HTTP scope
+        Parameters:
+            scope (dict): the ASGI connection scope
+            body (bytes): the request body
+        Returns:
+            None"""
+
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = parse_qsl(scope['query_string'].decode('latin-1'))
+        self.args = {}
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.body = body
+
+        for name, value in self.query:  # the first value of a repeated parameter, as in Flask
+            self.args.setdefault(name, value)
+
+    def mimetype(self) -> str:
+        """Get the mimetype of the request body
+        Returns:
+            str: the mimetype (without parameters such as the charset)"""
+
+        return self.headers.get('content-type', '').split(';')[0].strip().lower()
+
+def json_body(payload) -> bytes:
+    """Encode a JSON response body, the same way as flask.jsonify
+    Parameters:
+        payload (dict): the payload
+    Returns:
+        bytes: the body"""
+
+    return (json.dumps(payload, separators = (',', ':')) + '\n').encode()
+
+def error_response(status_code, message) -> tuple:
+    """Build a JSON error response
+    Parameters:
+        status_code (int): the status code
+        message (str): the error message
+    Returns:
+        tuple: the status code, the body and the mimetype"""
+
+    return status_code, json_body(orders_service.error_payload(message)), 'application/json'
+
+async def run(handler, *args, mimetype = columnar.JSON_MIMETYPE) -> tuple:
+    """Run a request handler in a worker thread, so store reads do not block the event loop
+    Parameters:
+        handler (function): the request handler from orders_service
+        args: the arguments for the handler
+        mimetype (str): the format of the orders, see columnar.negotiate (default: columnar.JSON_MIMETYPE)
+    Returns:
+        tuple: the status code, the body and the mimetype"""
+
+    try:
+        status_code, payload = await asyncio.to_thread(handler, *args)
+    except RequestError as e:
+        return error_response(e.status_code, e.message)
+
+    if payload is None:  # 204 sends a blank response
+        return 204, b'', 'application/json'
+
+    if 'data' in payload and mimetype == columnar.MIMETYPE:
+        try:
+            return status_code, columnar.encode(payload), columnar.MIMETYPE
+        except ValueError:  # does not fit, the JSON Content-Type tells the client
+            pass
+
+    return status_code, json_body(payload), 'application/json'
+
+async def cached(req, handler, *args) -> tuple:
+    """Serve a GET response from the response cache, running the handler on a miss
+    (Note: honours If-None-Match with a 304, and the compressed body is cached too)
+    Parameters:
+        req (Request): the request
+        handler (function): the request handler from orders_service
+        args: the arguments for the handler
+    Returns:
+        tuple: the status code, the body, the mimetype and the headers"""
+
+    mimetype = columnar.negotiate(req.headers.get('accept'))
+    key = cache_key(req.path, req.query, mimetype)
+    version = await asyncio.to_thread(store.version)
+    entry = response_cache.get(key, version)
+
+    if entry is None:  # version was read before building, so a concurrent add can only make the entry stale
+        status_code, body, body_mimetype = await run(handler, *args, mimetype = mimetype)
+
+        if status_code != 200:  # only cache full responses
+            return status_code, body, body_mimetype, [('vary', 'Accept')]
+
+        entry = response_cache.put(key, version, body, body_mimetype)
+
+    encoding = compression.choose(req.headers.get('accept-encoding'), len(entry.body))
+
+    if encoding is not None and encoding not in entry.encoded:  # compress in a worker thread once per encoding
+        await asyncio.to_thread(entry.variant, encoding)
+
+    status_code, body, headers = conditional_response(entry, encoding, req.headers.get('if-none-match'))
+
+    return status_code, body, entry.mimetype, headers
+
+async def handle(req) -> tuple:
+    """Route a request to its handler
+    Parameters:
+        req (Request): the request
+    Returns:
+        tuple: the status code, the body, the mimetype and the headers"""
+
+    route = (req.method, req.path)
+
+    if route == ('GET', '/'):
+        return 200, b'<p>DS3500 Orders API</p>', 'text/html', []
+
+    elif route == ('GET', '/metrics'):
+        orders = await asyncio.to_thread(len, store)
+
+        return 200, metrics.render(orders).encode(), 'text/plain; version=0.0.4; charset=utf-8', []
+
+    elif route == ('GET', '/ds3500/api/v1/orders'):
+        return await cached(req, orders_service.get_orders, store, req.args)
+
+    elif route == ('GET', '/ds3500/api/v1/order'):
+        return await cached(req, orders_service.get_order, store, req.args)
+
+    elif route == ('POST', '/ds3500/api/v1/order'):
+        try:
+            body = json.loads(req.body)
+        except ValueError:
+            body = None
+
+        ord_ids = body.get('ids') if isinstance(body, dict) else body
+
+        mimetype = columnar.negotiate(req.headers.get('accept'))
+
+        return await run(orders_service.get_orders_by_ids, store, ord_ids, mimetype = mimetype) + ([('vary', 'Accept')],)
+
+    elif route == ('GET', '/ds3500/api/v1/orders/priority'):
+        return await cached(req, orders_service.get_orders_by_priority, store, req.args)
+
+    elif route == ('GET', '/ds3500/api/v1/orders/changes'):
+        return await cached(req, orders_service.get_order_changes, store, req.args)
+
+    elif route == ('GET', '/ds3500/api/v1/orders/next'):
+        return await cached(req, orders_service.get_next_orders, store, req.args)
+
+    elif route in V2_ROUTES:
+        try:
+            api_key = req.headers.get('x-api-key', None)
+            key_verifier.check(api_key)
+            await asyncio.to_thread(rate_limiter.check, api_key)  # the token buckets can be in a shared SQLite file
+
+            if route == ('GET', '/ds3500/api/v2/orders'):
+                return await cached(req, orders_service.get_orders, store, req.args)
+
+            elif route == ('POST', '/ds3500/api/v2/add'):
+                form = dict(parse_qsl(req.body.decode('latin-1'))) if req.mimetype() == 'application/x-www-form-urlencoded' else {}
+
+                return await run(orders_service.add_order, store, form) + ([],)
+
+            elif route == ('POST', '/ds3500/api/v2/add/bulk'):
+                rows = await asyncio.to_thread(orders_service.parse_bulk_payload, req.body, req.mimetype())  # up to MAX_BULK_SIZE orders
+
+                return await run(orders_service.add_orders, store, rows) + ([],)
+
+        except RateLimitError as e:
+            return error_response(e.status_code, e.message) + ([('retry-after', str(e.retry_after))],)
+
+        except RequestError as e:
+            return error_response(e.status_code, e.message) + ([],)
+
+    allowed = sorted(method for method, path in ROUTES if path == req.path)
+
+    if len(allowed) > 0:  # a known path with another method
+        return error_response(405, 'Method Not Allowed') + ([('allow', ', '.join(allowed))],)
+
+    return error_response(404, 'Not Found') + ([],)
+
+async def encode_response(req, status_code, body, headers) -> tuple:
+    """Compress a response body in the encoding negotiated with the Accept-Encoding header,
+    if it is big enough
+    Parameters:
+        req (Request): the request
+        status_code (int): the status code
+        body (bytes): the body
+        headers (list): the headers as (name, value) tuples
+    Returns:
+        tuple: the body and the headers"""
+
+    if not compression.enabled():
+        return body, headers
+
+    headers = headers + [('vary', 'Accept-Encoding')]
+
+    if status_code in (204, 304) or any(name == 'content-encoding' for name, _ in headers):  # no body, or already compressed e.g. by cached
+        return body, headers
+
+    encoding = compression.choose(req.headers.get('accept-encoding'), len(body))
+
+    if encoding is None:
+        return body, headers
+
+    return await asyncio.to_thread(compress, body, encoding), headers + [('content-encoding', encoding)]
+
+async def read_body(receive) -> bytes:
+    """Read the whole request body
+    Parameters:
+        receive (function): the ASGI receive function
+    Returns:
+        bytes: the body"""
+
+    chunks = []
+
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+async def export_orders(req, send) -> int:
+    """Stream every order in ID order as newline delimited JSON (NDJSON), optionally
+    filtered by priority and/or date
+    (Note: every chunk is read from the store and compressed in a worker thread, so a slow client only holds a coroutine)
+    Parameters:
+        req (Request): the request
+        send (function): the ASGI send function
+    Returns:
+        int: the status code"""
+
+    try:
+        chunks = orders_service.export_orders(store, req.args)
+    except RequestError as e:
+        await send_response(send, *error_response(e.status_code, e.message))
+        return e.status_code
+
+    headers = [(b'content-type', b'application/x-ndjson')]
+    encoding = compression.choose(req.headers.get('accept-encoding'))  # streamed, so the size is not known up front
+
+    if compression.enabled():
+        headers.append((b'vary', b'Accept-Encoding'))
+
+    if encoding is not None:
+        chunks = compress_stream(chunks, encoding)
+        headers.append((b'content-encoding', encoding.encode()))
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+
+        if chunk is None:
+            break
+
+        await send({'type': 'http.response.body', 'body': chunk.encode() if isinstance(chunk, str) else chunk, 'more_body': True})
+
+    await send({'type': 'http.response.body', 'body': b''})
+
+    return 200
+
+async def send_response(send, status_code, body, mimetype, headers = []) -> None:
+    """Send a complete response
+    Parameters:
+        send (function): the ASGI send function
+        status_code (int): the status code
+        body (bytes): the body
+        mimetype (str): the mimetype
+        headers (list): more headers as (name, value) tuples, e.g. the ETag (default: [])
+    Returns:
+        None"""
+
+    headers = [('content-type', mimetype), ('content-length', str(len(body)))] + headers
+
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': [(name.encode(), value.encode()) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def app(scope, receive, send) -> None:
+    """The ASGI application
+    Parameters:
+        scope (dict): the ASGI connection scope
+        receive (function): the ASGI receive function
+        send (function): the ASGI send function
+    Returns:
+        None"""
+
+    if scope['type'] == 'lifespan':  # nothing to set up, the store is opened on import
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                return await send({'type': 'lifespan.shutdown.complete'})
+
+    elif scope['type'] == 'http':
+        req = Request(scope, await read_body(receive))
+        start_time = time.perf_counter()
+
+        if (req.method, req.path) == ('GET', '/ds3500/api/v1/orders/export'):
+            status_code, size = await export_orders(req, send), None  # streamed, so the size is not known up front
+        else:
+            status_code, body, mimetype, headers = await handle(req)
+            body, headers = await encode_response(req, status_code, body, headers)
+            size = len(body)
+            await send_response(send, status_code, body, mimetype, headers)
+
+        route = req.path if status_code != 404 else 'unmatched'  # every route is a fixed path
+        metrics.observe(route, req.method, status_code, time.perf_counter() - start_time, size)
@@ -0,0 +1,145 @@
+"""API key verification for the v2 APIs of the DS3500 Orders API"""
+
+import hashlib
+import hmac
+import threading
+
+from abc import ABC, abstractmethod
+from api_errors import RequestError
+from collections import OrderedDict
+
+
+class KeyStore(ABC):
+    """Base class for API key stores"""
+
+    @abstractmethod
+    def is_valid(self, api_key) -> bool:
+        """Check an API key
+        Parameters:
+            api_key (str): the API key
+        Returns:
+            bool: whether the key is valid or not"""
+
+class RuleKeyStore(KeyStore):
+    """Key store that accepts every key following the DS3500 key rule"""
+
+    def is_valid(self, api_key) -> bool:
+        """Check an API key
+        Parameters:
+            api_key (str): the API key
+        Returns:
+            bool: whether the key is valid or not"""
+
+        try:
+            return len(api_key) == 5 and int(api_key) % 3 == 0  # a valid key has 5 digits AND is divisible by 3
+        except ValueError:
+            return False
+
+class StaticKeyStore(KeyStore):
+    """Key store with a fixed set of keys, only their SHA-256 digests are kept"""
+
+    def __init__(self, keys) -> None:
+        """Constructor to initialise a key store with a fixed set of keys
+        Parameters:
+            keys (iterable): the valid API keys
+        Returns:
+            None"""
+
+        self.digests = [digest(api_key) for api_key in keys]
+
+    def is_valid(self, api_key) -> bool:
+        """Check an API key in constant time, every stored key is compared
+        Parameters:
+            api_key (str): the API key
+        Returns:
+            bool: whether the key is valid or not"""
+
+        key_digest = digest(api_key)
+        valid = False
+
+        for stored_digest in self.digests:  # no early exit, so the time does not depend on which key matches
+            valid |= hmac.compare_digest(stored_digest, key_digest)
+
+        return valid
+
+def digest(api_key) -> bytes:
+    """Get the SHA-256 digest of an API key
+    Parameters:
+        api_key (str): the API key
+    Returns:
+        bytes: the digest"""
+
+    return hashlib.sha256(api_key.encode('utf-8', 'surrogatepass')).digest()
+
+def open_key_store(keys = None) -> KeyStore:
+    """Open the key store for a list of keys
+    Parameters:
+        keys (str): a comma separated list of valid API keys (default: None i.e. the DS3500 key rule)
+    Returns:
+        KeyStore: the key store"""
+
+    if keys is None or keys.strip() == '':
+        return RuleKeyStore()
+
+    return StaticKeyStore(api_key.strip() for api_key in keys.split(',') if api_key.strip() != '')
+
+class KeyVerifier():
+
+    def __init__(self, key_store = None, max_entries = 4096) -> None:
+        """Constructor to initialise a verifier that caches the valid keys in a bounded LRU (invalid
+        keys are not cached, so a key added to the key store is accepted at once)
+        Parameters:
+            key_store (KeyStore): the key store (default: None i.e. the DS3500 key rule)
+            max_entries (int): the maximum number of cached results (default: 4096)
+        Returns:
+            None"""
+
+        self.key_store = key_store if key_store is not None else RuleKeyStore()
+        self.max_entries = max_entries
+        self.valid_keys = OrderedDict()  # key digest -> True, raw keys are never kept
+        self.lock = threading.Lock()
+
+    def verify(self, api_key) -> bool:
+        """Verify an API key, asking the key store only if the key is not cached as valid
+        Parameters:
+            api_key (str): the API key
+        Returns:
+            bool: whether the key is valid or not"""
+
+        key_digest = digest(api_key)
+
+        with self.lock:
+            if key_digest in self.valid_keys:
+                self.valid_keys.move_to_end(key_digest)
+                return True
+
+        if not self.key_store.is_valid(api_key):
+            return False
+
+        with self.lock:
+            self.valid_keys[key_digest] = True
+
+            if len(self.valid_keys) > self.max_entries:
+                self.valid_keys.popitem(last = False)
+
+        return True
+
+    def check(self, api_key) -> None:
+        """Check the API key of a v2 request
+        Parameters:
+            api_key (str): the API key (or None if it is missing)
+        Returns:
+            None"""
+
+        if api_key is None:  # key not present
+            raise RequestError(401, 'Missing API key')
+        elif not self.verify(api_key):  # key is present and invalid i.e. HTTP 401
+            raise RequestError(401, 'Unauthorised')
+
+    def clear(self) -> None:
+        """Clear the cached keys, e.g. after keys were revoked
+        Returns:
+            None"""
+
+        with self.lock:
+            self.valid_keys.clear()
@@ -0,0 +1,88 @@
+"""Compact columnar encoding of the orders of an API response, negotiated with the Accept header
+
+Layout of a response body (every number is little endian):
+    4 bytes     magic, b'DSC1'
+    4 bytes     header length (uint32)
+    header      JSON object, the response payload without its data, plus 'columns': a list of
+                [name, NumPy dtype str] pairs, padded with spaces to a multiple of 8 bytes
+    columns     one buffer of size values per column, in the order of the header:
+                id (int64), priority (uint8 code, L = 1, M = 2, H = 3, 0 if invalid),
+                date (int32 day ordinal, 0 if invalid), quantity (uint16, or int64 if a
+                quantity does not fit)"""
+
+import json
+import numpy as np
+import struct
+
+from datetime import datetime
+from functools import lru_cache
+from response_compression import parse_quality
+from typing import Final
+
+
+MIMETYPE: Final = 'application/vnd.ds3500.columns'
+JSON_MIMETYPE: Final = 'application/json'
+MAGIC: Final = b'DSC1'
+PRIORITY_CODES: Final = {'L': 1, 'M': 2, 'H': 3}  # the codes of the client's Order.PRIORITY_MAP
+
+@lru_cache(maxsize = 4096)  # the orders of a page share a few dates
+def date_ordinal(iso_date) -> int:
+    """Get the day ordinal of an ISO 8601 date str
+    Parameters:
+        iso_date (str): the date
+    Returns:
+        int: the day ordinal of the date, 0 if the date is invalid"""
+
+    try:
+        return datetime.fromisoformat(iso_date).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+def encode(payload) -> bytes:
+    """Encode the payload of an orders response in the columnar format
+    Parameters:
+        payload (dict): the payload, with the orders in 'data'
+    Returns:
+        bytes: the response body
+    Raises:
+        ValueError: an ID or quantity does not fit in an int64, send the payload as JSON instead"""
+
+    orders = payload['data']
+    n = len(orders)
+
+    try:
+        ids = np.fromiter((o['id'] for o in orders), dtype = '<i8', count = n)
+        quantities = np.fromiter((o['quantity'] for o in orders), dtype = '<i8', count = n)
+    except OverflowError:
+        raise ValueError('Order does not fit in the columnar format')
+
+    if n == 0 or (quantities.min() >= 0 and quantities.max() <= np.iinfo(np.uint16).max):
+        quantities = quantities.astype('<u2')
+
+    columns = (
+        ('id', ids),
+        ('priority', np.fromiter((PRIORITY_CODES.get(o['priority'], 0) for o in orders), dtype = 'u1', count = n)),
+        ('date', np.fromiter((date_ordinal(o['date']) for o in orders), dtype = '<i4', count = n)),
+        ('quantity', quantities)
+    )
+
+    header = {key: value for key, value in payload.items() if key != 'data'}
+    header['columns'] = [[name, column.dtype.str] for name, column in columns]
+    header = json.dumps(header, separators = (',', ':')).encode()
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)  # so the first column is 8 byte aligned
+
+    return b''.join([MAGIC, struct.pack('<I', len(header)), header] + [column.tobytes() for _, column in columns])
+
+def negotiate(accept) -> str:
+    """Choose the response format for an Accept header, the columnar format is only
+    used when a client asks for it by name and does not prefer JSON
+    Parameters:
+        accept (str): the Accept header (or None)
+    Returns:
+        str: MIMETYPE or JSON_MIMETYPE"""
+
+    quality = parse_quality(accept)
+    columnar_q = quality.get(MIMETYPE, 0.0)
+    json_q = max(quality.get(JSON_MIMETYPE, 0.0), quality.get('application/*', 0.0), quality.get('*/*', 0.0))
+
+    return MIMETYPE if columnar_q > 0 and columnar_q >= json_q else JSON_MIMETYPE
@@ -9,17 +9,57 @@ class DatabaseSimulator():
 
     PRIORITIES: Final = ('H', 'M', 'L')
 
-    def __init__(self, n) -> None:
+    def __init__(self, n, seed = None) -> None:
         """Constructor to initialise the database sim
         Parameters: 
             n (int): the number of samples to generate
+            seed (int): the seed of the random number generator (default: None i.e. unseeded)
         Returns:
             None"""
 
         self.n = n
+        self.seed = seed
         # self.priorities = ('H', 'M', 'L')
         self.dates = ('2021-10-19', '2021-10-20', '2021-10-21', '2021-10-22')
 
+    def generate_columns(self, start, size, rng) -> dict:
+        """Generates a block of orders as columns, drawing each column in one NumPy call
+        Parameters:
+            start (int): the ID of the first order
+            size (int): the number of orders
+            rng (numpy.random.Generator): the random number generator
+        Returns:
+            dict: a dictionary of NumPy arrays {id, priority, date, quantity}"""
+
+        return {
+            'id': np.arange(start, start + size, dtype = np.int64),
+            'priority': np.array(self.PRIORITIES)[rng.integers(0, len(self.PRIORITIES), size)],
+            'date': np.array(self.dates)[rng.integers(0, len(self.dates), size)],
+            'quantity': rng.integers(1, 101, size, dtype = np.int64)
+        }
+
+    def iter_chunks(self, chunk_size = 100000, columnar = False):
+        """Lazily generates the n orders in chunks, so datasets larger than memory can be streamed
+        (Note: for a given seed and chunk size the orders are always the same)
+        Parameters:
+            chunk_size (int): the number of orders per chunk (default: 100000)
+            columnar (bool): yield dictionaries of NumPy arrays instead of lists of dictionaries (default: False)
+        Returns:
+            generator: a generator of chunks of orders"""
+
+        rng = np.random.default_rng(self.seed)
+
+        for start in range(1, self.n + 1, chunk_size):
+            columns = self.generate_columns(start, min(chunk_size, self.n + 1 - start), rng)
+
+            if columnar:
+                yield columns
+            else:
+                # tolist() converts to plain Python types, so orders are JSON serialisable
+                yield [{'id': o_id, 'priority': priority, 'date': o_date, 'quantity': quantity}
+                       for o_id, priority, o_date, quantity in zip(columns['id'].tolist(), columns['priority'].tolist(),
+                                                                   columns['date'].tolist(), columns['quantity'].tolist())]
+
     def generate_orders(self) -> list:
         """Generates n orders with 4 attributes (ID, priority, date, quantity)
         Returns:
@@ -28,22 +68,22 @@ class DatabaseSimulator():
 
         generated_orders = []
 
-        for i in range(1, self.n + 1):
-            # generate order attributes
-            ord_priority = self.PRIORITIES[np.random.randint(0, len(self.PRIORITIES))]
-            ord_date = self.dates[np.random.randint(0, len(self.dates))]
-            ord_quantity = np.random.randint(1, 101)
-
-            # add to orders list as a dictionary
-            generated_orders.append({
-                'id': i,
-                'priority': ord_priority,
-                'date': ord_date,
-                'quantity': ord_quantity
-            })
+        for chunk in self.iter_chunks():
+            generated_orders.extend(chunk)
 
         return generated_orders
 
+    def seed_store(self, store, chunk_size = 100000) -> None:
+        """Adds the n orders to an order store in bulk, one chunk (and one write) at a time
+        Parameters:
+            store (OrderStore): the order store
+            chunk_size (int): the number of orders per chunk (default: 100000)
+        Returns:
+            None"""
+
+        for chunk in self.iter_chunks(chunk_size):
+            store.add_many(chunk)
+
     def get_sample_size(self) -> int:
         """Get the number of samples being generated
         Returns:
@@ -1,25 +1,186 @@
 """The DS3500 Orders API"""
 
-from api_errors import PriorityValueError
-from database_simulator import DatabaseSimulator
-from flask import abort, Flask, jsonify, request
+import columnar
+import os
+import orders_service
+import time
+
+from api_errors import RateLimitError, RequestError
+from auth import KeyVerifier, open_key_store
+from flask import Blueprint, current_app, Flask, g, jsonify, request, Response
+from functools import wraps
+from metrics import Metrics
+from order_store import OrderStore
+from rate_limit import open_rate_limiter, RateLimiter
+from response_cache import cache_key, conditional_response, ResponseCache
+from response_compression import compress, compress_stream, Compression, open_compression
 from typing import Final
 
 
-# PriorityValueError: custom exception class
-# DatabaseSimulator: class
-# abort: function
-# Flask: class
+# columnar: module with the columnar response format
+# orders_service: module with the request handling logic, shared with async_api
+# RateLimitError, RequestError: custom exception classes
+# KeyVerifier: class
+# open_key_store: function
+# Compression, Metrics, OrderStore, RateLimiter, ResponseCache: classes
+# cache_key, compress, compress_stream, conditional_response, open_compression, open_rate_limiter: functions
+# Blueprint, Flask: classes
+# current_app, g: variables
 # jsonify: function
 # request: variable
+# Response: class
+# wraps: function
 
-app = Flask(__name__)  # create a Flask object
-app.config['DEBUG'] = True  # start the debugger
+api = Blueprint('api', __name__)  # the routes, registered on an app by create_app()
 
-# define constants
-PAGE_SIZE: Final = 50  # API page size
+def create_app(store_url = None, debug = False, key_store = None, rate_limiter = None, compression = None) -> Flask:
+    """Create the API app (WSGI application factory), every app (and worker process)
+    using the same store URL shares the same orders
+    Parameters:
+        store_url (str): the order store URL, see open_store (default: None i.e. in memory)
+        debug (bool): start the debugger (default: False)
+        key_store (auth.KeyStore): the valid v2 API keys (default: None i.e. the DS3500 key rule)
+        rate_limiter (RateLimiter): the rate limits of the v2 API keys (default: None i.e. no limit)
+        compression (Compression): when to compress responses (default: None i.e. bodies of 1 KiB or more)
+    Returns:
+        flask.Flask: the app"""
+
+    app = Flask(__name__)  # create a Flask object
+    app.config['DEBUG'] = debug
+
+    app.extensions['ds3500_store'] = orders_service.open_seeded_store(store_url)
+    app.extensions['ds3500_response_cache'] = ResponseCache()  # pre-serialised GET responses, invalidated by the store version
+    app.extensions['ds3500_key_verifier'] = KeyVerifier(key_store)
+    app.extensions['ds3500_rate_limiter'] = rate_limiter if rate_limiter is not None else RateLimiter()
+    app.extensions['ds3500_metrics'] = Metrics()
+    app.extensions['ds3500_compression'] = compression if compression is not None else Compression()
+
+    app.register_blueprint(api)
+
+    return app
+
+def get_store() -> OrderStore:
+    """Get the order store of the current app
+    Returns:
+        OrderStore: the order store"""
+
+    return current_app.extensions['ds3500_store']
+
+def get_response_cache() -> ResponseCache:
+    """Get the response cache of the current app
+    Returns:
+        ResponseCache: the response cache"""
+
+    return current_app.extensions['ds3500_response_cache']
+
+def get_key_verifier() -> KeyVerifier:
+    """Get the API key verifier of the current app
+    Returns:
+        KeyVerifier: the key verifier"""
+
+    return current_app.extensions['ds3500_key_verifier']
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the rate limiter of the current app
+    Returns:
+        RateLimiter: the rate limiter"""
+
+    return current_app.extensions['ds3500_rate_limiter']
+
+def get_metrics() -> Metrics:
+    """Get the request metrics of the current app
+    Returns:
+        Metrics: the request metrics"""
+
+    return current_app.extensions['ds3500_metrics']
+
+def get_compression() -> Compression:
+    """Get the compression settings of the current app
+    Returns:
+        Compression: the compression settings"""
+
+    return current_app.extensions['ds3500_compression']
 
-data = DatabaseSimulator(20).generate_orders()  # get a list of 20 orders [{id: int, priority: str, date: ISO 8601 str, quantity: int}]
+def response_format() -> str:
+    """Get the format of the orders in the response, negotiated with the Accept header
+    Returns:
+        str: columnar.MIMETYPE or columnar.JSON_MIMETYPE"""
+
+    return columnar.negotiate(request.headers.get('Accept'))
+
+def respond(result):
+    """Convert the result of a request handler to a response, orders are sent in
+    the columnar format if the client asks for it (see columnar)
+    Parameters:
+        result (tuple): the status code and the payload (None for a 204)
+    Returns:
+        flask.Response: API response"""
+
+    status_code, payload = result
+
+    if payload is None:
+        return no_content()
+
+    res = None
+
+    if 'data' in payload and response_format() == columnar.MIMETYPE:
+        try:
+            res = Response(columnar.encode(payload), mimetype = columnar.MIMETYPE)
+        except ValueError:  # does not fit, the JSON Content-Type tells the client
+            pass
+
+    if res is None:
+        res = jsonify(payload)
+
+    res.status_code = status_code
+
+    if 'data' in payload:
+        res.vary.add('Accept')
+
+    return res
+
+def cached_response(view, *args, **kwargs):
+    """Serve a GET response from the response cache, building it with the view on a miss
+    (Note: honours If-None-Match with a 304, and the compressed body is cached too)
+    Parameters:
+        view (function): the function that builds the response
+        args, kwargs: the arguments for the view
+    Returns:
+        flask.Response: API response"""
+
+    store, response_cache = get_store(), get_response_cache()
+    key = cache_key(request.path, request.args.items(multi = True), response_format())
+    version = store.version()
+    entry = response_cache.get(key, version)
+
+    if entry is None:  # version was read before building, so a concurrent add can only make the entry stale
+        res = view(*args, **kwargs)
+
+        if res.status_code != 200:  # only cache full responses
+            return res
+
+        entry = response_cache.put(key, version, res.get_data(), res.mimetype)
+
+    encoding = get_compression().choose(request.headers.get('Accept-Encoding'), len(entry.body))
+    status_code, body, headers = conditional_response(entry, encoding, request.headers.get('If-None-Match'))
+
+    return Response(body, status = status_code, headers = headers, mimetype = entry.mimetype)
+
+def cached(view):
+    """Decorator to serve a route's GET responses from the response cache
+    Parameters:
+        view (function): the route function
+    Returns:
+        function: the decorated route function"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+
+        return cached_response(view, *args, **kwargs)
+
+    return wrapper
 
 def no_content():
     """Custom 204 status handler
@@ -34,7 +195,102 @@ def no_content():
 
     return res  # 204 sends a blank response with status code 204
 
-@app.errorhandler(400)
+def require_api_key(view):
+    """Decorator to check the API key of a v2 route once per request and count the request against
+    the rate limit of the key, the key is kept in flask.g.api_key
+    Parameters:
+        view (function): the route function
+    Returns:
+        function: the decorated route function"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        api_key = request.headers.get('x-api-key', None)
+        get_key_verifier().check(api_key)
+        get_rate_limiter().check(api_key)
+        g.api_key = api_key
+
+        return view(*args, **kwargs)
+
+    return wrapper
+
+@api.before_app_request
+def start_timer() -> None:
+    """Start timing a request
+    Returns:
+        None"""
+
+    g.start_time = time.perf_counter()
+
+@api.after_app_request
+def record_metrics(res):
+    """Record the latency, status code and size of a response in the request metrics
+    Parameters:
+        res (flask.Response): the response
+    Returns:
+        flask.Response: the same response"""
+
+    seconds = time.perf_counter() - g.start_time
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'  # the route, not the path, so IDs do not add labels
+    size = None if res.is_streamed else res.calculate_content_length()
+
+    get_metrics().observe(route, request.method, res.status_code, seconds, size)
+
+    return res
+
+@api.after_app_request
+def compress_response(res):
+    """Compress a response in the encoding negotiated with the Accept-Encoding header, if
+    the body is big enough (streamed bodies are compressed chunk by chunk)
+    (Note: registered after record_metrics, so it runs first and the metrics have the sent size)
+    Parameters:
+        res (flask.Response): the response
+    Returns:
+        flask.Response: the same response"""
+
+    compression = get_compression()
+
+    if not compression.enabled() or res.direct_passthrough:
+        return res
+
+    res.vary.add('Accept-Encoding')
+
+    if res.status_code in (204, 304) or 'Content-Encoding' in res.headers:  # no body, or already compressed e.g. by cached_response
+        return res
+
+    if res.is_streamed:
+        encoding = compression.choose(request.headers.get('Accept-Encoding'))
+
+        if encoding is not None:
+            res.response = compress_stream(res.response, encoding)
+            res.content_encoding = encoding
+    else:
+        body = res.get_data()
+        encoding = compression.choose(request.headers.get('Accept-Encoding'), len(body))
+
+        if encoding is not None:
+            res.set_data(compress(body, encoding))
+            res.content_encoding = encoding
+
+    return res
+
+@api.app_errorhandler(RequestError)
+def request_error(error):
+    """Custom handler for the errors raised by the request handlers (400, 401, 409, 429)
+    Parameters:
+        error (RequestError): the error
+    Returns:
+        flask.Response"""
+
+    res = jsonify(orders_service.error_payload(error.message))
+    res.status_code = error.status_code
+
+    if isinstance(error, RateLimitError):
+        res.headers['Retry-After'] = str(error.retry_after)
+
+    return res
+
+@api.app_errorhandler(400)
 def bad_request(error):
     """Custom 400 error handler
     Parameters:
@@ -42,15 +298,12 @@ def bad_request(error):
     Returns:
         flask.Response"""
 
-    res =  jsonify({
-        'error': True,
-        'message': error.description
-    })
+    res = jsonify(orders_service.error_payload(error.description))
     res.status_code = 400
 
     return res
 
-@app.errorhandler(401)
+@api.app_errorhandler(401)
 def unauthorized(error):
     """Custom 401 error handler
     Parameters:
@@ -58,29 +311,23 @@ def unauthorized(error):
     Returns:
         flask.Response"""
 
-    res =  jsonify({
-        'error': True,
-        'message': error.description
-    })
+    res = jsonify(orders_service.error_payload(error.description))
     res.status_code = 401
 
     return res
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(args):
     """Custom 404 error handler
     Returns:
         flask.Response"""
 
-    res =  jsonify({
-        'error': True,
-        'message': 'Not Found'
-    })
+    res = jsonify(orders_service.error_payload('Not Found'))
     res.status_code = 404
 
     return res
 
-@app.route('/', methods = ['GET'])
+@api.route('/', methods = ['GET'])
 def home() -> str:
     """The API's homepage
     Returns:
@@ -88,167 +335,121 @@ def home() -> str:
 
     return '<p>DS3500 Orders API</p>'
 
-@app.route('/ds3500/api/v1/orders', methods = ['GET'])
+@api.route('/ds3500/api/v1/orders', methods = ['GET'])
+@cached
 def get_orders():
-    """Get all orders upto page limit
-    (Note: full pagination not implemented)
+    """Get a page of orders in ID order
+    (Note: pass the next_cursor of a page as the cursor parameter to get the next page)
     Returns:
         flask.Response: API response"""
-    
-    has_more = True if len(data) > PAGE_SIZE else False  # pagination flag
 
-    return jsonify({
-        'size': len(data[: PAGE_SIZE]),
-        'data': data[: PAGE_SIZE],
-        'has_more': has_more,
-        'error': False,
-        'meta': {'message': 'full pagination not implemented'}
-    })
+    return respond(orders_service.get_orders(get_store(), request.args))
 
-@app.route('/ds3500/api/v1/order', methods = ['GET'])
+@api.route('/ds3500/api/v1/order', methods = ['GET', 'POST'])
+@cached
 def get_order():
-    """Get an order using it's ID
+    """Get an order using it's ID, or several orders using a comma separated
+    list of IDs (GET) or a JSON list of IDs in the request body (POST)
     Returns:
         flask.Response: API response"""
 
-    ord_id = None
-
-    if 'id' in request.args:
-        try:
-            ord_id = int(request.args['id'])
-        except ValueError:
-            return abort(400, description = 'Invalid ID type')
-
-        for ord in data:
-            if ord['id'] == ord_id:
-                return jsonify({
-                    'size': 1,
-                    'data': [ord],
-                    'error': False
-                })
+    if request.method == 'POST':
+        body = request.get_json(silent = True)
+        ord_ids = body.get('ids') if isinstance(body, dict) else body
 
-        return no_content()
+        return respond(orders_service.get_orders_by_ids(get_store(), ord_ids))
 
-    else:
-        return abort(400, description = 'Missing order ID')
+    return respond(orders_service.get_order(get_store(), request.args))
 
-@app.route('/ds3500/api/v1/orders/priority', methods = ['GET'])
+@api.route('/ds3500/api/v1/orders/priority', methods = ['GET'])
+@cached
 def get_orders_by_priority():
-    """Get all orders of a certain priority value
+    """Get a page of orders of a certain priority value, and optionally of a certain date
+    (Note: pass the next_cursor of a page as the cursor parameter to get the next page)
     Returns:
         flask.Response: API response"""
 
-    ord_priority = None
-
-    if 'priority' in request.args:
-        try:
-            ord_priority = request.args['priority']
-
-            if ord_priority not in DatabaseSimulator.PRIORITIES:
-                raise PriorityValueError
+    return respond(orders_service.get_orders_by_priority(get_store(), request.args))
 
-        except PriorityValueError:
-            return abort(400, description = 'Invalid priority value')
+@api.route('/ds3500/api/v1/orders/changes', methods = ['GET'])
+@cached
+def get_order_changes():
+    """Get a page of the orders added after a change sequence, for incremental sync
+    (Note: pass the seq of a page as the since parameter to get the next page)
+    Returns:
+        flask.Response: API response"""
 
-        filtered_orders = []  # list of orders of the requested priority
+    return respond(orders_service.get_order_changes(get_store(), request.args))
 
-        for ord in data:
-            if ord['priority'] == ord_priority:
-                filtered_orders.append(ord)
+@api.route('/ds3500/api/v1/orders/next', methods = ['GET'])
+@cached
+def get_next_orders():
+    """Get the n highest ranked orders i.e. the next orders to process, in the same order
+    as the client's priority queue
+    Returns:
+        flask.Response: API response"""
 
-        has_more = True if len(filtered_orders) > PAGE_SIZE else False
+    return respond(orders_service.get_next_orders(get_store(), request.args))
 
-        if len(filtered_orders) > 0:
-            return jsonify({
-                'size': len(filtered_orders[: PAGE_SIZE]),
-                'data': filtered_orders[: PAGE_SIZE],
-                'has_more': has_more,
-                'error': False,
-                'meta': {'message': 'full pagination not implemented'}
-            })
-        else:
-            return no_content()
+@api.route('/ds3500/api/v1/orders/export', methods = ['GET'])
+def export_orders():
+    """Stream every order in ID order as newline delimited JSON (NDJSON), optionally
+    filtered by priority and/or date
+    (Note: the response is sent in chunks, so memory use does not grow with the number of orders)
+    Returns:
+        flask.Response: API response"""
 
-    else:
-        return abort(400, 'Missing priority value')
+    return Response(orders_service.export_orders(get_store(), request.args), mimetype = 'application/x-ndjson')
 
-def verify_key(api_key) -> bool:
-    """Verify the API key for v2 APIs
-    Parameters:
-        api_key (str): the API key
+@api.route('/metrics', methods = ['GET'])
+def metrics():
+    """Get the request metrics of this process in the Prometheus text format
     Returns:
-        bool: whether the key is valid or not"""
+        flask.Response: API response"""
 
-    try:
-        if len(api_key) == 5 and int(api_key) % 3 == 0:  # a valid key has 5 digits AND is divisible by 3 
-            return True
-        else:
-            return False
-    
-    except ValueError:
-        return False
+    return Response(get_metrics().render(len(get_store())), content_type = 'text/plain; version=0.0.4; charset=utf-8')
 
-@app.route('/ds3500/api/v2/orders', methods = ['GET'])
+@api.route('/ds3500/api/v2/orders', methods = ['GET'])
+@require_api_key
+@cached
 def get_orders_auth():
-    """Get all orders upto page limit after auth
-    (Note: full pagination not implemented)
+    """Get a page of orders in ID order after auth
+    (Note: pass the next_cursor of a page as the cursor parameter to get the next page)
     Returns:
         flask.Response: API response"""
 
-    api_key = request.headers.get('x-api-key', None)
-    
-    if api_key is not None and verify_key(api_key):  # key is present and valid
-        has_more = True if len(data) > PAGE_SIZE else False
-
-        return jsonify({
-            'size': len(data[: PAGE_SIZE]),
-            'data': data[: PAGE_SIZE],
-            'has_more': has_more,
-            'error': False,
-            'meta': {'message': 'full pagination not implemented'}
-        })
-
-    elif api_key is not None and not verify_key(api_key):  # key is present and invalid i.e. HTTP 401
-        return abort(401, description = 'Unauthorised')
-    else:  # key not present
-        return abort(401, description = 'Missing API key')
-
-@app.route('/ds3500/api/v2/add', methods = ['POST'])
+    return respond(orders_service.get_orders(get_store(), request.args))
+
+@api.route('/ds3500/api/v2/add', methods = ['POST'])
+@require_api_key
 def add_order():
     """Add an order after auth
     Returns:
         flask.Response: API response"""
 
-    api_key = request.headers.get('x-api-key', None)
-    
-    if api_key is not None and verify_key(api_key):  # key is present and valid
-        payload = dict(request.form)
-
-        if len(payload) != 4:
-            return abort(400, description = 'Invalid payload')
+    return respond(orders_service.add_order(get_store(), dict(request.form)))
 
-        try:
-            # technically, we should also check the payload keys and values
-            data.append({'id': int(payload['id']), 'priority': payload['priority'], 'date': payload['date'], 'quantity': int(payload['quantity'])})
-
-            res = jsonify({
-                'error': False,
-                'added': True,
-                'id': int(payload['id']),
-                'message': 'Added'
-            })
-            res.status_code = 201
-
-            return res
+@api.route('/ds3500/api/v2/add/bulk', methods = ['POST'])
+@require_api_key
+def add_orders():
+    """Add many orders in one request after auth, every valid order is added in one atomic step
+    and the response has the result of every row
+    Returns:
+        flask.Response: API response"""
 
-        except ValueError:
-            return abort(400, description = 'Invalid payload')
+    rows = orders_service.parse_bulk_payload(request.get_data(), request.mimetype)
 
-    elif api_key is not None and not verify_key(api_key):  # key is present and invalid i.e. HTTP 401
-        return abort(401, description = 'Unauthorised')
-    else:  # key not present
-        return abort(401, description = 'Missing API key')
+    return respond(orders_service.add_orders(get_store(), rows))
 
     
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    DS3500_STORE: Final = os.getenv('DS3500_STORE')  # unset to keep the orders in memory
+    DS3500_DEBUG: Final = os.getenv('DS3500_DEBUG') == '1'
+    DS3500_API_KEYS: Final = os.getenv('DS3500_API_KEYS')  # comma separated, unset to accept keys by the DS3500 key rule
+    DS3500_RATE_LIMIT: Final = os.getenv('DS3500_RATE_LIMIT')  # requests/s and burst of every key, e.g. 10/20
+    DS3500_KEY_RATE_LIMITS: Final = os.getenv('DS3500_KEY_RATE_LIMITS')  # limits of specific keys, e.g. 12345=100/200
+    DS3500_COMPRESS_MIN_SIZE: Final = os.getenv('DS3500_COMPRESS_MIN_SIZE')  # smallest body to compress in bytes, or off
+
+    rate_limiter = open_rate_limiter(None, DS3500_RATE_LIMIT, DS3500_KEY_RATE_LIMITS)
+
+    create_app(DS3500_STORE, DS3500_DEBUG, open_key_store(DS3500_API_KEYS), rate_limiter, open_compression(DS3500_COMPRESS_MIN_SIZE)).run()
\ No newline at end of file
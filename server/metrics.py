@@ -0,0 +1,128 @@
+"""Request metrics of the DS3500 Orders API, in the Prometheus text format
+(Note: metrics are kept per process, with several workers every worker reports its own)"""
+
+import bisect
+import threading
+
+from typing import Final
+
+
+class Histogram():
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds) -> None:
+        """Constructor to initialise a histogram
+        Parameters:
+            bounds (tuple): the sorted upper bounds of the buckets
+        Returns:
+            None"""
+
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value) -> None:
+        """Count a value
+        Parameters:
+            value (float): the value
+        Returns:
+            None"""
+
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels) -> list:
+        """Get the lines of the histogram in the Prometheus text format
+        Parameters:
+            name (str): the metric name
+            labels (str): the labels, e.g. 'route="/",method="GET"'
+        Returns:
+            list: the lines"""
+
+        lines = []
+        cumulative = 0
+
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, self.total))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+
+        return lines
+
+class Metrics():
+
+    LATENCY_BOUNDS: Final = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # seconds
+    SIZE_BOUNDS: Final = (100, 1000, 10000, 100000, 1000000, 10000000)  # bytes
+
+    def __init__(self) -> None:
+        """Constructor to initialise the request metrics
+        Returns:
+            None"""
+
+        self.lock = threading.Lock()
+        self.latencies = {}  # (route, method) -> Histogram
+        self.sizes = {}  # (route, method) -> Histogram
+        self.requests = {}  # (route, method, status code) -> count
+
+    def observe(self, route, method, status_code, seconds, size = None) -> None:
+        """Record a request
+        Parameters:
+            route (str): the route, e.g. '/ds3500/api/v1/orders'
+            method (str): the HTTP method
+            status_code (int): the status code of the response
+            seconds (float): the time taken to build the response
+            size (int): the size of the response body in bytes (default: None i.e. unknown, e.g. streamed)
+        Returns:
+            None"""
+
+        key = (route, method)
+
+        with self.lock:
+            latencies = self.latencies.get(key)
+
+            if latencies is None:
+                latencies = self.latencies[key] = Histogram(self.LATENCY_BOUNDS)
+                self.sizes[key] = Histogram(self.SIZE_BOUNDS)
+
+            latencies.observe(seconds)
+
+            if size is not None:
+                self.sizes[key].observe(size)
+
+            self.requests[key + (status_code,)] = self.requests.get(key + (status_code,), 0) + 1
+
+    def render(self, orders = None) -> str:
+        """Get the metrics in the Prometheus text format
+        Parameters:
+            orders (int): the number of stored orders (default: None i.e. not reported)
+        Returns:
+            str: the metrics"""
+
+        lines = [
+            '# HELP ds3500_requests_total Requests by route, method and status code.',
+            '# TYPE ds3500_requests_total counter'
+        ]
+
+        with self.lock:
+            for (route, method, status_code), count in sorted(self.requests.items()):
+                lines.append('ds3500_requests_total{{route="{}",method="{}",status="{}"}} {}'.format(route, method, status_code, count))
+
+            for name, help, histograms in (('ds3500_request_duration_seconds', 'Time taken to build a response.', self.latencies),
+                                           ('ds3500_response_size_bytes', 'Size of a response body.', self.sizes)):
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} histogram'.format(name))
+
+                for (route, method), histogram in sorted(histograms.items()):
+                    lines.extend(histogram.render(name, 'route="{}",method="{}"'.format(route, method)))
+
+        if orders is not None:
+            lines.append('# HELP ds3500_orders Number of stored orders.')
+            lines.append('# TYPE ds3500_orders gauge')
+            lines.append('ds3500_orders {}'.format(orders))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,288 @@
+"""In-memory indexes over the DS3500 Orders API data"""
+
+import threading
+
+from api_errors import DuplicateOrderError
+from bisect import bisect_right, insort
+from order_store import is_ranked, OrderStore, rank, rank_id
+from typing import Final
+
+
+class IdOrderedList():
+    def __init__(self, orders = ()) -> None:
+        """Constructor to initialise a list of orders kept sorted by ID
+        (Note: readers take no lock, so the IDs and the orders are read together from state,
+        and a batch is either appended in place orders first, or merged into new lists that
+        replace state in one assignment)
+        Parameters:
+            orders (iterable): the orders to start with (default: ())
+        Returns:
+            None"""
+
+        records = sorted(orders, key = lambda o: o['id'])
+        self.state = ([o['id'] for o in records], records)  # the IDs and the orders, position by position
+
+    def __len__(self) -> int:
+        """Get the number of orders in the list
+        Returns:
+            int: the number of orders"""
+
+        return len(self.state[0])
+
+    def add_many(self, orders) -> None:
+        """Add orders at their positions in ID order, in O(k) if every ID is bigger than the
+        last one (the common case, IDs are increasing), else by merging them in O(n + k log n)
+        Parameters:
+            orders (list): the orders to add, sorted by ID
+        Returns:
+            None"""
+
+        ids, records = self.state
+
+        if len(orders) == 0:
+            return
+
+        if len(ids) == 0 or orders[0]['id'] > ids[-1]:
+            records.extend(orders)  # before the IDs, so a reader never finds an ID without its order
+            ids.extend(o['id'] for o in orders)
+            return
+
+        new_ids, new_records = [], []
+        start = 0
+
+        for order in orders:  # copies the runs of existing orders between the new ones
+            pos = bisect_right(ids, order['id'], start)
+            new_ids += ids[start: pos]
+            new_records += records[start: pos]
+            new_ids.append(order['id'])
+            new_records.append(order)
+            start = pos
+
+        new_ids += ids[start:]
+        new_records += records[start:]
+
+        self.state = (new_ids, new_records)
+
+    def page(self, after_id = None, limit = 50) -> tuple:
+        """Get a page of orders in ID order in O(log n + page size)
+        Parameters:
+            after_id (int): the last ID of the previous page (default: None i.e. the first page)
+            limit (int): the maximum number of orders in the page (default: 50)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the last ID of the page at index 1 (None if there are no more orders)"""
+
+        ids, records = self.state
+        n = len(ids)  # orders appended after this are left for the next page
+
+        start = 0 if after_id is None else bisect_right(ids, after_id)
+        orders = records[start: min(start + limit, n)]
+
+        if start + limit < n:
+            return orders, orders[-1]['id']
+        else:
+            return orders, None
+
+class RankOrderedList():
+
+    MAX_INSERTS: Final = 64  # bigger batches are merged in with one sort
+
+    def __init__(self, by_id, orders = ()) -> None:
+        """Constructor to initialise a list of orders kept sorted by rank (see order_store.rank),
+        orders that are not ranked are left out
+        Parameters:
+            by_id (dict): the ID -> order lookup of the store, used to read the ranked orders
+            orders (iterable): the orders to start with (default: ())
+        Returns:
+            None"""
+
+        self.by_id = by_id
+        self.ranks = sorted(rank(o) for o in orders if is_ranked(o))  # ints compare faster than (rank, order) pairs, the ID is in the low bits
+
+    def __len__(self) -> int:
+        """Get the number of orders in the list
+        Returns:
+            int: the number of orders"""
+
+        return len(self.ranks)
+
+    def add_many(self, orders) -> None:
+        """Insert orders at their positions in rank order, one at a time for small batches, or by
+        merging the sorted batch in O(n + k log k) for bigger ones (Note: an insert is a binary
+        search plus an O(n) shift of the list, a memmove that is cheap next to the batch's other
+        work up to millions of orders, so a heap or tree is not worth its slower top(n))
+        Parameters:
+            orders (list): the orders to add
+        Returns:
+            None"""
+
+        orders = [o for o in orders if is_ranked(o)]
+
+        if len(orders) <= self.MAX_INSERTS:
+            for order in orders:
+                insort(self.ranks, rank(order))
+        else:
+            ranks = self.ranks + sorted(map(rank, orders))
+            ranks.sort()  # two sorted runs, so the sort is a linear merge
+            self.ranks = ranks  # a list being sorted looks empty, so readers get the new list when it is done
+
+    def top(self, n) -> list:
+        """Get the n highest ranked orders in O(n)
+        Parameters:
+            n (int): the number of orders
+        Returns:
+            list: the orders, highest ranked first"""
+
+        return [self.by_id[rank_id(order_rank)] for order_rank in self.ranks[: n]]
+
+class OrderIndex(OrderStore):
+    def __init__(self, data) -> None:
+        """Constructor to initialise an in-memory order store with indexes over a list of orders
+        Parameters:
+            data (list): a list of dictionaries of orders [{id: int, priority: str, date: ISO 8601 str, quantity: int}]
+        Returns:
+            None"""
+
+        self.data = data  # insertion order, shared with the caller, append only: the position of an order is its change sequence
+        self.lock = threading.Lock()  # serialises writes
+
+        self.by_id = {o['id']: o for o in data}  # hash index, ID -> order
+        self.in_id_order = IdOrderedList(data)
+        self.by_rank = RankOrderedList(self.by_id, data)
+
+        # secondary indexes, each key -> IdOrderedList
+        self.by_priority = {}
+        self.by_date = {}
+        self.by_priority_date = {}
+
+        self._add_secondary(self.in_id_order.state[1])
+
+    def _add_secondary(self, orders) -> None:
+        """Add orders to the secondary indexes, one merge per index key
+        Parameters:
+            orders (list): the orders to add, sorted by ID
+        Returns:
+            None"""
+
+        by_priority, by_date, by_priority_date = {}, {}, {}
+
+        for order in orders:  # the groups stay sorted by ID
+            priority, o_date = order['priority'], order['date']
+
+            by_priority.setdefault(priority, []).append(order)
+            by_date.setdefault(o_date, []).append(order)
+            by_priority_date.setdefault((priority, o_date), []).append(order)
+
+        for index, groups in ((self.by_priority, by_priority), (self.by_date, by_date), (self.by_priority_date, by_priority_date)):
+            for key, group in groups.items():
+                if key not in index:
+                    index[key] = IdOrderedList(group)
+                else:
+                    index[key].add_many(group)
+
+    def add_many(self, orders) -> None:
+        """Add several orders to the data and the indexes atomically, either all orders are added or none
+        Parameters:
+            orders (list): the orders to add
+        Returns:
+            None
+        Raises:
+            DuplicateOrderError: an order ID already exists or is repeated"""
+
+        with self.lock:
+            ids = {o['id'] for o in orders}
+
+            if len(ids) != len(orders) or not ids.isdisjoint(self.by_id):
+                raise DuplicateOrderError
+
+            batch = sorted(orders, key = lambda o: o['id'])  # merged into every index in one pass
+
+            self.by_id.update((o['id'], o) for o in batch)
+            self.in_id_order.add_many(batch)
+            self._add_secondary(batch)
+            self.by_rank.add_many(orders)
+            self.data.extend(orders)  # last, so a reader that sees the new seq/version finds the orders in every index
+
+    def get(self, o_id) -> dict:
+        """Get an order using its ID in O(1)
+        Parameters:
+            o_id (int): the order ID
+        Returns:
+            dict: the order (or None)"""
+
+        return self.by_id.get(o_id)
+
+    def get_many(self, ids) -> tuple:
+        """Get several orders using their IDs
+        Parameters:
+            ids (list): the order IDs
+        Returns:
+            tuple: a tuple with the list of orders found at index 0 and
+            the list of IDs not found at index 1"""
+
+        found, missing = [], []
+
+        for o_id in ids:
+            order = self.by_id.get(o_id)
+
+            if order is not None:
+                found.append(order)
+            else:
+                missing.append(o_id)
+
+        return found, missing
+
+    def seq(self) -> int:
+        """Get the change sequence of the latest order
+        Returns:
+            int: the change sequence (the number of orders added so far)"""
+
+        return len(self.data)
+
+    def changes(self, since = 0, limit = 50) -> tuple:
+        """Get the orders added after a change sequence in O(page size)
+        Parameters:
+            since (int): the last change sequence seen (default: 0 i.e. all orders)
+            limit (int): the maximum number of orders (default: 50)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the change sequence of the last order in the list at index 1"""
+
+        orders = self.data[since: since + limit]
+
+        return orders, since + len(orders)
+
+    def top(self, n = 50) -> list:
+        """Get the n highest ranked orders in O(n) using the rank index
+        Parameters:
+            n (int): the number of orders (default: 50)
+        Returns:
+            list: the orders, highest ranked first"""
+
+        return self.by_rank.top(n)
+
+    def page(self, after_id = None, limit = 50, priority = None, date = None) -> tuple:
+        """Get a page of orders in ID order, optionally filtered by priority and/or date,
+        in O(log n + page size) using the matching index
+        Parameters:
+            after_id (int): the last ID of the previous page (default: None i.e. the first page)
+            limit (int): the maximum number of orders in the page (default: 50)
+            priority (str): only get orders of this priority (default: None)
+            date (ISO 8601 str): only get orders of this date (default: None)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the last ID of the page at index 1 (None if there are no more orders)"""
+
+        if priority is not None and date is not None:
+            orders = self.by_priority_date.get((priority, date))
+        elif priority is not None:
+            orders = self.by_priority.get(priority)
+        elif date is not None:
+            orders = self.by_date.get(date)
+        else:
+            orders = self.in_id_order
+
+        if orders is None:
+            return [], None
+
+        return orders.page(after_id, limit)
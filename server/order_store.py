@@ -0,0 +1,174 @@
+"""Storage backends for the DS3500 Orders API"""
+
+import datetime
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Final
+
+
+PRIORITY_RANKS: Final = {'H': 0, 'M': 1, 'L': 2}  # orders with another priority are not ranked, the client rejects them
+MIN_INT: Final = -2 ** 63  # IDs and quantities fit in an int64, as SQLite stores integers (see orders_service.parse_order)
+MAX_INT: Final = 2 ** 63 - 1
+ORDINAL_BITS: Final = 22  # day ordinals up to the year 9999 fit in 22 bits
+
+@lru_cache(maxsize = 4096)  # orders repeat the same few dates
+def date_ordinal(iso_date) -> int:
+    """Get the day ordinal of a stored date
+    Parameters:
+        iso_date (str): the date, normalised to YYYY-MM-DD
+    Returns:
+        int: the proleptic Gregorian ordinal of the date"""
+
+    return datetime.date.fromisoformat(iso_date).toordinal()
+
+def rank(order) -> int:
+    """Get the rank of an order i.e. priority H > M > L, then old > new, then more > less,
+    then smaller ID > bigger ID, packed into one int so comparing two ranks compares two
+    ints. The API stores dates as normalised ISO 8601 dates (YYYY-MM-DD), so orders are
+    compared by day, and the ranking is the same as the client's Order.get_rank
+    Parameters:
+        order (dict): the order, with a priority in PRIORITY_RANKS
+    Returns:
+        int: the rank, the highest ranked order has the smallest rank"""
+
+    key = PRIORITY_RANKS[order['priority']] << ORDINAL_BITS | date_ordinal(order['date'])
+
+    return ((key << 63 | (MAX_INT - order['quantity'])) << 64) | (order['id'] - MIN_INT)
+
+def rank_id(order_rank) -> int:
+    """Get the order ID of a rank
+    Parameters:
+        order_rank (int): the rank, see rank
+    Returns:
+        int: the order ID"""
+
+    return (order_rank & (2 ** 64 - 1)) + MIN_INT
+
+def is_ranked(order) -> bool:
+    """Checks if an order is ranked i.e. served by OrderStore.top
+    Parameters:
+        order (dict): the order
+    Returns:
+        bool: whether the order has a priority in PRIORITY_RANKS"""
+
+    return order['priority'] in PRIORITY_RANKS
+
+
+class OrderStore(ABC):
+    """Base class for order storage backends, a backend must implement every abstract method
+    (Note: stores are append only, the change sequence of an order is its position in insertion order)"""
+
+    def __len__(self) -> int:
+        """Get the number of stored orders
+        Returns:
+            int: the number of orders"""
+
+        return self.seq()
+
+    @abstractmethod
+    def seq(self) -> int:
+        """Get the change sequence of the latest order
+        Returns:
+            int: the change sequence (the number of orders added so far)"""
+
+    def version(self) -> int:
+        """Get the version of the stored data, it changes whenever orders are added
+        Returns:
+            int: the version"""
+
+        return self.seq()
+
+    def add(self, order) -> None:
+        """Add an order
+        Parameters:
+            order (dict): the order to add
+        Returns:
+            None
+        Raises:
+            DuplicateOrderError: an order with the same ID already exists"""
+
+        self.add_many([order])
+
+    @abstractmethod
+    def add_many(self, orders) -> None:
+        """Add several orders atomically, either all orders are added or none
+        Parameters:
+            orders (list): the orders to add
+        Returns:
+            None
+        Raises:
+            DuplicateOrderError: an order ID already exists or is repeated"""
+
+    def get(self, o_id) -> dict:
+        """Get an order using its ID
+        Parameters:
+            o_id (int): the order ID
+        Returns:
+            dict: the order (or None)"""
+
+        found, _ = self.get_many([o_id])
+
+        return found[0] if len(found) > 0 else None
+
+    @abstractmethod
+    def get_many(self, ids) -> tuple:
+        """Get several orders using their IDs
+        Parameters:
+            ids (list): the order IDs
+        Returns:
+            tuple: a tuple with the list of orders found at index 0 and
+            the list of IDs not found at index 1"""
+
+    @abstractmethod
+    def changes(self, since = 0, limit = 50) -> tuple:
+        """Get the orders added after a change sequence
+        Parameters:
+            since (int): the last change sequence seen (default: 0 i.e. all orders)
+            limit (int): the maximum number of orders (default: 50)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the change sequence of the last order in the list at index 1"""
+
+    @abstractmethod
+    def top(self, n = 50) -> list:
+        """Get the n highest ranked orders (see rank), orders that are not ranked are skipped
+        Parameters:
+            n (int): the number of orders (default: 50)
+        Returns:
+            list: the orders, highest ranked first"""
+
+    @abstractmethod
+    def page(self, after_id = None, limit = 50, priority = None, date = None) -> tuple:
+        """Get a page of orders in ID order, optionally filtered by priority and/or date
+        Parameters:
+            after_id (int): the last ID of the previous page (default: None i.e. the first page)
+            limit (int): the maximum number of orders in the page (default: 50)
+            priority (str): only get orders of this priority (default: None)
+            date (ISO 8601 str): only get orders of this date (default: None)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the last ID of the page at index 1 (None if there are no more orders)"""
+
+def open_store(url = None) -> OrderStore:
+    """Open the storage backend for a URL
+    Parameters:
+        url (str): 'memory' for an in-memory store, or 'sqlite:///path/to/orders.db'
+        for an SQLite store (default: None i.e. in-memory)
+    Returns:
+        OrderStore: the store
+    Raises:
+        ValueError: the URL is not supported"""
+
+    if url is None or url == '' or url == 'memory':
+        from order_index import OrderIndex
+
+        return OrderIndex([])
+
+    elif url.startswith('sqlite:///'):
+        from sqlite_store import SQLiteOrderStore
+
+        return SQLiteOrderStore(url[len('sqlite:///'):])
+
+    else:
+        raise ValueError('Unsupported store URL: {}'.format(url))
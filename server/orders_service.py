@@ -0,0 +1,486 @@
+"""Request handling logic of the DS3500 Orders API, shared by the WSGI app (full_api)
+and the ASGI app (async_api)
+
+Every handler takes the order store and the request arguments, and returns a tuple with
+the HTTP status code at index 0 and the JSON payload (None for a 204) at index 1, or
+raises a RequestError."""
+
+import base64
+import binascii
+import datetime
+import json
+
+from api_errors import DuplicateOrderError, PriorityValueError, RequestError
+from database_simulator import DatabaseSimulator
+from functools import lru_cache
+from order_store import MAX_INT, MIN_INT, open_store, OrderStore
+from typing import Final
+
+
+# define constants
+PAGE_SIZE: Final = 50  # API page size
+MAX_PAGE_SIZE: Final = 500  # largest page a client can request with the limit parameter
+MAX_BULK_SIZE: Final = 100000  # largest number of orders in a bulk add
+EXPORT_CHUNK_SIZE: Final = 1000  # orders read from the store per chunk of an export
+ORDER_FIELDS: Final = frozenset(('id', 'priority', 'date', 'quantity'))  # the fields of an order, no more, no less
+
+def open_seeded_store(store_url) -> OrderStore:
+    """Open the order store, and seed it with 20 orders if it is empty
+    Parameters:
+        store_url (str): the order store URL, see open_store
+    Returns:
+        OrderStore: the order store"""
+
+    # orders [{id: int, priority: str, date: ISO 8601 str, quantity: int}]
+    store = open_store(store_url)
+
+    if len(store) == 0:
+        try:
+            DatabaseSimulator(20).seed_store(store)  # start with 20 orders
+        except DuplicateOrderError:  # another worker seeded the shared store first
+            pass
+
+    return store
+
+def error_payload(message) -> dict:
+    """Get the JSON payload of an error response
+    Parameters:
+        message (str): the error message
+    Returns:
+        dict: the payload"""
+
+    return {'error': True, 'message': message}
+
+@lru_cache(maxsize = 4096)  # orders repeat the same few dates
+def normalise_date(ord_date) -> str:
+    """Normalise an ISO 8601 date to YYYY-MM-DD, the format of the stored dates
+    Parameters:
+        ord_date (ISO 8601 str): the date, e.g. 20211019
+    Returns:
+        str: the normalised date, e.g. 2021-10-19
+    Raises:
+        TypeError: the date is not a str
+        ValueError: the date is invalid"""
+
+    return datetime.date.fromisoformat(ord_date).isoformat()
+
+def encode_cursor(after_id) -> str:
+    """Encode the last ID of a page as an opaque cursor
+    Parameters:
+        after_id (int): the last ID of the page (or None)
+    Returns:
+        str: the cursor (or None)"""
+
+    if after_id is None:
+        return None
+
+    return base64.urlsafe_b64encode(str(after_id).encode()).decode()
+
+def decode_cursor(cursor) -> int:
+    """Decode an opaque cursor into the last ID of a page
+    Parameters:
+        cursor (str): the cursor
+    Returns:
+        int: the last ID of the page
+    Raises:
+        ValueError: the cursor is invalid"""
+
+    try:
+        return parse_order_id(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def get_page_args(args) -> tuple:
+    """Get the pagination parameters (cursor, limit) of a request
+    Parameters:
+        args (dict): the query parameters
+    Returns:
+        tuple: a tuple with the last ID of the previous page (or None) at index 0 and the page size at index 1"""
+
+    after_id = None
+
+    if 'cursor' in args:
+        try:
+            after_id = decode_cursor(args['cursor'])
+        except ValueError:
+            raise RequestError(400, 'Invalid cursor')
+
+    try:
+        limit = int(args.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise RequestError(400, 'Invalid limit')
+
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise RequestError(400, 'Limit must be between 1 and {}'.format(MAX_PAGE_SIZE))
+
+    return after_id, limit
+
+def get_filter_args(args) -> tuple:
+    """Get the filter parameters (priority, date) of a request
+    Parameters:
+        args (dict): the query parameters
+    Returns:
+        tuple: a tuple with the priority (or None) at index 0 and the date normalised to
+        YYYY-MM-DD like the stored dates (or None) at index 1"""
+
+    ord_priority = args.get('priority', None)
+    ord_date = args.get('date', None)
+
+    try:
+        if ord_priority is not None and ord_priority not in DatabaseSimulator.PRIORITIES:
+            raise PriorityValueError
+
+    except PriorityValueError:
+        raise RequestError(400, 'Invalid priority value')
+
+    if ord_date is not None:
+        try:
+            ord_date = normalise_date(ord_date)  # e.g. 20211019 -> 2021-10-19
+        except ValueError:
+            raise RequestError(400, 'Invalid date value')
+
+    return ord_priority, ord_date
+
+def get_orders(store, args, priority = None, date = None) -> tuple:
+    """Get the page of orders requested with the cursor and limit parameters
+    Parameters:
+        store (OrderStore): the order store
+        args (dict): the query parameters
+        priority (str): only get orders of this priority (default: None)
+        date (ISO 8601 str): only get orders of this date (default: None)
+    Returns:
+        tuple: the status code and the payload"""
+
+    after_id, limit = get_page_args(args)
+    orders, last_id = store.page(after_id, limit, priority = priority, date = date)
+
+    if len(orders) == 0 and (priority is not None or date is not None):
+        return 204, None
+
+    return 200, {
+        'size': len(orders),
+        'data': orders,
+        'has_more': last_id is not None,
+        'next_cursor': encode_cursor(last_id),
+        'error': False
+    }
+
+def get_order(store, args) -> tuple:
+    """Get an order using it's ID, or several orders using a comma separated list of IDs
+    Parameters:
+        store (OrderStore): the order store
+        args (dict): the query parameters
+    Returns:
+        tuple: the status code and the payload"""
+
+    if 'id' not in args:
+        raise RequestError(400, 'Missing order ID')
+
+    ord_ids = args['id'].split(',')
+
+    if len(ord_ids) > 1:
+        return get_orders_by_ids(store, ord_ids)
+
+    try:
+        ord = store.get(parse_order_id(ord_ids[0]))
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+    if ord is None:
+        return 204, None
+
+    return 200, {
+        'size': 1,
+        'data': [ord],
+        'error': False
+    }
+
+def parse_order_id(ord_id) -> int:
+    """Check an order ID, from a query string (str) or a JSON payload (int, as parse_order checks it)
+    Parameters:
+        ord_id (str or int): the order ID
+    Returns:
+        int: the order ID
+    Raises:
+        ValueError: the order ID is not an integer, or does not fit in an int64"""
+
+    if isinstance(ord_id, str):
+        try:
+            ord_id = int(ord_id)
+        except ValueError:
+            raise ValueError('Invalid ID type')
+
+    if not isinstance(ord_id, int) or isinstance(ord_id, bool):  # e.g. 1.5 or true
+        raise ValueError('Invalid ID type')
+
+    if not MIN_INT <= ord_id <= MAX_INT:  # e.g. 2 ** 63, which no store can hold
+        raise ValueError('Invalid ID value')
+
+    return ord_id
+
+def get_orders_by_ids(store, ord_ids) -> tuple:
+    """Get several orders using their IDs
+    Parameters:
+        store (OrderStore): the order store
+        ord_ids (list): the order IDs
+    Returns:
+        tuple: the status code and the payload"""
+
+    if not isinstance(ord_ids, list):
+        raise RequestError(400, 'Missing order IDs')
+
+    if len(ord_ids) > MAX_PAGE_SIZE:
+        raise RequestError(400, 'Too many IDs (max {})'.format(MAX_PAGE_SIZE))
+
+    try:
+        ord_ids = [parse_order_id(ord_id) for ord_id in ord_ids]
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+    found, missing = store.get_many(ord_ids)
+
+    if len(found) > 0:
+        return 200, {
+            'size': len(found),
+            'data': found,
+            'missing': missing,
+            'error': False
+        }
+    else:
+        return 204, None
+
+def get_orders_by_priority(store, args) -> tuple:
+    """Get a page of orders of a certain priority value, and optionally of a certain date
+    Parameters:
+        store (OrderStore): the order store
+        args (dict): the query parameters
+    Returns:
+        tuple: the status code and the payload"""
+
+    if 'priority' in args:
+        ord_priority, ord_date = get_filter_args(args)
+
+        return get_orders(store, args, priority = ord_priority, date = ord_date)  # served from the priority (and date) index
+
+    else:
+        raise RequestError(400, 'Missing priority value')
+
+def get_order_changes(store, args) -> tuple:
+    """Get a page of the orders added after a change sequence, for incremental sync
+    Parameters:
+        store (OrderStore): the order store
+        args (dict): the query parameters
+    Returns:
+        tuple: the status code and the payload"""
+
+    try:
+        since = int(args.get('since', 0))
+    except ValueError:
+        raise RequestError(400, 'Invalid since value')
+
+    if since < 0:
+        raise RequestError(400, 'Invalid since value')
+
+    _, limit = get_page_args(args)
+    orders, seq = store.changes(min(since, store.seq()), limit)
+
+    return 200, {
+        'size': len(orders),
+        'data': orders,
+        'seq': seq,
+        'has_more': seq < store.seq(),
+        'error': False
+    }
+
+def get_next_orders(store, args) -> tuple:
+    """Get the n highest ranked orders i.e. the next orders to process (priority H > M > L,
+    then old > new, then more > less, then smaller ID > bigger ID)
+    Parameters:
+        store (OrderStore): the order store
+        args (dict): the query parameters
+    Returns:
+        tuple: the status code and the payload"""
+
+    try:
+        n = int(args.get('n', PAGE_SIZE))
+    except ValueError:
+        raise RequestError(400, 'Invalid n')
+
+    if not 1 <= n <= MAX_PAGE_SIZE:
+        raise RequestError(400, 'n must be between 1 and {}'.format(MAX_PAGE_SIZE))
+
+    orders = store.top(n)  # kept in rank order by the store, so there is no sort
+
+    return 200, {
+        'size': len(orders),
+        'data': orders,
+        'error': False
+    }
+
+def export_orders(store, args):
+    """Get every order in ID order as chunks of newline delimited JSON (NDJSON), optionally
+    filtered by priority and/or date (the arguments are checked before the first chunk is read)
+    Parameters:
+        store (OrderStore): the order store
+        args (dict): the query parameters
+    Returns:
+        generator: a generator of NDJSON str chunks"""
+
+    ord_priority, ord_date = get_filter_args(args)
+
+    def generate():
+        orders, last_id = store.page(None, EXPORT_CHUNK_SIZE, priority = ord_priority, date = ord_date)
+
+        while len(orders) > 0:
+            yield ''.join(json.dumps(ord) + '\n' for ord in orders)
+
+            if last_id is None:
+                return
+
+            orders, last_id = store.page(last_id, EXPORT_CHUNK_SIZE, priority = ord_priority, date = ord_date)
+
+    return generate()
+
+def add_order(store, payload) -> tuple:
+    """Add an order
+    Parameters:
+        store (OrderStore): the order store
+        payload (dict): the form fields of the order
+    Returns:
+        tuple: the status code and the payload"""
+
+    if len(payload) != 4:
+        raise RequestError(400, 'Invalid payload')
+
+    try:
+        row = {'id': int(payload['id']), 'priority': payload['priority'], 'date': payload['date'], 'quantity': int(payload['quantity'])}
+    except (KeyError, ValueError):
+        raise RequestError(400, 'Invalid payload')
+
+    try:
+        order = parse_order(row)  # the same checks as a bulk add
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+    try:
+        store.add(order)
+    except DuplicateOrderError:
+        raise RequestError(400, 'Duplicate ID')
+
+    return 201, {
+        'error': False,
+        'added': True,
+        'id': order['id'],
+        'message': 'Added'
+    }
+
+def parse_order(row) -> dict:
+    """Check an order of a bulk add and convert it to the stored format (the date is
+    normalised to YYYY-MM-DD, so stored dates sort and compare by day)
+    Parameters:
+        row (dict): the order {id: int, priority: str, date: ISO 8601 str, quantity: int}
+    Returns:
+        dict: the order
+    Raises:
+        ValueError: the order is invalid (the message says why)"""
+
+    if not isinstance(row, dict) or row.keys() != ORDER_FIELDS:
+        raise ValueError('Invalid payload')
+
+    o_id, quantity = row['id'], row['quantity']
+
+    if not isinstance(o_id, int) or isinstance(o_id, bool):
+        raise ValueError('Invalid id type')
+
+    if not isinstance(quantity, int) or isinstance(quantity, bool):
+        raise ValueError('Invalid quantity type')
+
+    if not MIN_INT <= o_id <= MAX_INT:
+        raise ValueError('Invalid id value')
+
+    if not 1 <= quantity <= MAX_INT:
+        raise ValueError('Invalid quantity value')
+
+    if row['priority'] not in DatabaseSimulator.PRIORITIES:
+        raise ValueError('Invalid priority value')
+
+    try:
+        ord_date = normalise_date(row['date'])
+    except (TypeError, ValueError):  # TypeError: not a str, e.g. a JSON list
+        raise ValueError('Invalid date value')
+
+    return {'id': o_id, 'priority': row['priority'], 'date': ord_date, 'quantity': quantity}
+
+def parse_bulk_payload(body, mimetype) -> list:
+    """Read the orders of a bulk add, sent as a JSON array or as NDJSON (one JSON order per line)
+    Parameters:
+        body (bytes): the request body
+        mimetype (str): the mimetype of the request body
+    Returns:
+        list: the orders"""
+
+    try:
+        if mimetype == 'application/x-ndjson':
+            rows = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            rows = json.loads(body)
+
+    except ValueError:  # includes json.decoder.JSONDecodeError and bad UTF-8
+        raise RequestError(400, 'Invalid payload')
+
+    if not isinstance(rows, list):
+        raise RequestError(400, 'Invalid payload')
+
+    if len(rows) > MAX_BULK_SIZE:
+        raise RequestError(400, 'Too many orders (max {})'.format(MAX_BULK_SIZE))
+
+    return rows
+
+def add_orders(store, rows) -> tuple:
+    """Add many orders, every valid order is added in one atomic step and
+    the payload has the result of every row
+    Parameters:
+        store (OrderStore): the order store
+        rows (list): the orders
+    Returns:
+        tuple: the status code and the payload"""
+
+    accepted, results = [], []
+    seen_ids = set()
+    orders = []
+
+    for row in rows:
+        try:
+            orders.append(parse_order(row))
+        except ValueError as e:  # kept in place of the order, for its result
+            orders.append(e)
+
+    # IDs already in the store, looked up in one batch (only valid IDs, a store may not take the others)
+    existing_ids = {ord['id'] for ord in store.get_many([o['id'] for o in orders if isinstance(o, dict)])[0]}
+
+    for i, (row, order) in enumerate(zip(rows, orders)):
+        o_id = row.get('id') if isinstance(row, dict) else None
+
+        if isinstance(order, ValueError):
+            results.append({'row': i, 'id': o_id, 'added': False, 'message': str(order)})
+            continue
+
+        if order['id'] in seen_ids or order['id'] in existing_ids:
+            results.append({'row': i, 'id': o_id, 'added': False, 'message': 'Duplicate ID'})
+            continue
+
+        seen_ids.add(order['id'])
+        accepted.append(order)
+        results.append({'row': i, 'id': o_id, 'added': True, 'message': 'Added'})
+
+    try:
+        store.add_many(accepted)
+    except DuplicateOrderError:  # a concurrent add took one of the IDs, nothing was added
+        raise RequestError(409, 'Duplicate ID added concurrently, retry the request')
+
+    return 201 if len(accepted) > 0 else 200, {
+        'error': False,
+        'added': len(accepted),
+        'rejected': len(rows) - len(accepted),
+        'results': results
+    }
@@ -0,0 +1,227 @@
+"""Per API key rate limiting (token buckets) for the v2 APIs of the DS3500 Orders API"""
+
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from api_errors import RateLimitError
+from typing import Final
+
+
+class RateLimitBackend(ABC):
+    """Base class for the stores of the token buckets"""
+
+    @abstractmethod
+    def take(self, key, rate, burst) -> float:
+        """Take a token from the bucket of a key, the bucket refills at rate tokens
+        per second up to burst tokens
+        Parameters:
+            key (str): the bucket key, e.g. the API key
+            rate (float): the refill rate in tokens per second
+            burst (int): the bucket size
+        Returns:
+            float: 0 if a token was taken, else the seconds until a token is available"""
+
+class MemoryBackend(RateLimitBackend):
+    """Token buckets of one process"""
+
+    def __init__(self) -> None:
+        """Constructor to initialise an in-memory token bucket store
+        Returns:
+            None"""
+
+        self.buckets = {}  # key -> (tokens, monotonic time of the last update)
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst) -> float:
+        """Take a token from the bucket of a key, the bucket refills at rate tokens
+        per second up to burst tokens
+        Parameters:
+            key (str): the bucket key, e.g. the API key
+            rate (float): the refill rate in tokens per second
+            burst (int): the bucket size
+        Returns:
+            float: 0 if a token was taken, else the seconds until a token is available"""
+
+        now = time.monotonic()
+
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return 0.0
+
+            self.buckets[key] = (tokens, now)
+
+        return (1 - tokens) / rate
+
+class SQLiteBackend(RateLimitBackend):
+    """Token buckets in an SQLite file, shared by every worker process using the same file"""
+
+    SCHEMA: Final = '''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,  -- SHA-256 of the bucket key
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL  -- UNIX time of the last update
+        );
+    '''
+
+    def __init__(self, path) -> None:
+        """Constructor to open (or create) an SQLite token bucket store
+        Parameters:
+            path (str): the path of the database file
+        Returns:
+            None"""
+
+        self.path = path
+        self.local = threading.local()  # one connection per thread
+
+        self.connection().executescript(self.SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread, opening it if needed
+        Returns:
+            sqlite3.Connection: the connection"""
+
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout = 30, isolation_level = None)  # transactions are explicit
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')  # losing the buckets on a crash only refills them
+            self.local.conn = conn
+
+        return conn
+
+    def take(self, key, rate, burst) -> float:
+        """Take a token from the bucket of a key, the bucket refills at rate tokens
+        per second up to burst tokens
+        Parameters:
+            key (str): the bucket key, e.g. the API key
+            rate (float): the refill rate in tokens per second
+            burst (int): the bucket size
+        Returns:
+            float: 0 if a token was taken, else the seconds until a token is available"""
+
+        key = hashlib.sha256(key.encode('utf-8', 'surrogatepass')).hexdigest()
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')  # one writer at a time, so concurrent workers cannot both take the last token
+
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+            if wait == 0.0:
+                tokens -= 1
+
+            conn.execute('INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            conn.execute('COMMIT')
+
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        return wait
+
+def open_backend(url = None) -> RateLimitBackend:
+    """Open the token bucket store for a URL
+    Parameters:
+        url (str): 'memory' for the buckets of this process, or 'sqlite:///path/to/limits.db'
+        for buckets shared by several processes (default: None i.e. memory)
+    Returns:
+        RateLimitBackend: the store
+    Raises:
+        ValueError: the URL is not supported"""
+
+    if url is None or url == '' or url == 'memory':
+        return MemoryBackend()
+
+    elif url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+
+    else:
+        raise ValueError('Unsupported rate limit store URL: {}'.format(url))
+
+class RateLimiter():
+
+    def __init__(self, backend = None, rate = 0.0, burst = 0, limits = None) -> None:
+        """Constructor to initialise a rate limiter with one token bucket per key
+        Parameters:
+            backend (RateLimitBackend): the token bucket store (default: None i.e. memory)
+            rate (float): the default number of requests per second, 0 for no limit (default: 0.0)
+            burst (int): the default number of requests allowed at once (default: 0)
+            limits (dict): limits of specific keys, key -> (rate, burst) (default: None i.e. none)
+        Returns:
+            None"""
+
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.rate = rate
+        self.burst = burst
+        self.limits = dict(limits) if limits is not None else {}
+
+    def check(self, key) -> None:
+        """Count a request of a key against its limit
+        Parameters:
+            key (str): the key, e.g. the API key
+        Returns:
+            None
+        Raises:
+            RateLimitError: the key is over its limit"""
+
+        rate, burst = self.limits.get(key, (self.rate, self.burst))
+
+        if rate <= 0:  # no limit
+            return
+
+        wait = self.backend.take(key, rate, burst)
+
+        if wait > 0:
+            raise RateLimitError(math.ceil(wait))
+
+def parse_limit(limit) -> tuple:
+    """Parse a limit
+    Parameters:
+        limit (str): the limit as rate/burst, e.g. '10/20' for 10 requests per second and bursts
+        of 20, or '0/0' for no limit
+    Returns:
+        tuple: the rate at index 0 and the burst at index 1
+    Raises:
+        ValueError: the limit is invalid"""
+
+    rate, burst = limit.split('/')
+    rate, burst = float(rate), int(burst)
+
+    if rate < 0 or (rate > 0 and burst < 1):  # a bucket smaller than one token never lets a request through
+        raise ValueError('Invalid rate limit: {}'.format(limit))
+
+    return rate, burst
+
+def open_rate_limiter(url = None, limit = None, key_limits = None) -> RateLimiter:
+    """Open a rate limiter from its settings, e.g. environment variables
+    Parameters:
+        url (str): the token bucket store URL, see open_backend (default: None i.e. memory)
+        limit (str): the default limit as rate/burst (default: None i.e. no limit)
+        key_limits (str): limits of specific keys as a comma separated list of key=rate/burst,
+        e.g. '12345=100/200,67890=1/5' (default: None)
+    Returns:
+        RateLimiter: the rate limiter
+    Raises:
+        ValueError: a setting is invalid"""
+
+    rate, burst = parse_limit(limit) if limit else (0.0, 0)
+    limits = {}
+
+    for item in (key_limits or '').split(','):
+        if item.strip() != '':
+            key, key_limit = item.split('=')
+            limits[key.strip()] = parse_limit(key_limit)
+
+    return RateLimiter(open_backend(url), rate, burst, limits)
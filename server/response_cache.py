@@ -0,0 +1,160 @@
+"""Cache of pre-serialised API responses, and the conditional GET handling shared by
+the WSGI app (full_api) and the ASGI app (async_api)"""
+
+import hashlib
+import threading
+
+from collections import OrderedDict
+from response_compression import compress
+
+
+# compress: function
+
+
+def cache_key(path, query, mimetype) -> tuple:
+    """Get the cache key of a GET response
+    Parameters:
+        path (str): the request path
+        query (iterable): the query parameters as (name, value) tuples, repeated names included
+        mimetype (str): the format of the orders, see columnar.negotiate
+    Returns:
+        tuple: the cache key"""
+
+    return path, tuple(sorted(query)), mimetype
+
+def etag_matches(if_none_match, etag) -> bool:
+    """Checks if an If-None-Match header matches an ETag, with the weak comparison
+    of RFC 9110 i.e. W/"x" matches "x"
+    Parameters:
+        if_none_match (str): the header (or None)
+        etag (str): the quoted ETag
+    Returns:
+        bool: whether the client's copy is current"""
+
+    if if_none_match is None:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+def conditional_response(entry, encoding, if_none_match) -> tuple:
+    """Get the response to a GET from a cached response, a 304 without a body if
+    the If-None-Match header matches its ETag
+    Parameters:
+        entry (CachedResponse): the cached response
+        encoding (str): the content encoding, see Compression.choose (or None)
+        if_none_match (str): the If-None-Match header (or None)
+    Returns:
+        tuple: the status code, the body and the headers as (name, value) tuples"""
+
+    body, etag = entry.variant(encoding)
+    etag = '"{}"'.format(etag)
+    headers = [('etag', etag), ('vary', 'Accept')]
+
+    if etag_matches(if_none_match, etag):
+        return 304, b'', headers
+
+    if encoding is not None:
+        headers.append(('content-encoding', encoding))  # the response is not compressed again
+
+    return 200, body, headers
+
+class CachedResponse():
+
+    __slots__ = ('version', 'body', 'mimetype', 'etag', 'encoded')
+
+    def __init__(self, version, body, mimetype) -> None:
+        """Constructor to initialise a cached response
+        Parameters:
+            version (int): the version of the data the response was built from
+            body (bytes): the encoded response body
+            mimetype (str): the mimetype of the response
+        Returns:
+            None"""
+
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.encoded = {}  # encoding -> compressed body, built on the first request for it
+
+    def variant(self, encoding) -> tuple:
+        """Get the body and ETag of the response in an encoding, compressing the body once per encoding
+        Parameters:
+            encoding (str): one of response_compression.ENCODINGS (or None for the body as is)
+        Returns:
+            tuple: a tuple with the body at index 0 and the ETag at index 1"""
+
+        if encoding is None:
+            return self.body, self.etag
+
+        body = self.encoded.get(encoding)
+
+        if body is None:  # two threads may both compress it, they store the same bytes
+            body = self.encoded[encoding] = compress(self.body, encoding)
+
+        return body, '{}-{}'.format(self.etag, encoding)  # every representation has its own ETag
+
+class ResponseCache():
+    def __init__(self, max_entries = 1024) -> None:
+        """Constructor to initialise a bounded LRU cache of responses
+        Parameters:
+            max_entries (int): the maximum number of cached responses (default: 1024)
+        Returns:
+            None"""
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version) -> CachedResponse:
+        """Get a cached response, responses built from an older version of the data are stale
+        Parameters:
+            key (tuple): the cache key
+            version (int): the current version of the data
+        Returns:
+            CachedResponse: the cached response (or None)"""
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry.version != version:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+            return entry
+
+    def put(self, key, version, body, mimetype) -> CachedResponse:
+        """Cache a response
+        Parameters:
+            key (tuple): the cache key
+            version (int): the version of the data the response was built from
+            body (bytes): the encoded response body
+            mimetype (str): the mimetype of the response
+        Returns:
+            CachedResponse: the cached response"""
+
+        entry = CachedResponse(version, body, mimetype)
+
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+
+        return entry
+
+    def clear(self) -> None:
+        """Clears the cache
+        Returns:
+            None"""
+
+        with self.lock:
+            self.entries.clear()
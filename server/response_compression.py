@@ -0,0 +1,149 @@
+"""Compression of API responses (Content-Encoding), negotiated with the Accept-Encoding header"""
+
+import zlib
+
+from typing import Final
+
+try:
+    import zstandard  # optional, zstd is only offered if it is installed
+except ImportError:
+    zstandard = None
+
+
+MIN_SIZE: Final = 1024  # smaller bodies are sent as is, compressing them saves less than it costs
+ZLIB_LEVEL: Final = 6
+ZSTD_LEVEL: Final = 3
+ZLIB_WBITS: Final = {'gzip': 31, 'deflate': 15}  # gzip container, zlib container (HTTP's deflate)
+
+# supported encodings, the first one wins when a client accepts several equally
+ENCODINGS: Final = (('zstd',) if zstandard is not None else ()) + ('gzip', 'deflate')
+
+def parse_quality(header) -> dict:
+    """Parse a header of values with q values, e.g. Accept-Encoding or Accept
+    Parameters:
+        header (str): the header (or None)
+    Returns:
+        dict: value (lower case, without its parameters) -> q value"""
+
+    quality = {}
+
+    for item in (header or '').split(','):
+        value, _, params = item.strip().partition(';')
+        q = 1.0
+
+        for param in params.split(';'):
+            name, _, param_value = param.strip().partition('=')
+
+            if name.strip() == 'q':
+                try:
+                    q = float(param_value)
+                except ValueError:
+                    q = 0.0
+
+        if value.strip():
+            quality[value.strip().lower()] = q
+
+    return quality
+
+def negotiate(accept_encoding) -> str:
+    """Choose the encoding of a response for an Accept-Encoding header
+    Parameters:
+        accept_encoding (str): the header (or None)
+    Returns:
+        str: one of ENCODINGS (or None to send the body as is)"""
+
+    quality = parse_quality(accept_encoding)
+    best, best_q = None, 0.0
+
+    for encoding in ENCODINGS:
+        q = quality.get(encoding, quality.get('*', 0.0))
+
+        if q > best_q:
+            best, best_q = encoding, q
+
+    return best
+
+def compress(body, encoding) -> bytes:
+    """Compress a response body
+    Parameters:
+        body (bytes): the body
+        encoding (str): one of ENCODINGS
+    Returns:
+        bytes: the compressed body"""
+
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level = ZSTD_LEVEL).compress(body)
+
+    compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, ZLIB_WBITS[encoding])
+
+    return compressor.compress(body) + compressor.flush()
+
+def compress_stream(chunks, encoding):
+    """Compress a streamed response body chunk by chunk, every chunk is flushed so the
+    client can decode the orders as they arrive
+    Parameters:
+        chunks (iterable): the chunks of the body (bytes or str)
+        encoding (str): one of ENCODINGS
+    Returns:
+        generator: a generator of compressed chunks"""
+
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level = ZSTD_LEVEL).compressobj()
+        sync_flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, ZLIB_WBITS[encoding])
+        sync_flush = zlib.Z_SYNC_FLUSH
+
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush(sync_flush)
+
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+class Compression():
+    def __init__(self, min_size = MIN_SIZE) -> None:
+        """Constructor to initialise the compression settings of an app
+        Parameters:
+            min_size (int): the smallest body to compress in bytes, None to never compress (default: 1024)
+        Returns:
+            None"""
+
+        self.min_size = min_size
+
+    def enabled(self) -> bool:
+        """Checks if responses are compressed at all
+        Returns:
+            bool: whether compression is on"""
+
+        return self.min_size is not None
+
+    def choose(self, accept_encoding, size = None) -> str:
+        """Choose the encoding of a response
+        Parameters:
+            accept_encoding (str): the Accept-Encoding header of the request (or None)
+            size (int): the size of the body, None if it is streamed (default: None)
+        Returns:
+            str: one of ENCODINGS (or None to send the body as is)"""
+
+        if not self.enabled() or (size is not None and size < self.min_size):
+            return None
+
+        return negotiate(accept_encoding)
+
+def open_compression(setting = None) -> Compression:
+    """Open the compression settings for a setting, e.g. an environment variable
+    Parameters:
+        setting (str): unset for the default threshold, 'off' to never compress, or
+        the smallest body to compress in bytes (default: None)
+    Returns:
+        Compression: the compression settings"""
+
+    if setting is None or setting == '':
+        return Compression()
+
+    if setting.lower() == 'off':
+        return Compression(None)
+
+    return Compression(int(setting))
@@ -0,0 +1,172 @@
+"""SQLite storage backend for the DS3500 Orders API"""
+
+import sqlite3
+import threading
+
+from api_errors import DuplicateOrderError
+from order_store import OrderStore
+from typing import Final
+
+
+class SQLiteOrderStore(OrderStore):
+
+    MAX_VARIABLES: Final = 500  # IDs per query, below SQLite's limit on query parameters
+
+    # order_store.rank as an SQL expression, indexed so the highest ranked orders are read without sorting
+    PRIORITY_RANK: Final = "CASE priority WHEN 'H' THEN 0 WHEN 'M' THEN 1 WHEN 'L' THEN 2 ELSE 3 END"  # 3 is not ranked
+    RANK: Final = PRIORITY_RANK + ', date, quantity DESC, id'
+
+    SCHEMA: Final = '''
+        CREATE TABLE IF NOT EXISTS orders (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- change sequence
+            id INTEGER NOT NULL UNIQUE,
+            priority TEXT NOT NULL,
+            date TEXT NOT NULL,
+            quantity INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS orders_priority ON orders (priority, id);
+        CREATE INDEX IF NOT EXISTS orders_date ON orders (date, id);
+        CREATE INDEX IF NOT EXISTS orders_priority_date ON orders (priority, date, id);
+        CREATE INDEX IF NOT EXISTS orders_rank ON orders ({});
+    '''.format(RANK)
+
+    def __init__(self, path) -> None:
+        """Constructor to open (or create) an SQLite order store, several threads and
+        processes can share the same file
+        Parameters:
+            path (str): the path of the database file
+        Returns:
+            None"""
+
+        self.path = path
+        self.local = threading.local()  # one connection per thread
+
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread, opening it if needed
+        Returns:
+            sqlite3.Connection: the connection"""
+
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout = 30)
+            conn.execute('PRAGMA journal_mode = WAL')  # readers do not block the writer
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self.local.conn = conn
+
+        return conn
+
+    def to_order(self, row) -> dict:
+        """Convert a row (id, priority, date, quantity, ...) to an order
+        Parameters:
+            row (tuple): the row
+        Returns:
+            dict: the order"""
+
+        return {'id': row[0], 'priority': row[1], 'date': row[2], 'quantity': row[3]}
+
+    def seq(self) -> int:
+        """Get the change sequence of the latest order
+        Returns:
+            int: the change sequence (the number of orders added so far)"""
+
+        return self.connection().execute('SELECT COALESCE(MAX(seq), 0) FROM orders').fetchone()[0]
+
+    def add_many(self, orders) -> None:
+        """Add several orders in one transaction, either all orders are added or none
+        Parameters:
+            orders (list): the orders to add
+        Returns:
+            None
+        Raises:
+            DuplicateOrderError: an order ID already exists or is repeated"""
+
+        try:
+            with self.connection() as conn:  # commits, or rolls back on an exception
+                conn.executemany('INSERT INTO orders (id, priority, date, quantity) VALUES (?, ?, ?, ?)',
+                                 ((o['id'], o['priority'], o['date'], o['quantity']) for o in orders))
+
+        except sqlite3.IntegrityError:
+            raise DuplicateOrderError
+
+    def get_many(self, ids) -> tuple:
+        """Get several orders using their IDs, through the unique ID index
+        Parameters:
+            ids (list): the order IDs
+        Returns:
+            tuple: a tuple with the list of orders found at index 0 and
+            the list of IDs not found at index 1"""
+
+        by_id = {}
+
+        for i in range(0, len(ids), self.MAX_VARIABLES):
+            batch = ids[i: i + self.MAX_VARIABLES]
+            query = 'SELECT id, priority, date, quantity FROM orders WHERE id IN ({})'.format(', '.join('?' * len(batch)))
+
+            for row in self.connection().execute(query, batch):
+                by_id[row[0]] = self.to_order(row)
+
+        found = [by_id[o_id] for o_id in ids if o_id in by_id]
+        missing = [o_id for o_id in ids if o_id not in by_id]
+
+        return found, missing
+
+    def changes(self, since = 0, limit = 50) -> tuple:
+        """Get the orders added after a change sequence, through the primary key
+        Parameters:
+            since (int): the last change sequence seen (default: 0 i.e. all orders)
+            limit (int): the maximum number of orders (default: 50)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the change sequence of the last order in the list at index 1"""
+
+        rows = self.connection().execute(
+            'SELECT id, priority, date, quantity, seq FROM orders WHERE seq > ? ORDER BY seq LIMIT ?', (since, limit)).fetchall()
+
+        if len(rows) == 0:
+            return [], since
+
+        return [self.to_order(row) for row in rows], rows[-1][4]
+
+    def top(self, n = 50) -> list:
+        """Get the n highest ranked orders, through the rank index (orders that are not ranked are skipped)
+        Parameters:
+            n (int): the number of orders (default: 50)
+        Returns:
+            list: the orders, highest ranked first"""
+
+        query = 'SELECT id, priority, date, quantity FROM orders WHERE {} < 3 ORDER BY {} LIMIT ?'.format(self.PRIORITY_RANK, self.RANK)
+
+        return [self.to_order(row) for row in self.connection().execute(query, (n,))]
+
+    def page(self, after_id = None, limit = 50, priority = None, date = None) -> tuple:
+        """Get a page of orders in ID order, optionally filtered by priority and/or date,
+        through the matching index
+        Parameters:
+            after_id (int): the last ID of the previous page (default: None i.e. the first page)
+            limit (int): the maximum number of orders in the page (default: 50)
+            priority (str): only get orders of this priority (default: None)
+            date (ISO 8601 str): only get orders of this date (default: None)
+        Returns:
+            tuple: a tuple with the list of orders at index 0 and
+            the last ID of the page at index 1 (None if there are no more orders)"""
+
+        conditions, args = [], []
+
+        for column, value in (('id >', after_id), ('priority =', priority), ('date =', date)):
+            if value is not None:
+                conditions.append(column + ' ?')
+                args.append(value)
+
+        where = 'WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+        query = 'SELECT id, priority, date, quantity FROM orders {} ORDER BY id LIMIT ?'.format(where)
+
+        orders = [self.to_order(row) for row in self.connection().execute(query, args + [limit + 1])]  # one extra row to check for more
+
+        if len(orders) > limit:
+            return orders[: limit], orders[limit - 1]['id']
+        else:
+            return orders, None
@@ -0,0 +1,27 @@
+"""WSGI entry point to serve the DS3500 Orders API with several worker processes, e.g.
+gunicorn --workers 4 --bind 127.0.0.1:5000 wsgi:app"""
+
+import os
+
+from auth import open_key_store
+from full_api import create_app
+from rate_limit import open_rate_limiter
+from response_compression import open_compression
+from typing import Final
+
+
+# workers share the orders through the store, so the default is an SQLite file rather than memory
+DS3500_STORE: Final = os.getenv('DS3500_STORE', 'sqlite:///orders.db')
+DS3500_DEBUG: Final = os.getenv('DS3500_DEBUG') == '1'  # never enable the debugger on a multi-worker server
+
+DS3500_API_KEYS: Final = os.getenv('DS3500_API_KEYS')  # comma separated, unset to accept keys by the DS3500 key rule
+
+DS3500_RATE_LIMIT: Final = os.getenv('DS3500_RATE_LIMIT')  # requests/s and burst of every key, e.g. 10/20
+DS3500_KEY_RATE_LIMITS: Final = os.getenv('DS3500_KEY_RATE_LIMITS')  # limits of specific keys, e.g. 12345=100/200
+DS3500_RATE_STORE: Final = os.getenv('DS3500_RATE_STORE')  # unset for per worker token buckets, a shared SQLite file costs a write per request
+
+DS3500_COMPRESS_MIN_SIZE: Final = os.getenv('DS3500_COMPRESS_MIN_SIZE')  # smallest body to compress in bytes, or off
+
+rate_limiter = open_rate_limiter(DS3500_RATE_STORE, DS3500_RATE_LIMIT, DS3500_KEY_RATE_LIMITS)
+
+app = create_app(DS3500_STORE, DS3500_DEBUG, open_key_store(DS3500_API_KEYS), rate_limiter, open_compression(DS3500_COMPRESS_MIN_SIZE))
@@ -0,0 +1,32 @@
+"""Shared fixtures of the DS3500 Orders API tests
+
+The server and client modules are imported by name, as when they run from their own
+directory, so both directories are put on the path."""
+
+import os
+import pytest
+import sys
+
+from typing import Final
+
+
+ROOT: Final = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, os.path.join(ROOT, 'client'))
+
+API_KEY: Final = '12345'  # valid by the DS3500 key rule (5 digits, divisible by 3)
+
+@pytest.fixture
+def app():
+    """An API app with its own in-memory store, seeded with orders 1 to 20"""
+
+    from full_api import create_app
+
+    return create_app()
+
+@pytest.fixture
+def client(app):
+    """A test client of the app"""
+
+    return app.test_client()
@@ -0,0 +1,68 @@
+"""API key verification of the v2 routes"""
+
+import pytest
+
+from auth import KeyVerifier, open_key_store, RuleKeyStore, StaticKeyStore
+from conftest import API_KEY
+from full_api import create_app
+
+
+class CountingKeyStore(StaticKeyStore):
+    """Counts the keys checked against the key store, i.e. the cache misses"""
+
+    def __init__(self, keys) -> None:
+        super().__init__(keys)
+        self.checks = 0
+
+    def is_valid(self, api_key) -> bool:
+        self.checks += 1
+        return super().is_valid(api_key)
+
+@pytest.mark.parametrize('headers, message', [
+    ({}, 'Missing API key'),
+    ({'x-api-key': '12346'}, 'Unauthorised'),  # not divisible by 3
+    ({'x-api-key': '123456'}, 'Unauthorised'),  # 6 digits
+    ({'x-api-key': 'abcde'}, 'Unauthorised')
+])
+def test_missing_and_invalid_keys_get_a_401(client, headers, message):
+    res = client.get('/ds3500/api/v2/orders', headers = headers)
+
+    assert (res.status_code, res.get_json()['message']) == (401, message)
+
+def test_valid_key(client):
+    assert client.get('/ds3500/api/v2/orders', headers = {'x-api-key': API_KEY}).status_code == 200
+
+def test_static_key_store():
+    app = create_app(key_store = open_key_store('secret-1, secret-2,'))
+    client = app.test_client()
+
+    assert client.get('/ds3500/api/v2/orders', headers = {'x-api-key': 'secret-2'}).status_code == 200
+    assert client.get('/ds3500/api/v2/orders', headers = {'x-api-key': API_KEY}).status_code == 401  # the key rule no longer applies
+
+    store = StaticKeyStore(['a', 'b'])
+
+    assert store.is_valid('a') and store.is_valid('b')
+    assert not store.is_valid('c') and not store.is_valid('')
+    assert b'a' not in store.digests  # only digests are kept
+
+def test_open_key_store():
+    assert isinstance(open_key_store(None), RuleKeyStore)
+    assert isinstance(open_key_store(' '), RuleKeyStore)
+    assert isinstance(open_key_store('a,b'), StaticKeyStore)
+
+def test_verifier_cache_is_an_lru_of_valid_keys():
+    store = CountingKeyStore(['a', 'b', 'c'])
+    verifier = KeyVerifier(store, max_entries = 2)
+
+    assert verifier.verify('a') and verifier.verify('b')
+    assert verifier.verify('a')  # cached, a is now the most recently used
+    assert store.checks == 2
+
+    assert verifier.verify('c')  # evicts b
+    assert len(verifier.valid_keys) == 2
+
+    assert verifier.verify('a') and store.checks == 3
+    assert verifier.verify('b') and store.checks == 4
+
+    assert not verifier.verify('x') and not verifier.verify('x')
+    assert store.checks == 6  # invalid keys are not cached
@@ -0,0 +1,127 @@
+"""Bulk add of orders, where the valid rows are added and the invalid ones are reported"""
+
+import json
+import orders_service
+import pytest
+
+from api_errors import RequestError
+from conftest import API_KEY
+from order_index import OrderIndex
+
+
+HEADERS = {'x-api-key': API_KEY}
+
+def order(o_id, priority = 'M', o_date = '2021-10-21', quantity = 10) -> dict:
+    """Build an order payload"""
+
+    return {'id': o_id, 'priority': priority, 'date': o_date, 'quantity': quantity}
+
+def test_partial_failure(client):
+    rows = [
+        order(21),
+        order(1),  # already in the store
+        order(22, priority = 'X'),
+        order(23, o_date = '2021-13-01'),
+        order(24, quantity = 0),
+        order(25, quantity = 1.5),
+        order(True),
+        order(21),  # repeated in the request
+        {'id': 26, 'priority': 'H'},
+        'not an order',
+        order(27, o_date = '20211021')  # normalised to 2021-10-21
+    ]
+
+    seeded = client.get('/ds3500/api/v1/order', query_string = {'id': 1}).get_json()['data'][0]
+    res = client.post('/ds3500/api/v2/add/bulk', json = rows, headers = HEADERS)
+    payload = res.get_json()
+
+    assert res.status_code == 201
+    assert (payload['added'], payload['rejected']) == (2, 9)
+    assert [r['row'] for r in payload['results']] == list(range(len(rows)))
+    assert [r['added'] for r in payload['results']] == [True] + [False] * 9 + [True]
+    assert [r['message'] for r in payload['results'][1:10]] == [
+        'Duplicate ID', 'Invalid priority value', 'Invalid date value', 'Invalid quantity value',
+        'Invalid quantity type', 'Invalid id type', 'Duplicate ID', 'Invalid payload', 'Invalid payload'
+    ]
+
+    stored = client.get('/ds3500/api/v1/order', query_string = {'id': '21,27,22,1'}).get_json()
+
+    assert [o['id'] for o in stored['data']] == [21, 27, 1]
+    assert stored['missing'] == [22]
+    assert stored['data'][0] == order(21)  # the first row with the ID, not the repeat
+    assert stored['data'][1]['date'] == '2021-10-21'
+    assert stored['data'][2] == seeded  # the duplicate did not replace it
+
+def test_nothing_added(client):
+    res = client.post('/ds3500/api/v2/add/bulk', json = [order(1), order(2)], headers = HEADERS)
+
+    assert res.status_code == 200
+    assert res.get_json()['added'] == 0
+    assert client.get('/ds3500/api/v1/orders/changes', query_string = {'since': 20}).get_json()['size'] == 0
+
+def test_ndjson(client):
+    body = '\n'.join(json.dumps(order(o_id)) for o_id in (30, 31, 32)) + '\n\n{"id": 33}\n'
+    res = client.post('/ds3500/api/v2/add/bulk', data = body, headers = dict(HEADERS, **{'Content-Type': 'application/x-ndjson'}))
+
+    assert res.status_code == 201
+    assert (res.get_json()['added'], res.get_json()['rejected']) == (3, 1)
+
+@pytest.mark.parametrize('body, content_type', [
+    ('{"id": 1}', 'application/json'),  # not a list
+    ('[{"id": 1}', 'application/json'),
+    ('{"id": 1}\nnot json\n', 'application/x-ndjson'),
+    (b'\xff\xfe', 'application/json')
+])
+def test_invalid_payload(client, body, content_type):
+    res = client.post('/ds3500/api/v2/add/bulk', data = body, headers = dict(HEADERS, **{'Content-Type': content_type}))
+
+    assert res.status_code == 400
+    assert res.get_json()['message'] == 'Invalid payload'
+
+def test_needs_an_api_key(client):
+    assert client.post('/ds3500/api/v2/add/bulk', json = [order(40)]).status_code == 401
+
+def test_too_many_orders(monkeypatch):
+    monkeypatch.setattr(orders_service, 'MAX_BULK_SIZE', 2)
+
+    with pytest.raises(RequestError) as e:
+        orders_service.parse_bulk_payload(json.dumps([order(1), order(2), order(3)]).encode(), 'application/json')
+
+    assert e.value.status_code == 400
+
+def test_concurrent_duplicate_adds_nothing():
+    class RacingStore(OrderIndex):
+        """A store where another request adds order 2 between the duplicate check and the write"""
+
+        def get_many(self, ids):
+            return [], list(ids)
+
+    store = RacingStore([order(2)])
+
+    with pytest.raises(RequestError) as e:
+        orders_service.add_orders(store, [order(1), order(2)])
+
+    assert e.value.status_code == 409
+    assert len(store) == 1 and store.get(1) is None
+
+@pytest.mark.parametrize('store_url', ['memory', 'sqlite'])
+def test_ids_outside_int64_are_rejected(tmp_path, store_url):
+    from full_api import create_app
+
+    app = create_app('sqlite:///{}'.format(tmp_path / 'orders.db') if store_url == 'sqlite' else store_url)
+    client = app.test_client()
+
+    res = client.get('/ds3500/api/v1/order', query_string = {'id': '99999999999999999999'})
+    assert (res.status_code, res.get_json()['message']) == (400, 'Invalid ID value')
+
+    res = client.get('/ds3500/api/v1/order', query_string = {'id': '1,{}'.format(-2 ** 63 - 1)})
+    assert res.status_code == 400
+
+    rows = [order(2 ** 63), order(21, quantity = 2 ** 63), order(-2 ** 63), order(2 ** 63 - 1)]
+    payload = client.post('/ds3500/api/v2/add/bulk', json = rows, headers = HEADERS).get_json()
+
+    assert [r['added'] for r in payload['results']] == [False, False, True, True]
+    assert [r['message'] for r in payload['results'][: 2]] == ['Invalid id value', 'Invalid quantity value']
+
+    res = client.get('/ds3500/api/v1/orders', query_string = {'cursor': orders_service.encode_cursor(2 ** 63)})
+    assert res.status_code == 400
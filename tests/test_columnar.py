@@ -0,0 +1,136 @@
+"""Round trip of the columnar response format, from server/columnar.py to the client's OrderBatch"""
+
+import columnar
+import json
+import numpy as np
+import pytest
+import struct
+
+from datetime import datetime
+from order import MICROSECONDS_PER_DAY, Order
+from order_batch import OrderBatch
+
+
+COLUMNAR = {'Accept': columnar.MIMETYPE}
+
+def decoded_orders(batch) -> list:
+    """Convert a batch back to order dictionaries"""
+
+    return [
+        {'id': int(o_id), 'priority': OrderBatch.PRIORITY_CODES[code], 'date': datetime.fromordinal(key // MICROSECONDS_PER_DAY).date().isoformat(), 'quantity': int(quantity)}
+        for o_id, code, key, quantity in zip(batch.ids, batch.priorities, batch.dates, batch.quantities)
+    ]
+
+def test_api_round_trip(client):
+    params = {'limit': 8}
+    expected = client.get('/ds3500/api/v1/orders', query_string = params).get_json()
+    res = client.get('/ds3500/api/v1/orders', query_string = params, headers = COLUMNAR)
+
+    assert res.mimetype == columnar.MIMETYPE
+    assert 'Accept' in res.headers['Vary']
+
+    batch, meta = OrderBatch.from_columns(res.data)
+    data = expected.pop('data')
+
+    assert meta == expected  # size, has_more, next_cursor and error
+    assert decoded_orders(batch) == data
+    assert batch.valid_mask().all()
+
+def test_matches_the_json_batch(client):
+    data = client.get('/ds3500/api/v1/orders/next', query_string = {'n': 20}).get_json()['data']
+    batch, _ = OrderBatch.from_columns(client.get('/ds3500/api/v1/orders/next', query_string = {'n': 20}, headers = COLUMNAR).data)
+    json_batch = OrderBatch.from_records(data)
+
+    for column in ('ids', 'priorities', 'dates', 'quantities', 'rejected'):
+        assert np.array_equal(getattr(batch, column), getattr(json_batch, column))
+
+    # the rank cached by the batch is the one Order computes from its fields
+    for order in batch.orders():
+        assert order.get_rank() == Order(order.o_id, order.priority, order.o_date, order.quantity).get_rank()
+
+def test_invalid_orders_are_flagged():
+    payload = {'size': 4, 'data': [
+        {'id': 1, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1},
+        {'id': 2, 'priority': 'X', 'date': '2021-10-19', 'quantity': 1},
+        {'id': 3, 'priority': 'L', 'date': 'yesterday', 'quantity': 1},
+        {'id': 4, 'priority': 'M', 'date': '2021-10-19', 'quantity': 70000}  # does not fit in a uint16
+    ]}
+
+    body = columnar.encode(payload)
+    batch, meta = OrderBatch.from_columns(body)
+    valid, rejections = batch.validate()
+
+    assert meta == {'size': 4}
+    assert valid.tolist() == [True, False, False, False]
+    assert rejections == [
+        {'id': 2, 'errors': ['PriorityError']},
+        {'id': 3, 'errors': ['ValueError (date)']},
+        {'id': 4, 'errors': ['ValueError (quantity)']}
+    ]
+
+def test_empty_page():
+    batch, meta = OrderBatch.from_columns(columnar.encode({'size': 0, 'data': [], 'has_more': False}))
+
+    assert len(batch) == 0
+    assert meta == {'size': 0, 'has_more': False}
+
+def test_columns_are_aligned():
+    body = columnar.encode({'size': 1, 'data': [{'id': 1, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1}]})
+    header_length, = struct.unpack_from('<I', body, 4)
+
+    assert (8 + header_length) % 8 == 0
+
+def test_ids_too_big_fall_back_to_json(app, client):
+    app.extensions['ds3500_store'].add({'id': 2 ** 63, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1})  # the API rejects it, a store may not
+
+    with pytest.raises(ValueError):
+        columnar.encode({'size': 1, 'data': [{'id': 2 ** 63, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1}]})
+
+    res = client.get('/ds3500/api/v1/orders', query_string = {'limit': 500}, headers = COLUMNAR)
+
+    assert res.mimetype == 'application/json'
+    assert res.get_json()['data'][-1]['id'] == 2 ** 63
+
+@pytest.mark.parametrize('accept, mimetype', [
+    (None, columnar.JSON_MIMETYPE),
+    ('*/*', columnar.JSON_MIMETYPE),
+    (columnar.MIMETYPE, columnar.MIMETYPE),
+    ('{}, application/json;q=0.5'.format(columnar.MIMETYPE), columnar.MIMETYPE),
+    ('{};q=0.5, application/json'.format(columnar.MIMETYPE), columnar.JSON_MIMETYPE),
+    ('{};q=0'.format(columnar.MIMETYPE), columnar.JSON_MIMETYPE)
+])
+def test_negotiate(accept, mimetype):
+    assert columnar.negotiate(accept) == mimetype
+
+def corrupt(body, header) -> bytes:
+    """Replace the header of a columnar body"""
+
+    header = json.dumps(header).encode()
+
+    return body[:4] + struct.pack('<I', len(header)) + header + body[8 + struct.unpack_from('<I', body, 4)[0]:]
+
+@pytest.mark.parametrize('mangle', [
+    lambda body: b'JSON' + body[4:],
+    lambda body: body[:6],
+    lambda body: body[:-1],
+    lambda body: corrupt(body, {'size': 1, 'columns': [['id', '|O'], ['priority', '|u1'], ['date', '<i4'], ['quantity', '<u2']]}),
+    lambda body: corrupt(body, {'size': 1, 'columns': [['id', '<i8'], ['priority', '|u1'], ['date', '<i4']]}),
+    lambda body: corrupt(body, {'columns': []}),
+    lambda body: corrupt(body, {'size': 10 ** 9, 'columns': [['id', '<i8'], ['priority', '|u1'], ['date', '<i4'], ['quantity', '<u2']]}),
+    lambda body: corrupt(body, [])
+])
+def test_corrupt_bodies_raise_value_error(mangle):
+    body = columnar.encode({'size': 1, 'data': [{'id': 1, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1}]})
+
+    with pytest.raises(ValueError):
+        OrderBatch.from_columns(mangle(body))
+
+def test_dates_past_year_9999_are_flagged():
+    body = columnar.encode({'size': 1, 'data': [{'id': 1, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1}]})
+    header_length, = struct.unpack_from('<I', body, 4)
+    date_offset = 8 + header_length + 8 + 1  # after the id and priority columns
+    body = body[:date_offset] + struct.pack('<i', datetime.max.toordinal() + 1) + body[date_offset + 4:]
+
+    batch, _ = OrderBatch.from_columns(body)
+
+    assert batch.validate()[1] == [{'id': 1, 'errors': ['ValueError (date)']}]
@@ -0,0 +1,116 @@
+"""Compression of API responses negotiated with the Accept-Encoding header"""
+
+import gzip
+import pytest
+import zlib
+
+from conftest import API_KEY
+from full_api import create_app
+from response_compression import compress, compress_stream, Compression, ENCODINGS, negotiate, open_compression, parse_quality
+
+
+def decompress(body, encoding) -> bytes:
+    """Decompress a body in a zlib based encoding"""
+
+    return gzip.decompress(body) if encoding == 'gzip' else zlib.decompress(body)
+
+@pytest.mark.parametrize('accept_encoding, encoding', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('br', None),
+    ('gzip', 'gzip'),
+    ('deflate', 'deflate'),
+    ('deflate, gzip', 'gzip'),  # equal q, the server's order wins
+    ('gzip;q=0.5, deflate', 'deflate'),
+    ('GZIP', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=x', None),
+    ('*', ENCODINGS[0]),
+    ('*;q=0.1, deflate;q=0.5', 'deflate')
+])
+def test_negotiate(accept_encoding, encoding):
+    assert negotiate(accept_encoding) == encoding
+
+def test_parse_quality():
+    assert parse_quality(None) == {}
+    assert parse_quality('GZIP;q=0.5, br ; level=1 ; q=0, *;q=x, ,') == {'gzip': 0.5, 'br': 0.0, '*': 0.0}
+    assert parse_quality('application/json;charset=utf-8') == {'application/json': 1.0}
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_compress_round_trip(encoding):
+    body = b'{"id": 1, "priority": "H"}\n' * 100
+
+    assert decompress(compress(body, encoding), encoding) == body
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_compress_stream_flushes_every_chunk(encoding):
+    chunks = ['{{"id": {}}}\n'.format(i) * 50 for i in range(5)]
+    decompressor = zlib.decompressobj(31 if encoding == 'gzip' else 15)
+    compressed = list(compress_stream(iter(chunks), encoding))
+
+    for chunk, data in zip(chunks, compressed):
+        assert decompressor.decompress(data) == chunk.encode()  # each chunk decodes as it arrives
+
+    assert decompressor.decompress(b''.join(compressed[len(chunks):])) + decompressor.flush() == b''
+    assert decompressor.eof
+
+def test_min_size():
+    compression = Compression(min_size = 100)
+
+    assert compression.choose('gzip', 99) is None
+    assert compression.choose('gzip', 100) == 'gzip'
+    assert compression.choose('gzip') == 'gzip'  # streamed
+    assert Compression(None).choose('gzip', 10 ** 6) is None
+
+def test_open_compression():
+    assert open_compression(None).min_size == 1024
+    assert open_compression('off').enabled() is False
+    assert open_compression('0').choose('gzip', 1) == 'gzip'
+
+    with pytest.raises(ValueError):
+        open_compression('big')
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_cached_response_is_compressed(client, encoding):
+    plain = client.get('/ds3500/api/v1/orders')
+    res = client.get('/ds3500/api/v1/orders', headers = {'Accept-Encoding': encoding})
+
+    assert res.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in res.headers['Vary']
+    assert decompress(res.data, encoding) == plain.data
+    assert res.headers['ETag'] != plain.headers['ETag']  # every representation has its own ETag
+
+    again = client.get('/ds3500/api/v1/orders', headers = {'Accept-Encoding': encoding, 'If-None-Match': res.headers['ETag']})
+
+    assert again.status_code == 304
+
+def test_small_responses_are_sent_as_is(client):
+    res = client.get('/ds3500/api/v1/order', query_string = {'id': 1}, headers = {'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in res.headers
+    assert res.get_json()['data'][0]['id'] == 1
+    assert 'Accept-Encoding' in res.headers['Vary']
+
+def test_uncached_responses_are_compressed(client):
+    rows = [{'id': i, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1} for i in range(100, 200)]
+    res = client.post('/ds3500/api/v2/add/bulk', json = rows, headers = {'x-api-key': API_KEY, 'Accept-Encoding': 'gzip'})
+
+    assert res.status_code == 201
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert b'"added":100' in gzip.decompress(res.data).replace(b' ', b'')
+
+def test_export_is_compressed_as_a_stream(client):
+    plain = client.get('/ds3500/api/v1/orders/export').data
+    res = client.get('/ds3500/api/v1/orders/export', headers = {'Accept-Encoding': 'gzip'})
+
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(res.data) == plain
+    assert len(plain.splitlines()) == 20
+
+def test_compression_off():
+    client = create_app(compression = Compression(None)).test_client()
+    res = client.get('/ds3500/api/v1/orders', headers = {'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in res.headers
+    assert 'Accept-Encoding' not in res.headers.get('Vary', '')
@@ -0,0 +1,134 @@
+"""Claim/ack semantics of the concurrent priority queue"""
+
+import concurrent_queue
+import pickle
+import pytest
+import threading
+
+from concurrent_queue import ConcurrentPriorityQueue
+
+
+class FakeClock():
+    """Stands in for the time module of concurrent_queue, so the tests control claim expiry"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(concurrent_queue, 'time', clock)
+
+    return clock
+
+def test_claim_then_ack(clock):
+    pq = ConcurrentPriorityQueue(visibility_timeout = 10)
+    pq.enqueue_many([3, 1, 2])
+
+    status, claim = pq.claim(timeout = 0)
+
+    assert status == 1 and claim.item == 1
+    assert (pq.size(), pq.in_flight()) == (2, 1)
+    assert pq.ack(claim.claim_id)
+    assert not pq.ack(claim.claim_id)  # only once
+
+    clock.now += 60
+    assert (pq.size(), pq.in_flight()) == (2, 0)  # acked, so it does not come back
+
+def test_expired_claim_is_put_back(clock):
+    pq = ConcurrentPriorityQueue(visibility_timeout = 10)
+    pq.enqueue_many([1, 2])
+
+    _, claim = pq.claim(timeout = 0)
+
+    clock.now += 9.9
+    assert pq.items() == [2]
+
+    clock.now += 0.1
+    assert pq.items() == [1, 2]  # expired, so it is first again
+    assert pq.in_flight() == 0
+    assert not pq.ack(claim.claim_id)  # too late, another worker may have it
+
+    _, again = pq.claim(timeout = 0)
+    assert again.item == 1 and again.claim_id != claim.claim_id
+
+def test_every_public_method_puts_back_expired_claims(clock):
+    pq = ConcurrentPriorityQueue(visibility_timeout = 1)
+
+    for read in (pq.size, pq.is_empty, pq.items, lambda: pq.dequeue(timeout = 0)):
+        pq.clear()
+        pq.enqueue(5)
+        pq.claim(timeout = 0)
+        clock.now += 1
+
+        assert read() in (1, False, [5], (1, 5))
+
+def test_nack_puts_back_at_once(clock):
+    pq = ConcurrentPriorityQueue()
+    pq.enqueue_many([1, 2])
+
+    claims = pq.claim_many(5, timeout = 0)
+
+    assert [c.item for c in claims] == [1, 2]
+    assert pq.is_empty()
+    assert pq.nack(claims[0].claim_id)
+    assert not pq.nack(claims[0].claim_id)
+    assert pq.items() == [1]
+
+def test_empty_queue_times_out(clock):
+    pq = ConcurrentPriorityQueue()
+
+    assert pq.claim(timeout = 0) == (0, 'Timeout - PriorityQueue is empty')
+    assert pq.claim_many(3, timeout = 0) == []
+    assert pq.dequeue() == (0, 'Underflow - PriorityQueue is empty')
+
+def test_waiting_worker_gets_an_expired_claim():
+    pq = ConcurrentPriorityQueue(visibility_timeout = 0.05)
+    pq.enqueue('order')
+    pq.claim(timeout = 0)  # this worker dies without acking
+
+    status, claim = pq.claim(timeout = 5)  # wakes up when the claim expires
+
+    assert status == 1 and claim.item == 'order'
+
+def test_workers_process_every_order_once():
+    pq = ConcurrentPriorityQueue()
+    pq.enqueue_many(range(1000))
+    done, lock = [], threading.Lock()
+
+    def worker():
+        while True:
+            claims = pq.claim_many(16, timeout = 0)
+
+            if len(claims) == 0:
+                return
+
+            for claim in claims:
+                with lock:
+                    done.append(claim.item)
+
+                assert pq.ack(claim.claim_id)
+
+    threads = [threading.Thread(target = worker) for _ in range(4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert sorted(done) == list(range(1000))
+    assert pq.in_flight() == 0
+
+def test_claim_pickles_without_its_entry():
+    pq = ConcurrentPriorityQueue()
+    pq.enqueue('order')
+
+    _, claim = pq.claim(timeout = 0)
+    copy = pickle.loads(pickle.dumps(claim))  # as sent to a worker process
+
+    assert (copy.claim_id, copy.item, copy.deadline) == (claim.claim_id, 'order', claim.deadline)
+    assert pq.ack(copy.claim_id)
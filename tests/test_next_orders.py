@@ -0,0 +1,44 @@
+"""The next orders to process (/orders/next) are served in the same order as the client's priority queue"""
+
+import pytest
+
+from conftest import API_KEY
+from full_api import create_app
+from order import Order
+from order_manager import add_to_queue
+from priority_queue import PriorityQueue
+
+
+def orders() -> list:
+    """Orders with ties on every part of the rank, so each part decides some comparisons"""
+
+    rows = []
+
+    for i in range(1, 121):
+        rows.append({'id': 1000 - 7 * i if i % 2 else -i, 'priority': 'HML'[i % 3], 'date': '2021-10-{:02d}'.format(18 + i % 4), 'quantity': i % 5 + 1})
+
+    rows.append({'id': 5000, 'priority': 'H', 'date': '20211018', 'quantity': 9})  # normalised to 2021-10-18 by the API
+
+    return rows
+
+@pytest.mark.parametrize('store_url', ['memory', 'sqlite'])
+def test_next_orders_match_the_client_queue(tmp_path, store_url):
+    app = create_app('sqlite:///{}'.format(tmp_path / 'orders.db') if store_url == 'sqlite' else store_url)
+    client = app.test_client()
+
+    assert client.post('/ds3500/api/v2/add/bulk', json = orders(), headers = {'x-api-key': API_KEY}).get_json()['rejected'] == 0
+
+    stored = client.get('/ds3500/api/v1/orders', query_string = {'limit': 500}).get_json()['data']
+    next_orders = client.get('/ds3500/api/v1/orders/next', query_string = {'n': 500}).get_json()['data']
+
+    pq = add_to_queue(stored, PriorityQueue(key = Order.get_rank))
+    queue_ids = []
+
+    while not pq.is_empty():
+        queue_ids.append(pq.dequeue()[1].o_id)
+
+    assert len(queue_ids) == len(stored) == 141  # the 20 seeded orders too
+    assert [o['id'] for o in next_orders] == queue_ids
+
+    first = client.get('/ds3500/api/v1/orders/next', query_string = {'n': 3}).get_json()['data']
+    assert [o['id'] for o in first] == queue_ids[: 3]
@@ -0,0 +1,79 @@
+"""Validation and ranking of Order objects"""
+
+import functools
+import itertools
+import pytest
+
+from order import Order
+from order_manager import compare_orders
+
+
+def validated(*fields) -> Order:
+    """Build and validate an order"""
+
+    order = Order(*fields)
+    assert order.validate()
+
+    return order
+
+ORDERS = [
+    (1, 'M', '2021-10-20', 5),
+    (2, 'H', '2021-10-20', 5),
+    (3, 'H', '2021-10-19T23:00', 5),
+    (4, 'H', '2021-10-19T01:00', 5),
+    (5, 'H', '2021-10-19T01:00', 9),
+    (6, 'L', '2021-10-18', 100),
+    (7, 'H', '2021-10-19T01:00', 9),
+    (8, 'M', '2021-10-20T00:00:00.000001', 5),
+    (9, 'H', '2021-10-19', 0)
+]
+
+def test_rank_matches_compare_orders():
+    orders = [validated(*fields) for fields in ORDERS]
+
+    for ord_1, ord_2 in itertools.permutations(orders, 2):
+        assert (ord_1 < ord_2) == (compare_orders(ord_1, ord_2) == 1)
+        assert (ord_1.get_rank() < ord_2.get_rank()) == (ord_1 < ord_2)
+
+    by_compare = sorted(orders, key = functools.cmp_to_key(lambda ord_1, ord_2: -1 if compare_orders(ord_1, ord_2) == 1 else 1))
+
+    assert [o.o_id for o in sorted(orders)] == [o.o_id for o in by_compare] == [9, 5, 7, 4, 3, 2, 1, 8, 6]
+
+def test_time_of_day_breaks_ties():
+    late, early = validated(1, 'H', '2021-10-19T23:00', 5), validated(2, 'H', '2021-10-19T01:00', 5)
+
+    assert early < late
+    assert compare_orders(late, early) == 2
+
+def test_rank_is_cached_and_reset_by_set_date():
+    order = validated(1, 'H', '2021-10-19', 5)
+    rank = order.get_rank()
+
+    assert order.get_rank() is rank
+
+    order.set_date(order.o_date.replace(day = 18))
+
+    assert order.get_rank() < rank
+
+def test_unvalidated_orders_are_ranked_on_first_use():
+    assert Order(1, 'H', '2021-10-19', 5) < Order(2, 'H', '2021-10-19', 5)
+
+@pytest.mark.parametrize('fields', [
+    (1, 'X', '2021-10-19', 5),
+    (1, 'H', 'yesterday', 5),
+    (1, 'H', '2021-10-19', '5'),
+    (1, 'H', '2021-10-19', None),
+    (1, 'H', '2021-10-19', True),
+    (1, 'H', '2021-10-19', 2.5),
+    (1, 'H', '2021-10-19', -1),
+    (1, 'H', '2021-10-19', 2 ** 16),
+    ('1', 'H', '2021-10-19', 5),
+    (2 ** 63, 'H', '2021-10-19', 5)
+])
+def test_invalid_orders(fields, capsys):
+    assert Order(*fields).validate() is False  # never raises
+    assert 'did not add to PriorityQueue' in capsys.readouterr().out
+
+def test_invalid_fields_cannot_be_ranked():
+    with pytest.raises(ValueError):
+        Order(1, 'H', '2021-10-19', '5').get_rank()
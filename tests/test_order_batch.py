@@ -0,0 +1,66 @@
+"""Validation of API pages as a columnar OrderBatch, the client's main ingest path"""
+
+from datetime import datetime
+from order import Order
+from order_batch import OrderBatch
+from order_manager import add_to_queue
+from priority_queue import PriorityQueue
+
+
+def drain(pq) -> list:
+    """Dequeue every order, returning their IDs"""
+
+    ids = []
+
+    while not pq.is_empty():
+        ids.append(pq.dequeue()[1].o_id)
+
+    return ids
+
+def test_time_of_day_is_kept():
+    data = [
+        {'id': 1, 'priority': 'H', 'date': '2021-10-19T23:00', 'quantity': 5},
+        {'id': 2, 'priority': 'H', 'date': '2021-10-19T01:00', 'quantity': 5},
+        {'id': 3, 'priority': 'H', 'date': '2021-10-19', 'quantity': 5}
+    ]
+
+    batch = OrderBatch.from_records(data)
+
+    assert batch[0].o_date == datetime(2021, 10, 19, 23)
+    assert drain(add_to_queue(data, PriorityQueue(key = Order.get_rank))) == [3, 2, 1]
+
+def test_batch_rank_matches_order_rank():
+    data = [{'id': 7, 'priority': 'M', 'date': '2021-10-20T12:34:56.789', 'quantity': 42}]
+    order = Order(7, 'M', '2021-10-20T12:34:56.789', 42)
+
+    assert order.validate()
+    assert OrderBatch.from_records(data)[0].get_rank() == order.get_rank()
+
+def test_values_that_are_not_integers_are_flagged():
+    data = [
+        {'id': 1, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1.9},
+        {'id': 2.7, 'priority': 'H', 'date': '2021-10-19', 'quantity': 5},
+        {'id': True, 'priority': 'H', 'date': '2021-10-19', 'quantity': True},
+        {'id': '4', 'priority': 'H', 'date': '2021-10-19', 'quantity': '5'},
+        {'id': 2 ** 63, 'priority': 'H', 'date': '2021-10-19', 'quantity': 5},
+        {'id': 6, 'priority': 'H', 'date': '2021-10-19', 'quantity': 5}
+    ]
+
+    batch = OrderBatch.from_records(data)
+
+    assert batch.rejected.tolist() == [
+        OrderBatch.REJECT_QUANTITY,
+        OrderBatch.REJECT_ID,
+        OrderBatch.REJECT_ID | OrderBatch.REJECT_QUANTITY,
+        OrderBatch.REJECT_ID | OrderBatch.REJECT_QUANTITY,
+        OrderBatch.REJECT_ID,
+        0
+    ]
+    assert [r['id'] for r in batch.validate()[1]] == [1, 2.7, True, '4', 2 ** 63]
+
+def test_rows_that_are_not_orders_are_flagged():
+    batch = OrderBatch.from_records([None, ['x'], {'id': 3, 'priority': 'L', 'date': '2021-10-19', 'quantity': 1}])
+    every_flag = OrderBatch.REJECT_PRIORITY | OrderBatch.REJECT_DATE | OrderBatch.REJECT_QUANTITY | OrderBatch.REJECT_ID
+
+    assert batch.rejected.tolist() == [every_flag, every_flag, 0]
+    assert [o.o_id for o in batch.orders(batch.valid_mask())] == [3]
@@ -0,0 +1,114 @@
+"""Cursor pagination of the orders endpoints"""
+
+import orders_service
+import pytest
+
+from api_errors import RequestError
+from conftest import API_KEY
+from order_store import open_store
+
+
+def walk(client, path, headers = {}, **params):
+    """Follow the next_cursor of every page, returning the pages"""
+
+    pages = []
+
+    while True:
+        res = client.get(path, query_string = params, headers = headers)
+        assert res.status_code == 200
+
+        pages.append(res.get_json())
+
+        if not pages[-1]['has_more']:
+            return pages
+
+        params['cursor'] = pages[-1]['next_cursor']
+
+def test_cursor_walks_every_order_once(client):
+    pages = walk(client, '/ds3500/api/v1/orders', limit = 7)
+
+    assert [page['size'] for page in pages] == [7, 7, 6]
+    assert [o['id'] for page in pages for o in page['data']] == list(range(1, 21))
+    assert pages[-1]['next_cursor'] is None
+
+def test_exact_last_page_has_no_more(client):
+    pages = walk(client, '/ds3500/api/v1/orders', limit = 10)
+
+    assert [page['size'] for page in pages] == [10, 10]
+
+def test_v2_orders_are_paginated(client):
+    pages = walk(client, '/ds3500/api/v2/orders', headers = {'x-api-key': API_KEY}, limit = 15)
+
+    assert [o['id'] for page in pages for o in page['data']] == list(range(1, 21))
+
+def test_cursor_with_priority_filter(client):
+    expected = [o['id'] for o in client.get('/ds3500/api/v1/orders', query_string = {'limit': 500}).get_json()['data'] if o['priority'] == 'M']
+    pages = walk(client, '/ds3500/api/v1/orders/priority', priority = 'M', limit = 2)
+
+    assert [o['id'] for page in pages for o in page['data']] == expected
+
+def test_orders_added_after_the_cursor_show_up(client):
+    first = client.get('/ds3500/api/v1/orders', query_string = {'limit': 20}).get_json()
+    assert not first['has_more']
+
+    res = client.post('/ds3500/api/v2/add', data = {'id': 21, 'priority': 'H', 'date': '2021-10-19', 'quantity': 1}, headers = {'x-api-key': API_KEY})
+    assert res.status_code == 201
+
+    # the cursor of the last page is the last ID, so a client can resume from it
+    cursor = orders_service.encode_cursor(first['data'][-1]['id'])
+    page = client.get('/ds3500/api/v1/orders', query_string = {'cursor': cursor}).get_json()
+
+    assert [o['id'] for o in page['data']] == [21]
+
+@pytest.mark.parametrize('params', [{'cursor': '!!!'}, {'limit': 0}, {'limit': 501}, {'limit': 'x'}])
+def test_invalid_page_args(client, params):
+    res = client.get('/ds3500/api/v1/orders', query_string = params)
+
+    assert res.status_code == 400
+    assert res.get_json()['error']
+
+def test_cursor_round_trip():
+    assert orders_service.decode_cursor(orders_service.encode_cursor(12345)) == 12345
+    assert orders_service.encode_cursor(None) is None
+
+    with pytest.raises(RequestError):
+        orders_service.get_page_args({'cursor': 'bm90IGFuIGlk'})  # base64 of 'not an id'
+
+@pytest.mark.parametrize('store_url', ['memory', 'sqlite'])
+def test_store_pages_match(tmp_path, store_url):
+    store = open_store('sqlite:///{}'.format(tmp_path / 'orders.db') if store_url == 'sqlite' else store_url)
+    store.add_many([{'id': i, 'priority': 'HML'[i % 3], 'date': '2021-10-19', 'quantity': i} for i in range(1, 12)])
+
+    ids, after_id = [], None
+
+    while True:
+        orders, after_id = store.page(after_id, 4, priority = 'H')
+        ids.extend(o['id'] for o in orders)
+
+        if after_id is None:
+            break
+
+    assert ids == [3, 6, 9]
+
+def test_bulk_adds_merge_into_every_index():
+    store = open_store('memory')
+    batches = [range(100, 200, 2), range(1, 300, 3), range(-50, 0), range(301, 400)]  # after, between and before the stored IDs
+
+    for batch in batches:
+        store.add_many([{'id': i, 'priority': 'HML'[i % 3], 'date': '2021-10-{}'.format(19 + i % 2), 'quantity': i % 7 + 1} for i in batch if store.get(i) is None])
+
+    orders = sorted(store.changes(0, len(store))[0], key = lambda o: o['id'])
+
+    for priority, o_date in [(None, None), ('H', None), (None, '2021-10-20'), ('M', '2021-10-19')]:
+        pages, after_id = [], None
+
+        while True:
+            page, after_id = store.page(after_id, 7, priority = priority, date = o_date)
+            pages.extend(page)
+
+            if after_id is None:
+                break
+
+        assert pages == [o for o in orders if priority in (None, o['priority']) and o_date in (None, o['date'])]
+
+    assert store.top(len(store)) == sorted(orders, key = lambda o: ('HML'.index(o['priority']), o['date'], -o['quantity'], o['id']))
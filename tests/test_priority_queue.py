@@ -0,0 +1,104 @@
+"""Ordering of the heap based priority queue, with a comparator or a sort key"""
+
+import heapq
+import pytest
+
+from order import Order
+from order_manager import compare_orders
+from priority_queue import PriorityQueue
+
+
+class Job():
+    """An item that only compares by priority, so jobs of the same priority tie"""
+
+    def __init__(self, priority, name) -> None:
+        self.priority = priority
+        self.name = name
+
+    def __lt__(self, other) -> bool:
+        return self.priority < other.priority
+
+def by_priority(job_1, job_2) -> int:
+    """Comparator, 1 if job_1 goes first"""
+
+    return 1 if job_1.priority < job_2.priority else 2
+
+def drain(pq) -> list:
+    """Dequeue every object"""
+
+    items = []
+
+    while not pq.is_empty():
+        items.append(pq.dequeue()[1])
+
+    return items
+
+JOBS = [(2, 'a'), (1, 'b'), (2, 'c'), (1, 'd'), (2, 'e'), (1, 'f')]
+FIFO = ['b', 'd', 'f', 'a', 'c', 'e']  # by priority, then in the order they were enqueued
+
+def test_ties_are_fifo_without_a_key():
+    pq = PriorityQueue()
+
+    for priority, name in JOBS:
+        pq.enqueue(Job(priority, name))
+
+    assert [job.name for job in drain(pq)] == FIFO
+
+def test_ties_are_fifo_with_a_comparator():
+    pq = PriorityQueue()
+
+    for priority, name in JOBS:
+        pq.enqueue(Job(priority, name), by_priority)
+
+    assert [job.name for job in drain(pq)] == FIFO
+
+def test_ties_are_fifo_with_a_key():
+    pq = PriorityQueue(key = lambda job: job.priority)
+    pq.enqueue_many(Job(priority, name) for priority, name in JOBS)
+
+    assert [job.name for job in drain(pq)] == FIFO
+
+def test_comparator_and_key_give_the_same_order():
+    orders = [
+        Order(1, 'L', '2021-10-19', 5),
+        Order(2, 'H', '2021-10-20', 5),
+        Order(3, 'H', '2021-10-19', 1),
+        Order(4, 'H', '2021-10-19', 9),
+        Order(5, 'M', '2021-10-18', 5),
+        Order(6, 'H', '2021-10-19', 9)
+    ]
+
+    for order in orders:
+        assert order.validate()
+
+    by_comparator, by_key = PriorityQueue(), PriorityQueue(key = Order.get_rank)
+
+    for order in orders:
+        by_comparator.enqueue(order, compare_orders)
+        by_key.enqueue(order)
+
+    assert [o.o_id for o in drain(by_comparator)] == [o.o_id for o in drain(by_key)] == [4, 6, 3, 2, 5, 1]
+
+@pytest.mark.parametrize('batch_size, heapified', [(10, False), (200, True)])
+def test_enqueue_many_heapifies_big_batches(monkeypatch, batch_size, heapified):
+    pq = PriorityQueue()
+    pq.enqueue_many(range(1000, 2000))  # 1000 objects, so a batch of k is heapified if k * 10 >= 1000
+
+    calls = {'heapify': 0, 'heappush': 0}
+
+    def spy(name):
+        original = getattr(heapq, name)
+
+        def call(*args):
+            calls[name] += 1
+            return original(*args)
+
+        return call
+
+    monkeypatch.setattr(heapq, 'heapify', spy('heapify'))
+    monkeypatch.setattr(heapq, 'heappush', spy('heappush'))
+
+    pq.enqueue_many(range(batch_size))
+
+    assert calls == ({'heapify': 1, 'heappush': 0} if heapified else {'heapify': 0, 'heappush': batch_size})
+    assert drain(pq) == list(range(batch_size)) + list(range(1000, 2000))
@@ -0,0 +1,116 @@
+"""Token bucket rate limiting of the v2 API keys"""
+
+import pytest
+import rate_limit
+
+from api_errors import RateLimitError
+from conftest import API_KEY
+from full_api import create_app
+from rate_limit import MemoryBackend, open_rate_limiter, parse_limit, RateLimiter, SQLiteBackend
+
+
+class FakeClock():
+    """Stands in for the time module of rate_limit, so the tests control the refill"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+
+    return clock
+
+@pytest.fixture(params = ['memory', 'sqlite'])
+def backend(request, tmp_path):
+    return MemoryBackend() if request.param == 'memory' else SQLiteBackend(str(tmp_path / 'limits.db'))
+
+def test_burst_then_refill(clock, backend):
+    assert [backend.take('k', 2.0, 3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.take('k', 2.0, 3) == pytest.approx(0.5)  # empty, a token every 0.5 s
+
+    clock.sleep(0.25)
+    assert backend.take('k', 2.0, 3) == pytest.approx(0.25)  # half a token so far, a rejected request costs nothing
+
+    clock.sleep(0.25)
+    assert backend.take('k', 2.0, 3) == 0.0
+    assert backend.take('k', 2.0, 3) > 0
+
+def test_refill_is_capped_at_burst(clock, backend):
+    for _ in range(3):
+        backend.take('k', 1.0, 3)
+
+    clock.sleep(3600)
+
+    assert [backend.take('k', 1.0, 3) for _ in range(4)][-1] > 0  # only 3 tokens, not 3600
+
+def test_keys_have_their_own_buckets(clock, backend):
+    assert backend.take('a', 1.0, 1) == 0.0
+    assert backend.take('a', 1.0, 1) > 0
+    assert backend.take('b', 1.0, 1) == 0.0
+
+def test_sqlite_buckets_are_shared(clock, tmp_path):
+    path = str(tmp_path / 'limits.db')
+    worker_1, worker_2 = SQLiteBackend(path), SQLiteBackend(path)
+
+    assert worker_1.take('k', 1.0, 2) == 0.0
+    assert worker_2.take('k', 1.0, 2) == 0.0
+    assert worker_1.take('k', 1.0, 2) > 0
+
+    clock.sleep(1)
+    assert worker_2.take('k', 1.0, 2) == 0.0
+
+def test_limiter_retry_after(clock):
+    limiter = RateLimiter(rate = 0.4, burst = 1, limits = {'vip': (100.0, 100)})
+    limiter.check('k')
+
+    with pytest.raises(RateLimitError) as e:
+        limiter.check('k')
+
+    assert e.value.status_code == 429
+    assert e.value.retry_after == 3  # 2.5 s rounded up
+
+    for _ in range(100):
+        limiter.check('vip')
+
+def test_no_limit_by_default(clock):
+    limiter = RateLimiter()
+
+    for _ in range(1000):
+        limiter.check('k')
+
+@pytest.mark.parametrize('limit', ['1/0', '-1/5', 'x/1', '10'])
+def test_invalid_limits(limit):
+    with pytest.raises(ValueError):
+        parse_limit(limit)
+
+def test_open_rate_limiter():
+    limiter = open_rate_limiter(None, '10/20', '12345=100/200, 67890=0/0')
+
+    assert (limiter.rate, limiter.burst) == (10.0, 20)
+    assert limiter.limits == {'12345': (100.0, 200), '67890': (0.0, 0)}
+
+def test_app_sends_429_and_retry_after(clock):
+    client = create_app(rate_limiter = RateLimiter(rate = 1.0, burst = 2)).test_client()
+    headers = {'x-api-key': API_KEY}
+
+    assert [client.get('/ds3500/api/v2/orders', headers = headers).status_code for _ in range(3)] == [200, 200, 429]
+
+    res = client.get('/ds3500/api/v2/orders', headers = headers)
+    assert res.headers['Retry-After'] == '1'
+    assert res.get_json()['message'] == 'Too many requests'
+
+    assert client.get('/ds3500/api/v1/orders').status_code == 200  # v1 is not limited
+
+    clock.sleep(1)
+    assert client.get('/ds3500/api/v2/orders', headers = headers).status_code == 200
@@ -0,0 +1,112 @@
+"""ETags and conditional GETs of the cached responses"""
+
+import asyncio
+import pytest
+
+from conftest import API_KEY
+from response_cache import etag_matches, ResponseCache
+
+
+def add_order(client, o_id):
+    """Add an order through the v2 API"""
+
+    res = client.post('/ds3500/api/v2/add', data = {'id': o_id, 'priority': 'L', 'date': '2021-10-20', 'quantity': 5}, headers = {'x-api-key': API_KEY})
+    assert res.status_code == 201
+
+def asgi_get(path, headers = {}) -> tuple:
+    """GET a path from the ASGI app, returning the status code, the headers and the body"""
+
+    import async_api
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+    asyncio.run(async_api.app(scope, receive, send))
+
+    return messages[0]['status'], {name.decode(): value.decode() for name, value in messages[0]['headers']}, b''.join(m.get('body', b'') for m in messages[1:])
+
+def test_etag_and_304(client):
+    res = client.get('/ds3500/api/v1/orders')
+    etag = res.headers['ETag']
+
+    assert res.status_code == 200 and etag
+
+    res = client.get('/ds3500/api/v1/orders', headers = {'If-None-Match': etag})
+
+    assert res.status_code == 304
+    assert res.data == b''
+    assert res.headers['ETag'] == etag
+
+def test_if_none_match_lists_and_wildcard(client):
+    etag = client.get('/ds3500/api/v1/order', query_string = {'id': 3}).headers['ETag']
+
+    assert client.get('/ds3500/api/v1/order', query_string = {'id': 3}, headers = {'If-None-Match': '"other", ' + etag}).status_code == 304
+    assert client.get('/ds3500/api/v1/order', query_string = {'id': 3}, headers = {'If-None-Match': '*'}).status_code == 304
+    assert client.get('/ds3500/api/v1/order', query_string = {'id': 3}, headers = {'If-None-Match': '"other"'}).status_code == 200
+
+def test_etag_changes_when_orders_are_added(client):
+    etag = client.get('/ds3500/api/v1/orders/next', query_string = {'n': 500}).headers['ETag']
+
+    add_order(client, 21)
+    res = client.get('/ds3500/api/v1/orders/next', query_string = {'n': 500}, headers = {'If-None-Match': etag})
+
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+    assert 21 in [o['id'] for o in res.get_json()['data']]
+
+def test_same_query_different_etag(client):
+    page_1 = client.get('/ds3500/api/v1/orders', query_string = {'limit': 5})
+    page_2 = client.get('/ds3500/api/v1/orders', query_string = {'limit': 6})
+
+    assert page_1.headers['ETag'] != page_2.headers['ETag']
+    assert page_1.headers['ETag'] == client.get('/ds3500/api/v1/orders', query_string = {'limit': 5}).headers['ETag']
+
+def test_errors_and_204_are_not_cached(client):
+    assert client.get('/ds3500/api/v1/order', query_string = {'id': 99}).status_code == 204
+    assert 'ETag' not in client.get('/ds3500/api/v1/order', query_string = {'id': 'x'}).headers
+
+    add_order(client, 99)
+
+    assert client.get('/ds3500/api/v1/order', query_string = {'id': 99}).status_code == 200
+
+def test_cache_is_invalidated_by_version_and_bounded():
+    cache = ResponseCache(max_entries = 2)
+
+    entry = cache.put('a', 1, b'{}', 'application/json')
+    assert cache.get('a', 1) is entry
+    assert cache.get('a', 2) is None  # stale, and dropped
+    assert cache.get('a', 1) is None
+
+    cache.put('a', 1, b'a', 'application/json')
+    cache.put('b', 1, b'b', 'application/json')
+    cache.get('a', 1)  # b is now the least recently used
+    cache.put('c', 1, b'c', 'application/json')
+
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) is not None and cache.get('c', 1) is not None
+
+@pytest.mark.parametrize('if_none_match', ['{}', 'W/{}', '"other", W/{}', '*'])
+def test_both_apps_honour_weak_etags(client, if_none_match):
+    etag = client.get('/ds3500/api/v1/orders').headers['ETag']
+    res = client.get('/ds3500/api/v1/orders', headers = {'If-None-Match': if_none_match.format(etag)})
+
+    assert res.status_code == 304
+
+    status_code, headers, body = asgi_get('/ds3500/api/v1/orders')
+    assert status_code == 200 and len(body) > 0
+
+    status_code, headers, body = asgi_get('/ds3500/api/v1/orders', {'If-None-Match': if_none_match.format(headers['etag'])})
+    assert (status_code, body) == (304, b'')
+
+def test_etag_matches():
+    assert etag_matches('W/"a"', '"a"')
+    assert etag_matches(' "b" , W/"a"', '"a"')
+    assert not etag_matches('W/"b"', '"a"')
+    assert not etag_matches('a', '"a"')  # not quoted
+    assert not etag_matches(None, '"a"')